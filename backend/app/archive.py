@@ -0,0 +1,129 @@
+"""
+Movement Archive
+Move old stock movements into material_movements_archive, keeping a carry-forward per material
+
+Usage (from the backend directory, e.g. nightly from cron):
+    python -m app.archive                # archive movements older than MOVEMENT_ARCHIVE_DAYS
+    python -m app.archive --days 90
+
+Movements are moved in chunks of MOVEMENT_ARCHIVE_CHUNK_SIZE, one transaction
+per chunk: the rows are copied to the archive, their quantities are added to
+the material's carry-forward balance (material_archive_balances) and they
+are deleted from the hot table. material_movements therefore only holds
+recent history, and its indexes stay small.
+
+material_archive_balances.archived_until records that every older movement of
+the material is archived. History requests starting at or after that time
+read the hot table only; older ranges union in the archive.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.database import SessionLocal
+from app.models import MaterialArchiveBalance, MaterialMovement, MaterialMovementArchive
+
+# Load environment variables
+load_dotenv()
+
+# Movements older than this many days are archived
+MOVEMENT_ARCHIVE_DAYS = int(os.getenv("MOVEMENT_ARCHIVE_DAYS", "365"))
+# Movements moved per transaction
+MOVEMENT_ARCHIVE_CHUNK_SIZE = int(os.getenv("MOVEMENT_ARCHIVE_CHUNK_SIZE", "5000"))
+
+# Columns copied to the archive, in the same order on both tables
+ARCHIVED_COLUMNS = ("id", "material_id", "quantity", "reason", "notes", "user_id", "created_at", "txid")
+
+logger = logging.getLogger("app.archive")
+
+
+def archive_movements(db: Session, before: datetime, chunk_size: int = MOVEMENT_ARCHIVE_CHUNK_SIZE,
+                      on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Move movements created before a cutoff into the archive
+
+    Args:
+        db: Database session
+        before: Archive movements with created_at earlier than this
+        chunk_size: Movements per transaction
+        on_progress: Called with the running total after each chunk
+
+    Returns:
+        Number of archived movements
+    """
+    total = 0
+    while True:
+        # The chunk is the chunk_size lowest ids below the cutoff; new movements always sort after it
+        chunk = select(MaterialMovement.id).where(
+            MaterialMovement.created_at < before
+        ).order_by(MaterialMovement.id).limit(chunk_size).subquery()
+        last_id = db.execute(select(func.max(chunk.c.id))).scalar()
+        if last_id is None:
+            db.commit()
+            return total
+        in_chunk = (MaterialMovement.created_at < before, MaterialMovement.id <= last_id)
+
+        now = datetime.utcnow()
+        db.execute(insert(MaterialMovementArchive).from_select(
+            [*ARCHIVED_COLUMNS, "archived_at"],
+            select(*(getattr(MaterialMovement, name) for name in ARCHIVED_COLUMNS), literal(now)).where(*in_chunk),
+        ))
+
+        sums = db.query(
+            MaterialMovement.material_id, func.sum(MaterialMovement.quantity), func.count()
+        ).filter(*in_chunk).group_by(MaterialMovement.material_id).all()
+        balances = {
+            balance.material_id: balance
+            for balance in db.query(MaterialArchiveBalance).filter(
+                MaterialArchiveBalance.material_id.in_([material_id for material_id, _, _ in sums])
+            )
+        }
+        for material_id, quantity, count in sums:
+            balance = balances.get(material_id)
+            if balance is None:
+                db.add(MaterialArchiveBalance(
+                    material_id=material_id, quantity=quantity, movement_count=count, archived_until=before
+                ))
+            else:
+                balance.quantity += quantity
+                balance.movement_count += count
+                balance.archived_until = max(balance.archived_until, before)
+
+        moved = db.execute(
+            delete(MaterialMovement).where(*in_chunk).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+
+        total += moved
+        if on_progress is not None:
+            on_progress(total)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Archive old stock movements")
+    parser.add_argument("--days", type=int, default=MOVEMENT_ARCHIVE_DAYS, help="Archive movements older than this")
+    parser.add_argument("--chunk-size", type=int, default=MOVEMENT_ARCHIVE_CHUNK_SIZE, help="Movements per transaction")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    before = datetime.utcnow() - timedelta(days=args.days)
+    db = SessionLocal()
+    try:
+        archived = archive_movements(
+            db, before, args.chunk_size,
+            on_progress=lambda count: logger.info("Archived %s movements", count),
+        )
+    finally:
+        db.close()
+    print(f"✅ Archived {archived} movements created before {before:%Y-%m-%d %H:%M}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
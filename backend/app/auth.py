@@ -18,6 +18,9 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production"
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_DAYS = int(os.getenv("ACCESS_TOKEN_EXPIRE_DAYS", "30"))
 
+# Users allowed to access debug/admin features (comma-separated emails)
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
 # Security check for production
 if SECRET_KEY == "your-secret-key-change-this-in-production":
     if os.getenv("DEBUG", "True").lower() != "true":
@@ -101,3 +104,16 @@ def decode_token(token: str) -> Optional[dict]:
         return payload
     except JWTError:
         return None
+
+
+def is_admin_email(email: str) -> bool:
+    """
+    Check whether an email address belongs to an administrator
+    
+    Args:
+        email: User email address
+        
+    Returns:
+        True if the email is listed in ADMIN_EMAILS
+    """
+    return bool(email) and email.lower() in ADMIN_EMAILS
@@ -0,0 +1,417 @@
+"""
+Response Cache
+Per-company cache for read endpoints with write-through invalidation and pluggable backends
+
+Keys embed a generation counter for the company (or the user, for lists spanning all
+of a user's companies). Writes bump the counter instead of deleting keys, so stale
+entries simply become unreachable and age out through LRU eviction or their TTL.
+Generations are read before the database query runs, so a response computed while
+a write commits is stored under the old generation and never served.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+from fastapi import Request, Response
+from dotenv import load_dotenv
+from app.conditional import etag_matches
+from app.serialization import ORJSONResponse
+
+# Load environment variables
+load_dotenv()
+
+# Backend: "memory" (per process), "sqlite" (shared file, multi-worker on one host),
+# "redis" (shared server) or "none"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "./cache.sqlite3")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Separator between the stored headers and the body
+_SEPARATOR = b"\n"
+
+logger = logging.getLogger("app.cache")
+
+
+class MemoryCacheBackend:
+    """In-process LRU bounded by entry count and total bytes"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._counters = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def get_counters(self, *keys: str) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._counters.get(key, 0) for key in keys)
+
+    def incr(self, key: str) -> None:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class SQLiteCacheBackend:
+    """
+    Cache in a shared SQLite file
+
+    Lets several worker processes on one host share entries and invalidations
+    without running a cache server. Eviction is least-recently-used by access time.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._sets = 0
+        self.evictions = 0
+        # Use a throwaway connection: this may run in a master process that forks workers
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at);
+            CREATE TABLE IF NOT EXISTS cache_counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """
+        )
+        connection.close()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        connection = self._connection()
+        now = time.time()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, value, now + ttl, now),
+        )
+        self._sets += 1
+        # Trim periodically rather than on every write
+        if self._sets % 100 == 0:
+            self._trim(connection, now)
+
+    def _trim(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        excess = connection.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.max_entries
+        if excess > 0:
+            connection.execute(
+                "DELETE FROM cache_entries WHERE key IN "
+                "(SELECT key FROM cache_entries ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def get_counters(self, *keys: str) -> Tuple[int, ...]:
+        rows = dict(self._connection().execute(
+            f"SELECT key, value FROM cache_counters WHERE key IN ({','.join('?' * len(keys))})", keys
+        ).fetchall())
+        return tuple(rows.get(key, 0) for key in keys)
+
+    def incr(self, key: str) -> None:
+        self._connection().execute(
+            "INSERT INTO cache_counters (key, value) VALUES (?, 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1",
+            (key,),
+        )
+
+    def stats(self) -> dict:
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache_entries"
+        ).fetchone()
+        return {"entries": entries, "bytes": size, "evictions": self.evictions}
+
+
+class RedisCacheBackend:
+    """
+    Cache in Redis (or any client exposing get/set/mget/incr/info/dbsize, e.g. fakeredis)
+
+    Eviction is left to the server: configure maxmemory with an LRU policy.
+    Statistics come from the server, so they cover every worker sharing it.
+    """
+
+    name = "redis"
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.client.set(key, value, ex=ttl)
+
+    def get_counters(self, *keys: str) -> Tuple[int, ...]:
+        return tuple(int(value or 0) for value in self.client.mget(keys))
+
+    def incr(self, key: str) -> None:
+        self.client.incr(key)
+
+    def stats(self) -> dict:
+        try:
+            info = self.client.info()
+            entries = self.client.dbsize()
+        except Exception as exc:
+            # /health must answer while the cache server is down
+            return {"error": str(exc)}
+        return {
+            "entries": entries,
+            "bytes": info.get("used_memory", 0),
+            "evictions": info.get("evicted_keys", 0),
+            "server_hits": info.get("keyspace_hits", 0),
+            "server_misses": info.get("keyspace_misses", 0),
+        }
+
+
+class CacheEntry:
+    """A resolved cache slot for one request (generation already embedded in the key)"""
+
+    def __init__(self, cache: "ResponseCache", key: Optional[str]):
+        self.cache = cache
+        self.key = key
+
+    def response(self, request: Request) -> Optional[Response]:
+        """
+        Serve the request from the cache
+
+        Args:
+            request: Current request (If-None-Match is honoured)
+
+        Returns:
+            Cached 200 response, 304 response, or None on a miss
+        """
+        if self.key is None:
+            return None
+        value = self.cache.backend.get(self.key)
+        if value is None:
+            self.cache.misses += 1
+            return None
+        self.cache.hits += 1
+
+        etag, last_modified, body = value.split(_SEPARATOR, 2)
+        headers = {"X-Cache": "HIT"}
+        if etag:
+            headers.update({"ETag": etag.decode(), "Cache-Control": "private, no-cache"})
+            if last_modified:
+                headers["Last-Modified"] = last_modified.decode()
+            if etag_matches(request, etag.decode()):
+                return Response(status_code=304, headers=headers)
+        return ORJSONResponse(body, headers=headers)
+
+    def store(self, response: Response) -> Response:
+        """
+        Store a successful response body and its validators
+
+        Args:
+            response: Response produced on a cache miss
+
+        Returns:
+            The same response
+        """
+        if self.key is not None and response.status_code == 200:
+            value = _SEPARATOR.join([
+                response.headers.get("etag", "").encode(),
+                response.headers.get("last-modified", "").encode(),
+                response.body,
+            ])
+            self.cache.backend.set(self.key, value, self.cache.ttl)
+            self.cache.stores += 1
+            response.headers["X-Cache"] = "MISS"
+        return response
+
+
+# Invalidations collected while an outer transaction is still open (see ResponseCache.deferred)
+_deferred_invalidations: ContextVar[Optional[List[Tuple[Optional[int], int]]]] = ContextVar(
+    "deferred_invalidations", default=None
+)
+
+
+class ResponseCache:
+    """Cache facade: key construction, invalidation and hit-rate statistics"""
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def entry(self, namespace: str, user_id: int, company_id: Optional[int], params: str = "") -> CacheEntry:
+        """
+        Resolve the cache slot for a read
+
+        Args:
+            namespace: Endpoint name (e.g. "materials")
+            user_id: Current user ID
+            company_id: Company the response is limited to, or None for all of the user's companies
+            params: Remaining query parameters
+
+        Returns:
+            CacheEntry (disabled when no backend is configured or inside deferred())
+        """
+        # Inside an outer transaction a read may see uncommitted rows, and a warm entry would
+        # hide the transaction's own writes (their invalidations are still pending)
+        if self.backend is None or _deferred_invalidations.get() is not None:
+            return CacheEntry(self, None)
+        scope = f"company:{company_id}" if company_id else f"user:{user_id}"
+        (generation,) = self.backend.get_counters(f"gen:{scope}")
+        digest = hashlib.blake2b(params.encode(), digest_size=12).hexdigest()
+        return CacheEntry(self, f"resp:{namespace}:u{user_id}:{scope}:g{generation}:{digest}")
+
+    def invalidate(self, company_id: Optional[int], user_id: int) -> None:
+        """
+        Invalidate cached reads after a write to a company
+
+        Args:
+            company_id: Company whose data changed
+            user_id: Owner of the company (invalidates lists spanning all companies)
+        """
+        if self.backend is None:
+            return
+        deferred = _deferred_invalidations.get()
+        if deferred is not None:
+            deferred.append((company_id, user_id))
+            return
+        if company_id:
+            self.backend.incr(f"gen:company:{company_id}")
+        self.backend.incr(f"gen:user:{user_id}")
+        self.invalidations += 1
+
+    @contextmanager
+    def deferred(self):
+        """
+        Collect invalidations instead of applying them
+
+        Used while writes are inside an outer transaction: invalidating before
+        the commit would let a concurrent read cache the old rows under the new
+        generation. Apply the collected pairs with invalidate() after committing.
+        Reads in the same context bypass the cache entirely.
+
+        Yields:
+            List of (company_id, user_id) pairs
+        """
+        pending: List[Tuple[Optional[int], int]] = []
+        token = _deferred_invalidations.set(pending)
+        try:
+            yield pending
+        finally:
+            _deferred_invalidations.reset(token)
+
+    def stats(self) -> dict:
+        """
+        Cache statistics for this process
+
+        Returns:
+            Dictionary with backend name, hits, misses, hit rate and backend details
+        """
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": self.backend.name if self.backend is not None else "none",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+        }
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+
+def create_backend(name: str):
+    """
+    Build the configured cache backend
+
+    Args:
+        name: Backend name from CACHE_BACKEND
+
+    Returns:
+        Backend instance, or None to disable caching
+    """
+    if name == "memory":
+        return MemoryCacheBackend(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+    if name == "sqlite":
+        return SQLiteCacheBackend(CACHE_SQLITE_PATH, CACHE_MAX_ENTRIES)
+    if name == "redis":
+        try:
+            import redis
+        except ImportError:
+            # Installed by requirements.txt; a slimmer install still gets a shared cache
+            logger.warning("CACHE_BACKEND=redis but the redis package is not installed; using the sqlite cache")
+            return SQLiteCacheBackend(CACHE_SQLITE_PATH, CACHE_MAX_ENTRIES)
+
+        return RedisCacheBackend(redis.Redis.from_url(CACHE_REDIS_URL))
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
+
+
+response_cache = ResponseCache(create_backend(CACHE_BACKEND), CACHE_TTL)
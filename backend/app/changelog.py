@@ -0,0 +1,250 @@
+"""
+Change Log
+Record creates, updates and deletes of synced rows for delta sync (GET /sync)
+
+Every ORM flush that inserts, changes or deletes a company, material,
+movement, purchase or purchase item adds one change_log row per object in the
+same transaction, so the log never disagrees with the data. The row carries
+the owning user and company.
+
+Sync serves entries in (txid, id) order, txid being the writing transaction
+on PostgreSQL. Ids are handed out in insert order, not commit order, so an
+id cursor alone would skip a transaction that commits after a later one was
+served. Only entries of transactions older than every transaction still in
+progress (txid_snapshot_xmin) are served; none of those can appear behind
+the cursor later. SQLite serializes writers, so its ids already follow
+commit order and txid stays 0.
+
+Deletes done by the database (ON DELETE CASCADE) are not logged row by row:
+a company tombstone implies its materials, movements, purchases and items are
+gone, a material tombstone its movements, a purchase tombstone its items.
+
+Entries older than SYNC_RETENTION_DAYS are pruned; clients holding an older
+token must sync from scratch.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, event, func, insert, or_, text
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.database import SessionLocal
+from app.models import ChangeLog, Company, Material, MaterialMovement, Purchase, PurchaseItem
+
+# Load environment variables
+load_dotenv()
+
+# Days a sync token stays valid; older entries are pruned
+SYNC_RETENTION_DAYS = int(os.getenv("SYNC_RETENTION_DAYS", "30"))
+# Interval of the background prune
+SYNC_PRUNE_MINUTES = int(os.getenv("SYNC_PRUNE_MINUTES", "60"))
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+# Synced models and their names in the change log and the sync response
+SYNCED_ENTITIES = {
+    Company: "companies",
+    Material: "materials",
+    MaterialMovement: "movements",
+    Purchase: "purchases",
+    PurchaseItem: "purchase_items",
+}
+
+logger = logging.getLogger("app.changelog")
+
+
+def owner_of(session: Session, obj, owners: Dict[Tuple[type, int], Optional[Tuple[int, int]]]) -> Optional[Tuple[int, int]]:
+    """
+    (user_id, company_id) owning a synced object
+
+    Parents usually sit in the identity map already (ownership checks load
+    them), so this rarely queries.
+    """
+    if isinstance(obj, Company):
+        return obj.user_id, obj.id
+
+    if isinstance(obj, (Material, Purchase)):
+        parent_key = (Company, obj.company_id)
+    elif isinstance(obj, MaterialMovement):
+        parent_key = (Material, obj.material_id)
+    else:
+        parent_key = (Purchase, obj.purchase_id)
+
+    if parent_key not in owners:
+        parent = session.get(*parent_key) if parent_key[1] is not None else None
+        owners[parent_key] = owner_of(session, parent, owners) if parent is not None else None
+    return owners[parent_key]
+
+
+def changed_objects(session: Session) -> Iterable[Tuple[object, str]]:
+    """Synced objects written by the flush in progress, with their operation (call from after_flush)"""
+    for obj in session.new:
+        if type(obj) in SYNCED_ENTITIES:
+            yield obj, UPSERT
+    for obj in session.dirty:
+        if type(obj) in SYNCED_ENTITIES and session.is_modified(obj, include_collections=False):
+            yield obj, UPSERT
+    for obj in session.deleted:
+        if type(obj) in SYNCED_ENTITIES:
+            yield obj, DELETE
+
+
+@event.listens_for(Session, "after_flush")
+def record_changes(session: Session, flush_context) -> None:
+    """Add change_log rows for the synced objects written by this flush"""
+    owners: Dict[Tuple[type, int], Optional[Tuple[int, int]]] = {}
+    now = datetime.utcnow()
+    rows = []
+    for obj, operation in changed_objects(session):
+        owner = owner_of(session, obj, owners)
+        if owner is None:
+            # Parent deleted in the same flush: its tombstone covers this row
+            continue
+        user_id, company_id = owner
+        rows.append({
+            "user_id": user_id,
+            "company_id": company_id,
+            "entity": SYNCED_ENTITIES[type(obj)],
+            "entity_id": obj.id,
+            "operation": operation,
+            "created_at": now,
+        })
+    if rows:
+        session.connection().execute(insert(ChangeLog.__table__), rows)
+
+
+def log_deletion(db: Session, entity: str, entity_id: int, user_id: int, company_id: Optional[int]) -> None:
+    """
+    Record a tombstone for a row deleted with a bulk statement (no ORM flush)
+
+    Args:
+        db: Database session (the entry commits with the caller's transaction)
+        entity: Entity name, e.g. "companies"
+        entity_id: Deleted row ID
+        user_id: Owner
+        company_id: Company of the row
+    """
+    db.execute(insert(ChangeLog.__table__).values(
+        user_id=user_id, company_id=company_id, entity=entity, entity_id=entity_id,
+        operation=DELETE, created_at=datetime.utcnow(),
+    ))
+
+
+def commit_horizon(db: Session) -> Optional[int]:
+    """
+    Oldest transaction that may still be in progress
+
+    Args:
+        db: Database session
+
+    Returns:
+        txid_snapshot_xmin on PostgreSQL (entries with a smaller txid are final), None on SQLite
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    return db.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+
+
+def settled_entries(db: Session, user_id: Optional[int], *columns):
+    """Query change_log entries (of one user, or all) that no later commit can overtake"""
+    query = db.query(*columns)
+    if user_id is not None:
+        query = query.filter(ChangeLog.user_id == user_id)
+    horizon = commit_horizon(db)
+    if horizon is not None:
+        query = query.filter(ChangeLog.txid < horizon)
+    return query
+
+
+def after_cursor(cursor: Tuple[int, int]):
+    """Filter for entries past a (txid, id) cursor"""
+    txid, last_id = cursor
+    return or_(ChangeLog.txid > txid, and_(ChangeLog.txid == txid, ChangeLog.id > last_id))
+
+
+def tail_start(db: Session) -> Tuple[int, int]:
+    """
+    Cursor for following new entries of all users: everything settled so far is skipped
+
+    Args:
+        db: Database session
+
+    Returns:
+        (txid, id) cursor
+    """
+    horizon = commit_horizon(db)
+    if horizon is None:
+        return 0, db.query(func.max(ChangeLog.id)).scalar() or 0
+    # Entries of transactions still running at this point are still ahead
+    return horizon, 0
+
+
+def latest_cursor(db: Session, user_id: int) -> Tuple[int, int]:
+    """
+    Cursor covering every settled entry of a user (a full sync starts here)
+
+    Args:
+        db: Database session
+        user_id: Owner
+
+    Returns:
+        (txid, id) of the user's last settled entry, or (0, 0)
+    """
+    row = settled_entries(db, user_id, ChangeLog.txid, ChangeLog.id).order_by(
+        ChangeLog.txid.desc(), ChangeLog.id.desc()
+    ).first()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def changes_since(db: Session, user_id: int, cursor: Tuple[int, int],
+                  limit: int) -> Tuple[List[Tuple[int, int, str, int, str]], bool]:
+    """
+    Settled change_log entries of a user after a cursor
+
+    Args:
+        db: Database session
+        user_id: Owner
+        cursor: (txid, id) of the last entry the client has seen
+        limit: Maximum number of entries
+
+    Returns:
+        ((txid, id, entity, entity_id, operation) rows in cursor order, whether more entries follow)
+    """
+    rows = settled_entries(
+        db, user_id, ChangeLog.txid, ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.operation
+    ).filter(after_cursor(cursor)).order_by(ChangeLog.txid, ChangeLog.id).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def prune_change_log() -> int:
+    """
+    Delete entries older than the retention period (plus a day, so tokens expire first)
+
+    Returns:
+        Number of deleted rows
+    """
+    db = SessionLocal()
+    try:
+        deleted = db.query(ChangeLog).filter(
+            ChangeLog.created_at < datetime.utcnow() - timedelta(days=SYNC_RETENTION_DAYS + 1)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+async def run_pruner() -> None:
+    """Background task pruning the change log every SYNC_PRUNE_MINUTES"""
+    while True:
+        try:
+            deleted = await run_in_threadpool(prune_change_log)
+            if deleted:
+                logger.info("Pruned %s change log entries", deleted)
+        except Exception:
+            logger.exception("Change log prune failed")
+        await asyncio.sleep(SYNC_PRUNE_MINUTES * 60)
@@ -0,0 +1,205 @@
+"""
+Response Compression
+Negotiated gzip / brotli compression for JSON and text responses
+"""
+import os
+import zlib
+from typing import Optional
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli  # Optional dependency: pip install brotli
+except ImportError:
+    brotli = None
+
+# Load environment variables
+load_dotenv()
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "True").lower() == "true"
+# Bodies smaller than this are sent as-is (headers and framing would eat the gain)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# gzip level 1-9 and brotli quality 0-11; the defaults favour CPU over the last few percent
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+
+# Server-sent events must reach the client as soon as they are written
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+class GzipCompressor:
+    """Incremental gzip stream"""
+
+    encoding = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.compress(data)
+        return output + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliCompressor:
+    """Incremental brotli stream"""
+
+    encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        output = self._compressor.process(data)
+        return output + (self._compressor.finish() if final else self._compressor.flush())
+
+
+def _accepted_encodings(header: str) -> dict:
+    """Parse an Accept-Encoding header into {coding: q-value}"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def negotiate_encoding(header: str) -> Optional[str]:
+    """
+    Choose a content coding from an Accept-Encoding header
+
+    Args:
+        header: Accept-Encoding request header value
+
+    Returns:
+        "br", "gzip" or None when the response should not be compressed
+    """
+    accepted = _accepted_encodings(header)
+    wildcard = accepted.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def create_compressor(encoding: str):
+    """
+    Build a streaming compressor for a negotiated coding
+
+    Args:
+        encoding: "br" or "gzip"
+
+    Returns:
+        Compressor with compress(data, final) returning the next output chunk
+    """
+    if encoding == "br":
+        return BrotliCompressor(BROTLI_QUALITY)
+    return GzipCompressor(COMPRESSION_LEVEL)
+
+
+def is_compressible(headers: Headers) -> bool:
+    """Check whether a response's content type benefits from compression"""
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith(UNCOMPRESSED_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the best coding the client accepts
+
+    Single-message bodies are compressed when they reach COMPRESSION_MIN_SIZE.
+    Streaming bodies are compressed chunk by chunk and flushed after each one,
+    so nothing is held back waiting for the end of the stream. Event streams
+    are never compressed.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor
+
+            if message["type"] == "http.response.start":
+                if is_compressible(Headers(raw=message.get("headers", []))):
+                    # Hold the headers until the first body chunk shows the response size
+                    start_message = message
+                    return
+                await send(message)
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(scope=start_message)
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    await send(message)
+                    start_message = None
+                    return
+
+                compressor = create_compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                # The compressed bytes are a different representation of the resource
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = "W/" + etag
+                if more_body:
+                    del headers["Content-Length"]
+                    await send(start_message)
+                else:
+                    body = compressor.compress(body, final=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, send_compressed)
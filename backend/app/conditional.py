@@ -0,0 +1,149 @@
+"""
+Conditional Requests
+ETag / Last-Modified validators and 304 responses for list and detail endpoints
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Optional, Sequence
+from fastapi import Request, Response, status
+from sqlalchemy import func
+from app.database import release_connection
+from app.serialization import ORJSONResponse, dumps, rows_to_dicts
+
+# Browsers store the response but revalidate it with If-None-Match on every use
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(request: Request, user_id: int, count: int, last_modified: Optional[datetime]) -> str:
+    """
+    Build a weak ETag from a resource version
+
+    The version of a collection is its row count plus the newest timestamp, which
+    changes on inserts, updates and deletes. The path, query string and user are
+    part of the tag so different filters and users never share a validator.
+
+    Args:
+        request: Current request
+        user_id: Current user ID
+        count: Number of rows in the resource
+        last_modified: Newest updated_at (or created_at) in the resource
+
+    Returns:
+        Weak ETag header value
+    """
+    stamp = last_modified.isoformat() if last_modified else ""
+    source = f"{user_id}|{request.url.path}?{request.url.query}|{count}|{stamp}"
+    return 'W/"' + hashlib.blake2b(source.encode(), digest_size=12).hexdigest() + '"'
+
+
+def _opaque_tag(tag: str) -> str:
+    """Strip the weak indicator from an entity tag"""
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check an ETag against the request's If-None-Match header (weak comparison)
+
+    Args:
+        request: Current request
+        etag: Current ETag of the resource
+
+    Returns:
+        True if the client already holds this version
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) == opaque for candidate in header.split(","))
+
+
+def set_conditional_headers(response: Response, etag: str, last_modified: Optional[datetime]) -> None:
+    """
+    Attach ETag, Last-Modified and Cache-Control headers to a response
+
+    Args:
+        response: Response to modify
+        etag: ETag header value
+        last_modified: Resource timestamp (naive values are treated as UTC)
+    """
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        response.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime]) -> Response:
+    """
+    Build an empty 304 Not Modified response
+
+    Args:
+        etag: ETag header value
+        last_modified: Resource timestamp
+
+    Returns:
+        Response with status 304 and validators
+    """
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_conditional_headers(response, etag, last_modified)
+    return response
+
+
+def conditional_list_response(
+    request: Request,
+    user_id: int,
+    query,
+    fields: Sequence[str],
+    timestamp_column,
+) -> Response:
+    """
+    Serve a column-projected list query with validators
+
+    When the request carries If-None-Match, a single COUNT/MAX aggregate over the
+    same filters decides whether the client copy is current; a match returns 304
+    without fetching or serializing any rows. Otherwise the rows are fetched and
+    the version is derived from them, so no extra query is issued.
+
+    Args:
+        request: Current request
+        user_id: Current user ID
+        query: Ordered query selecting exactly the columns named in fields
+        fields: Output field names, in column order
+        timestamp_column: Column whose maximum changes on every write (updated_at);
+            selected in addition to fields when a sparse fieldset leaves it out
+
+    Returns:
+        304 response or ORJSONResponse with ETag and Last-Modified headers
+    """
+    if request.headers.get("if-none-match"):
+        count, last_modified = query.with_entities(
+            func.count(), func.max(timestamp_column)
+        ).order_by(None).one()
+        etag = make_etag(request, user_id, count, last_modified)
+        if etag_matches(request, etag):
+            return not_modified_response(etag, last_modified)
+
+    fields = list(fields)
+    if timestamp_column.key in fields:
+        timestamp_index = fields.index(timestamp_column.key)
+    else:
+        # Extra trailing column: rows_to_dicts zips by fields and leaves it out of the output
+        query = query.add_columns(timestamp_column)
+        timestamp_index = len(fields)
+
+    rows = query.all()
+    # Encoding can take longer than the query; do not hold a pooled connection meanwhile
+    release_connection(query.session)
+    last_modified = max((row[timestamp_index] for row in rows), default=None)
+    etag = make_etag(request, user_id, len(rows), last_modified)
+
+    response = ORJSONResponse(dumps(rows_to_dicts(rows, fields)))
+    set_conditional_headers(response, etag, last_modified)
+    return response
@@ -3,10 +3,12 @@ Database Configuration
 SQLAlchemy setup with session management
 """
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
+from fastapi import Request
+from app.instrumentation import install_pool_instrumentation, install_query_instrumentation
 
 # Load environment variables
 load_dotenv()
@@ -14,13 +16,105 @@ load_dotenv()
 # Get database URL from environment
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./pvapp.db")
 
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_SQLITE_MEMORY = IS_SQLITE and (DATABASE_URL in ("sqlite://", "sqlite:///") or ":memory:" in DATABASE_URL)
+
+# Connection pool configuration (ignored for in-memory SQLite, which uses a single connection)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
+
+# SQLite pragmas applied to every new connection
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-64000"))  # Negative values are KiB (64 MB)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", "268435456"))  # 256 MB
+
+
+def get_engine_options() -> dict:
+    """
+    Build the keyword arguments passed to create_engine for the configured database
+
+    Returns:
+        Dictionary of engine options (pool settings and driver connect args)
+    """
+    options = {
+        # Full statement echo is expensive; slow queries are logged by app.instrumentation instead
+        "echo": os.getenv("DB_ECHO", "False").lower() == "true",
+    }
+
+    if IS_SQLITE:
+        # connect_args is only needed for SQLite
+        options["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+
+    if not IS_SQLITE_MEMORY:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+
+    return options
+
+
 # Create SQLAlchemy engine
-# connect_args is only needed for SQLite
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-    echo=os.getenv("DEBUG", "True").lower() == "true",  # Log SQL queries in debug mode
-)
+engine = create_engine(DATABASE_URL, **get_engine_options())
+install_query_instrumentation(engine)
+install_pool_instrumentation(engine)
+
+
+if IS_SQLITE:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        Apply SQLite pragmas on every new DBAPI connection
+
+        WAL lets readers proceed while a writer holds the lock, and busy_timeout
+        makes writers wait for the lock instead of failing with "database is locked".
+        foreign_keys enables the ON DELETE CASCADE / SET NULL actions that deletes rely on.
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            if not IS_SQLITE_MEMORY:
+                cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+                cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+            cursor.execute("PRAGMA foreign_keys=ON")
+        finally:
+            cursor.close()
+
+
+def get_pool_status() -> dict:
+    """
+    Report connection pool usage for health checks
+
+    Returns:
+        Dictionary with pool class, size, checked-out and overflow connection counts
+    """
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+
+    for key, method in (
+        ("size", "size"),
+        ("checked_in", "checkedin"),
+        ("checked_out", "checkedout"),
+        ("overflow", "overflow"),
+    ):
+        if hasattr(pool, method):
+            status[key] = getattr(pool, method)()
+
+    return status
+
 
 # Create SessionLocal class for database sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -29,21 +123,53 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
-def get_db():
+def get_db(request: Request):
     """
     Database dependency for FastAPI
-    Creates a new database session for each request and closes it after
+    Provides one session per request, kept on request.state so that
+    get_current_user and the endpoint share it explicitly
+
+    Creating the session does not touch the pool: a connection is checked out
+    when the first statement runs and returned on commit, release_connection()
+    or when the request's session is closed.
     """
+    db = getattr(request.state, "db", None)
+    if db is not None:
+        # Already opened by another dependency of this request, which also closes it
+        yield db
+        return
+
     db = SessionLocal()
+    request.state.db = db
     try:
         yield db
     finally:
         db.close()
+        request.state.db = None
+
+
+def release_connection(db: Session) -> None:
+    """
+    Return the session's connection to the pool, keeping loaded objects usable
+
+    Ends the current (read-only) transaction without expiring instances, so
+    slow work that follows, such as encoding a large response, does not hold a
+    pooled connection. The next statement checks out a connection again.
+
+    Args:
+        db: Session with no pending changes
+    """
+    expire_on_commit = db.expire_on_commit
+    db.expire_on_commit = False
+    try:
+        db.commit()
+    finally:
+        db.expire_on_commit = expire_on_commit
 
 
 def init_db():
     """
-    Initialize database - create all tables
+    Initialize database - apply all pending schema migrations
     """
-    from app.models import User, Company, Material, MaterialMovement, Purchase, PurchaseItem
-    Base.metadata.create_all(bind=engine)
+    from app.migrations import upgrade
+    upgrade(engine)
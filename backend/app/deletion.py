@@ -0,0 +1,153 @@
+"""
+Set-Based Deletes
+Delete companies and their child rows with bulk DELETE statements instead of ORM cascades
+
+Small companies are deleted with one DELETE on companies; the database's
+ON DELETE CASCADE removes materials, movements, purchases and items in the
+same statement. Companies with more than DELETE_INLINE_MAX_ROWS child rows
+are deleted by a background job, DELETE_CHUNK_SIZE rows per transaction and
+children first, so no single transaction holds locks on the whole tenant.
+"""
+import logging
+import os
+from typing import Callable, Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.cache import response_cache
+from app.changelog import log_deletion
+from app.database import SessionLocal
+from app.jobs import JobContext, job_handler
+from app.models import Company, Material, MaterialMovement, MaterialMovementArchive, Purchase, PurchaseItem
+
+# Load environment variables
+load_dotenv()
+
+# Companies with more child rows than this are deleted in the background
+DELETE_INLINE_MAX_ROWS = int(os.getenv("DELETE_INLINE_MAX_ROWS", "10000"))
+# Rows deleted per statement and transaction by chunked deletes
+DELETE_CHUNK_SIZE = int(os.getenv("DELETE_CHUNK_SIZE", "5000"))
+
+logger = logging.getLogger("app.deletion")
+
+
+def company_row_count(db: Session, company_id: int) -> int:
+    """
+    Count the rows a company deletion removes (materials, movements, archived movements, purchases and items)
+
+    Args:
+        db: Database session
+        company_id: Company ID
+
+    Returns:
+        Number of child rows
+    """
+    material_ids = select(Material.id).where(Material.company_id == company_id).scalar_subquery()
+    purchase_ids = select(Purchase.id).where(Purchase.company_id == company_id).scalar_subquery()
+    counts = (
+        select(func.count()).select_from(Material).where(Material.company_id == company_id).scalar_subquery(),
+        select(func.count()).select_from(MaterialMovement).where(MaterialMovement.material_id.in_(material_ids)).scalar_subquery(),
+        select(func.count()).select_from(MaterialMovementArchive).where(MaterialMovementArchive.material_id.in_(material_ids)).scalar_subquery(),
+        select(func.count()).select_from(Purchase).where(Purchase.company_id == company_id).scalar_subquery(),
+        select(func.count()).select_from(PurchaseItem).where(PurchaseItem.purchase_id.in_(purchase_ids)).scalar_subquery(),
+    )
+    return sum(db.execute(select(*counts)).one())
+
+
+def delete_in_chunks(db: Session, model, condition, chunk_size: int = DELETE_CHUNK_SIZE,
+                     on_chunk: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Delete matching rows with repeated bounded DELETE statements, committing after each
+
+    Args:
+        db: Database session
+        model: Mapped class of the table
+        condition: WHERE clause selecting the rows
+        chunk_size: Rows per DELETE
+        on_chunk: Called with the number of rows deleted by each chunk
+
+    Returns:
+        Total number of deleted rows
+    """
+    total = 0
+    while True:
+        chunk = select(model.id).where(condition).limit(chunk_size).scalar_subquery()
+        deleted = db.execute(
+            delete(model).where(model.id.in_(chunk)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if not deleted:
+            return total
+        total += deleted
+        if on_chunk is not None:
+            on_chunk(deleted)
+
+
+def delete_company_rows(db: Session, company_id: int,
+                        on_progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Delete a company in chunks: items, purchases, movements, archived movements, materials, then the company
+
+    Args:
+        db: Database session
+        company_id: Company ID
+        on_progress: Called with the running total of deleted rows after each chunk
+
+    Returns:
+        Total number of deleted rows
+    """
+    deleted = 0
+
+    def progress(count: int) -> None:
+        nonlocal deleted
+        deleted += count
+        if on_progress is not None:
+            on_progress(deleted)
+
+    purchase_ids = select(Purchase.id).where(Purchase.company_id == company_id)
+    material_ids = select(Material.id).where(Material.company_id == company_id)
+    delete_in_chunks(db, PurchaseItem, PurchaseItem.purchase_id.in_(purchase_ids), on_chunk=progress)
+    delete_in_chunks(db, Purchase, Purchase.company_id == company_id, on_chunk=progress)
+    delete_in_chunks(db, MaterialMovement, MaterialMovement.material_id.in_(material_ids), on_chunk=progress)
+    delete_in_chunks(db, MaterialMovementArchive, MaterialMovementArchive.material_id.in_(material_ids), on_chunk=progress)
+    delete_in_chunks(db, Material, Material.company_id == company_id, on_chunk=progress)
+    owner_id = db.query(Company.user_id).filter(Company.id == company_id).scalar()
+    if owner_id is not None:
+        # Bulk deletes bypass the ORM, so the sync tombstone is written here
+        log_deletion(db, "companies", company_id, owner_id, company_id)
+    db.execute(delete(Company).where(Company.id == company_id).execution_options(synchronize_session=False))
+    db.commit()
+    return deleted
+
+
+@job_handler("delete_company", max_attempts=3)
+def delete_company_job(job: JobContext) -> dict:
+    """
+    Job deleting a large company with its own session
+
+    Params: company_id, user_id (owner, for cache invalidation) and total_rows
+    (company_row_count() when the job was queued). Safe to resume: a retry
+    continues with the rows that are left.
+    """
+    company_id = job.params["company_id"]
+    user_id = job.params["user_id"]
+    total_rows = job.params["total_rows"]
+
+    db = SessionLocal()
+    try:
+        # Rows removed by earlier attempts count as done
+        done = max(0, total_rows - company_row_count(db, company_id))
+
+        def report(deleted: int) -> None:
+            job.progress(done + deleted, total_rows)
+            # Lists shrink while the deletion runs
+            response_cache.invalidate(company_id, user_id)
+            job.check_cancelled()
+
+        deleted = delete_company_rows(db, company_id, on_progress=report)
+        job.progress(total_rows, total_rows)
+        logger.info("Deleted company %s (%s rows)", company_id, done + deleted)
+        return {"company_id": company_id, "deleted_rows": done + deleted}
+    finally:
+        db.close()
+        response_cache.invalidate(company_id, user_id)
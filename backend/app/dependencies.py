@@ -3,25 +3,32 @@ FastAPI Dependencies
 Common dependencies like authentication
 """
 from typing import Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
-from app.auth import decode_token
+from app.auth import decode_token, is_admin_email
 
 # OAuth2 scheme for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+# Same scheme without the automatic 401, for endpoints that also accept a query token
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
 
 async def get_current_user(
+    request: Request,
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> User:
     """
     Get the current authenticated user from JWT token
     
+    The user is kept on request.state, so operations run inside POST /batch
+    reuse the batch's authentication instead of repeating it.
+    
     Args:
+        request: Current request
         token: JWT token from Authorization header
         db: Database session
         
@@ -31,6 +38,10 @@ async def get_current_user(
     Raises:
         HTTPException: If token is invalid or user not found
     """
+    user = getattr(request.state, "current_user", None)
+    if user is not None:
+        return user
+    
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -64,9 +75,34 @@ async def get_current_user(
             detail="User account is inactive"
         )
     
+    request.state.current_user = user
     return user
 
 
+async def get_stream_user(
+    request: Request,
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = Query(None, description="JWT token, for clients that cannot send headers"),
+    db: Session = Depends(get_db)
+) -> User:
+    """
+    Get the current user from the Authorization header or an access_token query parameter
+    
+    Browsers' EventSource cannot set headers, so event streams also accept the
+    token in the URL.
+    
+    Args:
+        request: Current request
+        token: JWT token from Authorization header
+        access_token: JWT token from the query string
+        db: Database session
+        
+    Returns:
+        Current user object
+    """
+    return await get_current_user(request, token or access_token or "", db)
+
+
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -80,3 +116,27 @@ async def get_current_active_user(
         Current active user
     """
     return current_user
+
+
+async def get_current_admin_user(
+    current_user: User = Depends(get_current_user)
+) -> User:
+    """
+    Get current user and require administrator rights
+    
+    Args:
+        current_user: Current user from get_current_user
+        
+    Returns:
+        Current user if listed in ADMIN_EMAILS
+        
+    Raises:
+        HTTPException: If the user is not an administrator
+    """
+    if not is_admin_email(current_user.email):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Administrator access required"
+        )
+    
+    return current_user
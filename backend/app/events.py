@@ -0,0 +1,251 @@
+"""
+Live Events
+Publish/subscribe of committed changes, streamed per company over Server-Sent Events
+
+Events are read from the change log, the same record GET /sync serves: every
+worker process tails change_log in (txid, id) order every EVENTS_POLL_SECONDS
+and publishes the entries of the companies its clients watch. A change is
+therefore seen by every worker, whichever process wrote it, and rolled-back
+changes are never sent. Each subscriber has a bounded buffer of
+EVENTS_BUFFER_SIZE events. Publishing never waits for a client: when a slow
+client's buffer is full, its buffered events are dropped and replaced by one
+"resync" event telling it to reload, so memory per client stays bounded and
+writers are never held up.
+"""
+import asyncio
+import itertools
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from app.changelog import DELETE, SYNCED_ENTITIES, after_cursor, settled_entries, tail_start
+from app.database import SessionLocal
+from app.models import ChangeLog
+
+# Load environment variables
+load_dotenv()
+
+# Events buffered per client before it is told to resync
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "100"))
+# Interval of keep-alive comments on idle streams
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+# Open streams per process
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "1000"))
+# Interval of the change log tail feeding the streams
+EVENTS_POLL_SECONDS = float(os.getenv("EVENTS_POLL_SECONDS", "0.5"))
+# Change log entries read per poll
+EVENTS_POLL_BATCH = 5000
+
+# Fields sent with each change, so clients can update in place without a request
+EVENT_FIELDS = {
+    "companies": ("name",),
+    "materials": ("name", "sku", "current_stock", "min_stock"),
+    "movements": ("material_id", "quantity", "reason", "created_at"),
+    "purchases": ("invoice_number", "status", "total_amount"),
+    "purchase_items": ("purchase_id", "material_id", "quantity", "total_price"),
+}
+
+# Model of each entity name
+ENTITY_MODELS = {entity: model for model, entity in SYNCED_ENTITIES.items()}
+
+logger = logging.getLogger("app.events")
+
+
+class Subscription:
+    """One client's stream: a bounded queue read by the response generator"""
+
+    def __init__(self, company_id: int, buffer_size: int):
+        self.company_id = company_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0
+
+    def offer(self, item: dict) -> None:
+        """Queue an event without waiting (event loop thread only)"""
+        if self.queue.full():
+            # Slow client: replace its backlog with one resync marker
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait({"type": "resync", "data": {"dropped": self.dropped}})
+            return
+        self.queue.put_nowait(item)
+
+
+class EventBroker:
+    """Company-scoped fan-out of events to subscribed streams"""
+
+    def __init__(self, buffer_size: int = EVENTS_BUFFER_SIZE, max_subscribers: int = EVENTS_MAX_SUBSCRIBERS):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.subscriptions: Dict[int, Set[Subscription]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.sequence = itertools.count(1)
+        self.published = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self.subscriptions.values())
+
+    def subscribe(self, company_id: int) -> Optional[Subscription]:
+        """
+        Open a stream for a company (event loop thread only)
+
+        Args:
+            company_id: Company ID
+
+        Returns:
+            Subscription, or None when EVENTS_MAX_SUBSCRIBERS streams are open
+        """
+        if self.subscriber_count >= self.max_subscribers:
+            return None
+        self.loop = asyncio.get_running_loop()
+        subscription = Subscription(company_id, self.buffer_size)
+        self.subscriptions.setdefault(company_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self.subscriptions.get(subscription.company_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self.subscriptions[subscription.company_id]
+
+    def publish(self, company_id: int, event_type: str, data: dict) -> None:
+        """
+        Send an event to every stream of a company; callable from any thread
+
+        Args:
+            company_id: Company ID
+            event_type: SSE event name
+            data: JSON-compatible payload
+        """
+        if company_id not in self.subscriptions or self.loop is None:
+            return
+        item = {"id": next(self.sequence), "type": event_type, "data": data}
+        self.published += 1
+        if self._in_loop():
+            self._deliver(company_id, item)
+        else:
+            # Publishing from another thread hands the event to the loop
+            self.loop.call_soon_threadsafe(self._deliver, company_id, item)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def _deliver(self, company_id: int, item: dict) -> None:
+        for subscription in list(self.subscriptions.get(company_id, ())):
+            subscription.offer(item)
+
+
+# Global broker
+event_broker = EventBroker()
+
+
+class ChangeLogTail:
+    """Reads committed change log entries past a cursor and turns them into events"""
+
+    def __init__(self, buffer_size: int = EVENTS_BUFFER_SIZE, batch_size: int = EVENTS_POLL_BATCH):
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.cursor: Optional[Tuple[int, int]] = None
+
+    def poll(self, companies: Set[int]) -> Tuple[List[Tuple[int, str, dict]], bool]:
+        """
+        Read the next entries and build the events of the watched companies
+
+        The first call only places the cursor: changes committed before the
+        tail started are not sent.
+
+        Args:
+            companies: IDs of the companies with open streams
+
+        Returns:
+            (company_id, event type, data) triples in commit order, and whether
+            more entries are waiting
+        """
+        db = SessionLocal()
+        try:
+            if self.cursor is None:
+                self.cursor = tail_start(db)
+                return [], False
+            entries = settled_entries(
+                db, None, ChangeLog.txid, ChangeLog.id, ChangeLog.company_id,
+                ChangeLog.entity, ChangeLog.entity_id, ChangeLog.operation
+            ).filter(after_cursor(self.cursor)).order_by(
+                ChangeLog.txid, ChangeLog.id
+            ).limit(self.batch_size).all()
+            if not entries:
+                return [], False
+            self.cursor = (entries[-1].txid, entries[-1].id)
+            more = len(entries) == self.batch_size
+
+            watched: Dict[int, list] = {}
+            for entry in entries:
+                if entry.company_id in companies:
+                    watched.setdefault(entry.company_id, []).append(entry)
+            if not watched:
+                return [], more
+
+            # A company with more changes than a client can buffer gets one resync
+            resync = {company_id for company_id, items in watched.items() if len(items) > self.buffer_size}
+            fields = self._current_fields(db, [
+                entry for company_id, items in watched.items() if company_id not in resync
+                for entry in items if entry.operation != DELETE
+            ])
+
+            events = []
+            for entry in entries:
+                if entry.company_id not in watched:
+                    continue
+                if entry.company_id in resync:
+                    if entry is watched[entry.company_id][0]:
+                        events.append((entry.company_id, "resync", {"changes": len(watched[entry.company_id])}))
+                    continue
+                data = {"entity": entry.entity, "id": entry.entity_id, "operation": entry.operation}
+                if entry.operation != DELETE:
+                    current = fields.get((entry.entity, entry.entity_id))
+                    if current is None:
+                        # Deleted since; its delete entry follows
+                        continue
+                    data.update(current)
+                events.append((entry.company_id, "change", data))
+            return events, more
+        finally:
+            db.close()
+
+    @staticmethod
+    def _current_fields(db, entries) -> Dict[Tuple[str, int], dict]:
+        """Load the EVENT_FIELDS of the rows behind upsert entries, by (entity, id)"""
+        ids: Dict[str, Set[int]] = {}
+        for entry in entries:
+            ids.setdefault(entry.entity, set()).add(entry.entity_id)
+        fields = {}
+        for entity, entity_ids in ids.items():
+            model = ENTITY_MODELS[entity]
+            names = EVENT_FIELDS[entity]
+            rows = db.query(model.id, *(getattr(model, name) for name in names)).filter(
+                model.id.in_(entity_ids)
+            ).all()
+            for row in rows:
+                fields[(entity, row[0])] = dict(zip(names, row[1:]))
+        return fields
+
+
+async def run_tail() -> None:
+    """Background task publishing change log entries to this process's streams"""
+    tail = ChangeLogTail(event_broker.buffer_size)
+    while True:
+        more = False
+        try:
+            events, more = await run_in_threadpool(tail.poll, set(event_broker.subscriptions))
+            for company_id, event_type, data in events:
+                event_broker.publish(company_id, event_type, data)
+        except Exception:
+            logger.exception("Event tail failed")
+        if not more:
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
@@ -0,0 +1,251 @@
+"""
+Idempotency Keys
+Replay-safe POST endpoints: a retried request with the same Idempotency-Key returns the stored response
+
+A request carrying the header first claims the key by inserting a row without a
+response. The endpoint stores its response in that row in the same transaction
+as its own changes, so either both are committed or neither is. A retry then
+finds the stored response and returns it without running the endpoint again.
+
+Concurrent duplicates lose the insert race on the (user_id, key) unique
+constraint and wait for the first request to finish instead of running in
+parallel. A claim without a response means the first request's transaction
+never committed, so after IDEMPOTENCY_LOCK_SECONDS it may be taken over.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Optional
+from fastapi import Depends, Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.database import SessionLocal, get_db
+from app.dependencies import get_current_user
+from app.models import IdempotencyKey, User
+from app.serialization import ORJSONResponse, dumps
+
+# Load environment variables
+load_dotenv()
+
+# How long a stored response can be replayed
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# How long a duplicate waits for the first request before answering 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# Age after which an unfinished claim is considered abandoned
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+# Interval of the background sweep deleting expired keys
+IDEMPOTENCY_SWEEP_MINUTES = int(os.getenv("IDEMPOTENCY_SWEEP_MINUTES", "60"))
+
+MAX_KEY_LENGTH = 255
+
+logger = logging.getLogger("app.idempotency")
+
+
+class IdempotencyClaim:
+    """The current request's hold on an Idempotency-Key"""
+
+    def __init__(self, record: Optional[IdempotencyKey] = None, replay: Optional[ORJSONResponse] = None):
+        self.record = record
+        self.record_id = record.id if record is not None else None
+        # Stored response of an earlier request with the same key
+        self.replay = replay
+        self.saved = False
+
+    def save(self, db: Session, content: Any, status_code: int = status.HTTP_200_OK) -> None:
+        """
+        Store the response with the endpoint's changes (before its commit)
+
+        Args:
+            db: The endpoint's database session
+            content: Response model or JSON-compatible data
+            status_code: Status code to replay
+        """
+        if self.record is None:
+            return
+        self.record.status_code = status_code
+        self.record.response_body = dumps(jsonable_encoder(content))
+        db.add(self.record)
+        self.saved = True
+
+
+def request_fingerprint(request: Request, body: bytes) -> str:
+    """SHA-256 of method, path, query string and body, to detect a key reused for another request"""
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.url.path}?{request.url.query}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def replay_response(record: IdempotencyKey) -> ORJSONResponse:
+    """Rebuild the stored response"""
+    return ORJSONResponse(
+        record.response_body,
+        status_code=record.status_code,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def _existing(db: Session, user_id: int, key: str) -> Optional[IdempotencyKey]:
+    """Load a key with a fresh snapshot (the row may have been written by another request)"""
+    db.rollback()
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key
+    ).first()
+
+
+async def claim_key(db: Session, user_id: int, key: str, fingerprint: str) -> IdempotencyClaim:
+    """
+    Claim an Idempotency-Key, or return the response stored for it
+
+    Args:
+        db: Database session
+        user_id: Keys are scoped per user
+        key: Idempotency-Key header value
+        fingerprint: request_fingerprint() of the current request
+
+    Returns:
+        A claim to save the response on, or one carrying the replay
+
+    Raises:
+        HTTPException: 422 if the key was used for a different request,
+                       409 if the first request is still running after IDEMPOTENCY_WAIT_SECONDS
+    """
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.05
+    while True:
+        now = datetime.utcnow()
+        record = IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            request_hash=fingerprint,
+            created_at=now,
+            expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+        )
+        db.add(record)
+        try:
+            db.flush()
+            claim = IdempotencyClaim(record=record)
+            # Committed right away so concurrent duplicates see the claim
+            db.commit()
+            return claim
+        except IntegrityError:
+            db.rollback()
+
+        existing = _existing(db, user_id, key)
+        if existing is None:
+            # Released by a failed first attempt in the meantime
+            continue
+        stale = existing.expires_at <= now or (
+            existing.status_code is None
+            and existing.created_at <= now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+        )
+        if stale:
+            # Expired, or abandoned by a request whose transaction never committed
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.id == existing.id
+            ).delete(synchronize_session=False)
+            db.commit()
+            continue
+        if existing.request_hash != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request"
+            )
+        if existing.status_code is not None:
+            return IdempotencyClaim(replay=replay_response(existing))
+
+        if asyncio.get_running_loop().time() + delay > deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still being processed",
+                headers={"Retry-After": "1"},
+            )
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+def release_key(db: Session, claim: IdempotencyClaim) -> None:
+    """Drop a claim whose request failed, so a retry runs the endpoint again"""
+    db.rollback()
+    deleted = db.query(IdempotencyKey).filter(
+        IdempotencyKey.id == claim.record_id,
+        IdempotencyKey.status_code.is_(None)
+    ).delete(synchronize_session=False)
+    db.commit()
+    if deleted:
+        logger.debug("Released idempotency key %s", claim.record_id)
+
+
+async def idempotency_claim(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Dependency for endpoints accepting an Idempotency-Key header
+
+    The endpoint returns claim.replay when it is set, and otherwise calls
+    claim.save() before committing. Without the header the claim is a no-op.
+
+    Yields:
+        IdempotencyClaim
+    """
+    if not idempotency_key:
+        yield IdempotencyClaim()
+        return
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"
+        )
+
+    fingerprint = request_fingerprint(request, await request.body())
+    claim = await claim_key(db, current_user.id, idempotency_key, fingerprint)
+    if claim.replay is not None:
+        yield claim
+        return
+
+    try:
+        yield claim
+    except Exception:
+        release_key(db, claim)
+        raise
+    if not claim.saved:
+        release_key(db, claim)
+
+
+def sweep_expired_keys() -> int:
+    """
+    Delete expired idempotency keys
+
+    Returns:
+        Number of deleted rows
+    """
+    db = SessionLocal()
+    try:
+        deleted = db.query(IdempotencyKey).filter(
+            IdempotencyKey.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+async def run_sweeper() -> None:
+    """Background task deleting expired keys every IDEMPOTENCY_SWEEP_MINUTES"""
+    while True:
+        try:
+            deleted = await run_in_threadpool(sweep_expired_keys)
+            if deleted:
+                logger.info("Deleted %s expired idempotency keys", deleted)
+        except Exception:
+            logger.exception("Idempotency key sweep failed")
+        await asyncio.sleep(IDEMPOTENCY_SWEEP_MINUTES * 60)
@@ -0,0 +1,186 @@
+"""
+Query Instrumentation
+Per-statement SQL timing, structured slow-query log, per-request query counts
+and connection hold times
+"""
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Queries slower than this (milliseconds) are logged
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+# Requests issuing more queries than this are logged as possible N+1 patterns
+QUERY_COUNT_WARN = int(os.getenv("QUERY_COUNT_WARN", "25"))
+
+# Requests holding pooled connections longer than this (milliseconds) are logged
+CONNECTION_HOLD_WARN_MS = float(os.getenv("CONNECTION_HOLD_WARN_MS", "1000"))
+
+logger = logging.getLogger("app.sql")
+
+
+class RequestStats:
+    """Database statistics collected while a single request is being handled"""
+
+    __slots__ = ("scope", "query_count", "db_time", "checkouts", "connection_hold")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.query_count = 0
+        self.db_time = 0.0
+        # Pool checkouts and total time connections were held out of the pool
+        self.checkouts = 0
+        self.connection_hold = 0.0
+
+    @property
+    def route(self) -> str:
+        """Route template (e.g. /materials/{material_id}) or raw path before routing"""
+        route = self.scope.get("route")
+        path = getattr(route, "path", None) or self.scope.get("path", "")
+        return f"{self.scope.get('method', '')} {path}".strip()
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def get_request_stats() -> Optional[RequestStats]:
+    """
+    Get statistics for the request currently being handled
+
+    Returns:
+        RequestStats for the active request, or None outside a request
+    """
+    return _current_request.get()
+
+
+def redact_parameters(parameters, executemany: bool) -> str:
+    """
+    Describe bound parameters without exposing their values
+
+    Args:
+        parameters: DBAPI parameters passed with the statement
+        executemany: Whether the statement runs once per parameter set
+
+    Returns:
+        Short description such as "3 params" or "500 rows x 4 params"
+    """
+    if executemany and isinstance(parameters, (list, tuple)):
+        width = len(parameters[0]) if parameters else 0
+        return f"{len(parameters)} rows x {width} params"
+    return f"{len(parameters) if parameters else 0} params"
+
+
+def install_query_instrumentation(engine: Engine) -> None:
+    """
+    Register cursor execution events that time every statement
+
+    Args:
+        engine: Engine to instrument
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+
+        stats = _current_request.get()
+        if stats is not None:
+            stats.query_count += 1
+            stats.db_time += elapsed
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            logger.warning(json.dumps({
+                "event": "slow_query",
+                "duration_ms": round(elapsed * 1000, 2),
+                "route": stats.route if stats is not None else None,
+                "statement": " ".join(statement.split()),
+                "parameters": redact_parameters(parameters, executemany),
+            }))
+
+
+def install_pool_instrumentation(engine: Engine) -> None:
+    """
+    Register pool checkout/checkin events that measure how long connections are held
+
+    Args:
+        engine: Engine to instrument
+    """
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats = _current_request.get()
+        connection_record.info["checkout"] = (time.perf_counter(), stats)
+        if stats is not None:
+            stats.checkouts += 1
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checkout = connection_record.info.pop("checkout", None)
+        if checkout is None:
+            return
+        started, stats = checkout
+        # Attribute the hold to the request that checked the connection out, even if
+        # it is returned from another thread (sync dependencies exit in a threadpool)
+        if stats is not None:
+            stats.connection_hold += time.perf_counter() - started
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware that collects query statistics for each HTTP request
+
+    Adds X-Query-Count, X-DB-Time-Ms and X-DB-Hold-Ms response headers and logs
+    requests that exceed QUERY_COUNT_WARN queries or CONNECTION_HOLD_WARN_MS.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current_request.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(stats.query_count).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.db_time * 1000:.2f}".encode()))
+                headers.append((b"x-db-hold-ms", f"{stats.connection_hold * 1000:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current_request.reset(token)
+            if stats.query_count > QUERY_COUNT_WARN:
+                logger.warning(json.dumps({
+                    "event": "high_query_count",
+                    "route": stats.route,
+                    "query_count": stats.query_count,
+                    "db_time_ms": round(stats.db_time * 1000, 2),
+                }))
+            if stats.connection_hold * 1000 > CONNECTION_HOLD_WARN_MS:
+                logger.warning(json.dumps({
+                    "event": "long_connection_hold",
+                    "route": stats.route,
+                    "hold_ms": round(stats.connection_hold * 1000, 2),
+                    "db_time_ms": round(stats.db_time * 1000, 2),
+                    "checkouts": stats.checkouts,
+                }))
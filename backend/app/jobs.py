@@ -0,0 +1,435 @@
+"""
+Background Jobs
+Persistent job queue with an in-process worker pool (no external broker)
+
+Endpoints enqueue() a job and answer 202 with its id; clients follow it at
+GET /jobs/{id}. Every API process runs JOB_WORKERS worker threads that claim
+queued jobs from the jobs table with a conditional UPDATE, so several
+processes (or hosts sharing a PostgreSQL database) can work the same queue
+without running a job twice.
+
+Handlers are plain functions registered with @job_handler. They receive a
+JobContext, report progress with job.progress() and call job.check_cancelled()
+between units of work, which raises when the job was cancelled or the process
+is shutting down. An interrupted job is queued again, so handlers must be safe
+to resume (e.g. chunked deletes). Failed jobs are retried with exponential
+backoff up to the handler's max_attempts; POST /jobs/{id}/retry retries manually.
+
+Running jobs send a heartbeat; jobs whose process died are picked up again
+after JOB_STALE_SECONDS.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.database import SessionLocal
+from app.models import Job
+
+# Load environment variables
+load_dotenv()
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "True").lower() == "true"
+# Worker threads per API process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Idle workers look for new jobs this often (jobs enqueued in this process wake them at once)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# Running jobs without a heartbeat for this long are taken over by another worker
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "120"))
+# First automatic retry delay, doubled for each further attempt
+JOB_RETRY_DELAY_SECONDS = int(os.getenv("JOB_RETRY_DELAY_SECONDS", "30"))
+# Minimum interval between progress writes of one job
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (SUCCEEDED, FAILED, CANCELLED)
+
+logger = logging.getLogger("app.jobs")
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when the job was cancelled"""
+
+
+class JobInterrupted(Exception):
+    """Raised inside a handler when the worker is shutting down; the job is queued again"""
+
+
+class JobHandler:
+    """A registered job kind"""
+
+    def __init__(self, function: Callable[["JobContext"], Any], max_attempts: int):
+        self.function = function
+        self.max_attempts = max_attempts
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str, max_attempts: int = 1):
+    """
+    Register a function as the handler of a job kind
+
+    Args:
+        kind: Job kind passed to enqueue()
+        max_attempts: Total attempts before the job is marked failed (>1 only for resumable work)
+    """
+    def register(function: Callable[["JobContext"], Any]):
+        JOB_HANDLERS[kind] = JobHandler(function, max_attempts)
+        return function
+    return register
+
+
+def _update_job(job_id: int, **values) -> None:
+    """Write job columns in a short transaction of its own"""
+    db = SessionLocal()
+    try:
+        db.query(Job).filter(Job.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+class JobContext:
+    """What a handler sees of its job"""
+
+    def __init__(self, job: Job, pool: "JobWorkerPool"):
+        self.id = job.id
+        self.kind = job.kind
+        self.params = dict(job.params or {})
+        self.user_id = job.user_id
+        self.attempt = job.attempts
+        self._pool = pool
+        self._cancel_requested = False
+        self._last_write = 0.0
+
+    def progress(self, current: int, total: Optional[int] = None) -> None:
+        """
+        Report progress (written at most every JOB_PROGRESS_INTERVAL seconds)
+
+        Args:
+            current: Units of work done
+            total: Units of work expected, if known
+        """
+        now = time.monotonic()
+        if now - self._last_write < JOB_PROGRESS_INTERVAL and current != total:
+            return
+        self._last_write = now
+        values = {"progress_current": current, "heartbeat_at": datetime.utcnow()}
+        if total is not None:
+            values["progress_total"] = total
+        db = SessionLocal()
+        try:
+            db.query(Job).filter(Job.id == self.id).update(values, synchronize_session=False)
+            # Pick up cancellation requests on the same round trip
+            self._cancel_requested = bool(db.query(Job.cancel_requested).filter(Job.id == self.id).scalar())
+            db.commit()
+        finally:
+            db.close()
+
+    def check_cancelled(self) -> None:
+        """
+        Stop the handler if the job was cancelled or the worker is shutting down
+
+        Raises:
+            JobCancelled: Cancellation was requested (seen at the last progress write)
+            JobInterrupted: The process is stopping
+        """
+        if self._pool.stopping.is_set():
+            raise JobInterrupted()
+        if self._cancel_requested:
+            raise JobCancelled()
+
+
+def active_job(db: Session, dedupe_key: str) -> Optional[Job]:
+    """The queued or running job holding a dedupe key, if any"""
+    return db.query(Job).filter(Job.dedupe_key == dedupe_key, Job.status.in_((QUEUED, RUNNING))).first()
+
+
+def enqueue(
+    db: Session, kind: str, params: Optional[dict] = None, user_id: Optional[int] = None,
+    dedupe_key: Optional[str] = None,
+) -> Job:
+    """
+    Queue a job and wake an idle worker
+
+    Args:
+        db: Database session (committed)
+        kind: Registered job kind
+        params: JSON-compatible handler parameters
+        user_id: Owner allowed to see and control the job
+        dedupe_key: Only one job per key may be queued or running; while one
+            is, it is returned instead of queueing another
+
+    Returns:
+        The queued job
+    """
+    handler = JOB_HANDLERS.get(kind)
+    if handler is None:
+        raise ValueError(f"Unknown job kind: {kind}")
+    while True:
+        job = Job(kind=kind, params=params or {}, user_id=user_id, max_attempts=handler.max_attempts, dedupe_key=dedupe_key)
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent request queued the same work first (unique index on active dedupe keys)
+            db.rollback()
+            if dedupe_key is None:
+                raise
+            existing = active_job(db, dedupe_key)
+            if existing is not None:
+                return existing
+            # It finished in the meantime: queue a new one
+            continue
+        db.refresh(job)
+        job_pool.wake()
+        return job
+
+
+def cancel_job(db: Session, job: Job) -> Job:
+    """
+    Cancel a queued job at once, or ask a running one to stop
+
+    Args:
+        db: Database session (committed)
+        job: Job to cancel
+
+    Returns:
+        The updated job
+    """
+    # Conditional updates: a worker may claim the job between the read and this write
+    cancelled = db.query(Job).filter(Job.id == job.id, Job.status == QUEUED).update(
+        {"status": CANCELLED, "finished_at": datetime.utcnow()}, synchronize_session=False
+    )
+    if not cancelled:
+        db.query(Job).filter(Job.id == job.id, Job.status == RUNNING).update(
+            {"cancel_requested": True}, synchronize_session=False
+        )
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def retry_job(db: Session, job: Job) -> Job:
+    """
+    Queue a failed or cancelled job again with a fresh set of attempts
+
+    Args:
+        db: Database session (committed)
+        job: Finished job
+
+    Returns:
+        The queued job, or the active job already holding its dedupe key
+    """
+    if job.dedupe_key is not None:
+        existing = active_job(db, job.dedupe_key)
+        if existing is not None:
+            return existing
+    handler = JOB_HANDLERS.get(job.kind)
+    job.status = QUEUED
+    job.error = None
+    job.cancel_requested = False
+    job.finished_at = None
+    job.run_after = datetime.utcnow()
+    job.max_attempts = job.attempts + (handler.max_attempts if handler else 1)
+    db.commit()
+    db.refresh(job)
+    job_pool.wake()
+    return job
+
+
+class JobWorkerPool:
+    """Worker threads executing queued jobs, plus one heartbeat thread"""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self.stopping = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._running: Set[int] = set()
+        self._lock = threading.Lock()
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self) -> None:
+        """Start the worker and heartbeat threads (once per process)"""
+        if self._threads:
+            return
+        self.stopping.clear()
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(index,), name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop claiming jobs; running handlers are interrupted at their next check_cancelled()"""
+        self.stopping.set()
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def wake(self) -> None:
+        """Tell idle workers that a job was queued"""
+        self._wakeup.set()
+
+    def _work(self, index: int) -> None:
+        worker_id = f"{self._worker_prefix}:{index}"
+        while not self.stopping.is_set():
+            try:
+                job_id = self._claim(worker_id)
+            except Exception:
+                logger.exception("Claiming a job failed")
+                job_id = None
+            if job_id is None:
+                self._wakeup.wait(JOB_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+            self._execute(job_id)
+
+    def _claim(self, worker_id: str) -> Optional[int]:
+        """Atomically move the oldest runnable job to running; None when the queue is empty"""
+        db = SessionLocal()
+        try:
+            while True:
+                now = datetime.utcnow()
+                candidate = db.query(Job.id).filter(
+                    Job.status == QUEUED,
+                    Job.run_after <= now
+                ).order_by(Job.run_after, Job.id).limit(1).scalar()
+                if candidate is None:
+                    db.commit()
+                    return None
+                # Only one worker's UPDATE matches while the job is still queued
+                claimed = db.query(Job).filter(
+                    Job.id == candidate,
+                    Job.status == QUEUED
+                ).update({
+                    "status": RUNNING,
+                    "worker_id": worker_id,
+                    "attempts": Job.attempts + 1,
+                    "started_at": now,
+                    "heartbeat_at": now,
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    return candidate
+        finally:
+            db.close()
+
+    def _execute(self, job_id: int) -> None:
+        db = SessionLocal()
+        try:
+            job = db.get(Job, job_id)
+            context = JobContext(job, self)
+            attempts, max_attempts = job.attempts, job.max_attempts
+        finally:
+            db.close()
+
+        handler = JOB_HANDLERS.get(context.kind)
+        if handler is None:
+            _update_job(job_id, status=FAILED, error=f"Unknown job kind: {context.kind}", finished_at=datetime.utcnow())
+            return
+
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            logger.info("Job %s (%s) started, attempt %s/%s", job_id, context.kind, attempts, max_attempts)
+            result = handler.function(context)
+        except JobCancelled:
+            logger.info("Job %s (%s) cancelled", job_id, context.kind)
+            _update_job(job_id, status=CANCELLED, finished_at=datetime.utcnow())
+        except JobInterrupted:
+            # Shutting down: give the attempt back and let another worker resume the job
+            logger.info("Job %s (%s) interrupted by shutdown, queued again", job_id, context.kind)
+            _update_job(job_id, status=QUEUED, attempts=Job.attempts - 1, worker_id=None, run_after=datetime.utcnow())
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            if attempts < max_attempts:
+                delay = JOB_RETRY_DELAY_SECONDS * 2 ** (attempts - 1)
+                logger.warning("Job %s (%s) failed, retrying in %ss: %s", job_id, context.kind, delay, error)
+                _update_job(
+                    job_id, status=QUEUED, error=error, worker_id=None,
+                    run_after=datetime.utcnow() + timedelta(seconds=delay)
+                )
+            else:
+                logger.exception("Job %s (%s) failed", job_id, context.kind)
+                _update_job(job_id, status=FAILED, error=error, finished_at=datetime.utcnow())
+        else:
+            logger.info("Job %s (%s) succeeded", job_id, context.kind)
+            _update_job(job_id, status=SUCCEEDED, result=result, error=None, finished_at=datetime.utcnow())
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _heartbeat(self) -> None:
+        """Keep this process's running jobs alive and requeue jobs of dead processes"""
+        interval = max(1.0, JOB_STALE_SECONDS / 4)
+        while not self.stopping.wait(interval):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                now = datetime.utcnow()
+                db = SessionLocal()
+                try:
+                    if running:
+                        db.query(Job).filter(Job.id.in_(running)).update(
+                            {"heartbeat_at": now}, synchronize_session=False
+                        )
+                    recover_stale_jobs(db, now)
+                    db.commit()
+                finally:
+                    db.close()
+            except Exception:
+                logger.exception("Job heartbeat failed")
+
+
+def recover_stale_jobs(db: Session, now: Optional[datetime] = None) -> int:
+    """
+    Requeue running jobs whose worker stopped sending heartbeats
+
+    Jobs that already used all their attempts are marked failed instead, so a
+    job that crashes its process is not retried forever.
+
+    Args:
+        db: Database session (caller commits)
+        now: Current time
+
+    Returns:
+        Number of requeued jobs
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=JOB_STALE_SECONDS)
+    requeued = db.query(Job).filter(
+        Job.status == RUNNING,
+        Job.heartbeat_at < cutoff,
+        Job.attempts < Job.max_attempts
+    ).update({"status": QUEUED, "worker_id": None, "run_after": now}, synchronize_session=False)
+    failed = db.query(Job).filter(
+        Job.status == RUNNING,
+        Job.heartbeat_at < cutoff
+    ).update({
+        "status": FAILED,
+        "error": "Worker stopped while running the job",
+        "finished_at": now,
+    }, synchronize_session=False)
+    if requeued or failed:
+        logger.warning("Jobs abandoned by their worker: %s requeued, %s failed", requeued, failed)
+    return requeued
+
+
+job_pool = JobWorkerPool()
@@ -2,29 +2,71 @@
 FastAPI Main Application
 CoApp 2.0 - Backend API for inventory and purchase management
 """
+import asyncio
 import os
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from app.database import engine, Base
-from app.routers import auth, companies, materials, purchases
+from app.database import engine, get_pool_status
+from app.migrations import ensure_schema
+from app.cache import response_cache
+from app.compression import COMPRESSION_ENABLED, CompressionMiddleware
+from app.idempotency import run_sweeper
+from app.changelog import run_pruner
+from app.events import event_broker, run_tail as run_event_tail
+from app.scans import scan_committer
+from app.valuation import run_updater as run_valuation_updater
+from app.jobs import JOBS_ENABLED, job_pool
+from app.instrumentation import QueryStatsMiddleware
+from app.metrics import MetricsMiddleware, render_metrics
+from app.profiling import PROFILER_ENABLED, ProfilerMiddleware, install_profiler_hooks
+from app.routers import auth, companies, materials, purchases, batch, jobs, stocktakes, scans, sync, events, debug
 
 # Load environment variables
 load_dotenv()
 
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Lifespan context manager for startup/shutdown events
     """
-    # Startup
-    Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created/verified")
+    # Startup: one schema version query (the multi-worker launcher does this once in the master)
+    if os.getenv("DB_INIT_ON_STARTUP", "True").lower() == "true":
+        ensure_schema(engine)
+    # Periodically delete expired idempotency keys
+    sweeper = asyncio.create_task(run_sweeper())
+    # Periodically prune change log entries past the sync token lifetime
+    pruner = asyncio.create_task(run_pruner())
+    # Periodically replay new stock movements into the stored valuations
+    valuation_updater = asyncio.create_task(run_valuation_updater())
+    # Live events follow the change log, so every worker sees every write
+    event_tail = asyncio.create_task(run_event_tail())
+    # Group commit of barcode scans
+    scan_commits = asyncio.create_task(scan_committer.run())
+    # Background job workers (threads in this process; every worker process runs its own)
+    if JOBS_ENABLED:
+        job_pool.start()
     print(f"✅ Server starting on http://{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 8001)}")
     yield
-    # Shutdown (if needed)
+    # Shutdown: running jobs are interrupted and queued again
+    sweeper.cancel()
+    pruner.cancel()
+    valuation_updater.cancel()
+    event_tail.cancel()
+    # Queued scans are stored before the task ends
+    scan_commits.cancel()
+    await asyncio.gather(scan_commits, return_exceptions=True)
+    if JOBS_ENABLED:
+        job_pool.stop()
 
 
 # Create FastAPI application
@@ -53,6 +95,21 @@ extra_origins = os.getenv("CORS_ORIGINS", "")
 if extra_origins:
     allowed_origins.extend(extra_origins.split(","))
 
+# Opt-in request profiling (debug only, admin users, "X-Profile: 1" header)
+if PROFILER_ENABLED:
+    install_profiler_hooks(engine)
+    app.add_middleware(ProfilerMiddleware)
+
+# Negotiated gzip/brotli compression (inside MetricsMiddleware so sizes are bytes on the wire)
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Request metrics (must sit inside QueryStatsMiddleware to read per-request DB time)
+app.add_middleware(MetricsMiddleware)
+
+# Per-request query counting and slow-query logging
+app.add_middleware(QueryStatsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -82,19 +139,45 @@ async def root():
 async def health_check():
     """
     Health check endpoint for monitoring
+    
+    Includes database connection pool usage (checked-out and overflow connections),
+    response cache statistics (hit rate, entries) and open event streams
     """
     return {
         "status": "healthy",
         "api": "CoApp 2.0",
         "version": "2.0.0",
+        "database": get_pool_status(),
+        "cache": response_cache.stats(),
+        "events": {"subscribers": event_broker.subscriber_count, "published": event_broker.published},
     }
 
 
+# Metrics endpoint
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse)
+async def metrics():
+    """
+    Request and database metrics in the Prometheus text format
+    
+    Metrics are kept per process; scrape each worker when running several.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(companies.router)
 app.include_router(materials.router)
 app.include_router(purchases.router)
+app.include_router(batch.router)
+app.include_router(jobs.router)
+app.include_router(stocktakes.router)
+app.include_router(scans.router)
+app.include_router(sync.router)
+app.include_router(events.router)
+
+if PROFILER_ENABLED:
+    app.include_router(debug.router)
 
 
 # Error handlers
@@ -0,0 +1,286 @@
+"""
+Metrics
+In-process request metrics exposed in the Prometheus text format
+"""
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.cache import response_cache
+from app.database import get_pool_status
+from app.instrumentation import get_request_stats
+
+# Default latency buckets in seconds (same as the Prometheus client libraries)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Response size buckets in bytes
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# Queries per request buckets
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100)
+
+# Label used for requests that did not match any route (keeps label cardinality bounded)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape_label(value) -> str:
+    """Escape a label value for the text exposition format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Render a label set as {name="value",...}"""
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value, using integers where possible"""
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """Base class for labelled metrics"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = Lock()
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing counter"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        lines = self.header()
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    type_name = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Cumulative histogram with fixed buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(entry[0]), entry[1], entry[2])) for labels, entry in self._values.items()]
+        lines = self.header()
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.label_names, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector) -> None:
+        """Register a callable returning extra exposition lines at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_COUNT = registry.register(Counter(
+    "http_requests_total", "Total HTTP requests", ("method", "route", "status"),
+))
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency in seconds", ("method", "route"),
+))
+REQUESTS_IN_PROGRESS = registry.register(Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled", ("method",),
+))
+RESPONSE_SIZE = registry.register(Histogram(
+    "http_response_size_bytes", "HTTP response body size in bytes", ("method", "route"), SIZE_BUCKETS,
+))
+REQUEST_DB_TIME = registry.register(Histogram(
+    "http_request_db_duration_seconds", "Time spent executing SQL per HTTP request", ("method", "route"),
+))
+REQUEST_QUERY_COUNT = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request", ("method", "route"), QUERY_COUNT_BUCKETS,
+))
+REQUEST_CONNECTION_HOLD = registry.register(Histogram(
+    "http_request_db_connection_hold_seconds", "Time pooled connections were checked out per HTTP request",
+    ("method", "route"),
+))
+
+
+def collect_pool_metrics() -> List[str]:
+    """Expose database connection pool usage as gauges"""
+    status = get_pool_status()
+    lines: List[str] = []
+    for key, documentation in (
+        ("size", "Configured connection pool size"),
+        ("checked_out", "Connections currently checked out of the pool"),
+        ("overflow", "Overflow connections in use beyond the pool size"),
+    ):
+        if key in status:
+            name = f"db_pool_{key}"
+            lines.extend([
+                f"# HELP {name} {documentation}",
+                f"# TYPE {name} gauge",
+                f"{name} {status[key]}",
+            ])
+    return lines
+
+
+def collect_cache_metrics() -> List[str]:
+    """Expose response cache lookups (this process) and size"""
+    stats = response_cache.stats()
+    lines: List[str] = []
+    for key, metric_type, documentation in (
+        ("hits", "counter", "Response cache hits"),
+        ("misses", "counter", "Response cache misses"),
+        ("invalidations", "counter", "Response cache invalidations after writes"),
+        ("entries", "gauge", "Entries held by the response cache backend"),
+        ("bytes", "gauge", "Bytes held by the response cache backend"),
+    ):
+        if key in stats:
+            name = f"response_cache_{key}" + ("_total" if metric_type == "counter" else "")
+            lines.extend([
+                f"# HELP {name} {documentation}",
+                f"# TYPE {name} {metric_type}",
+                f"{name} {stats[key]}",
+            ])
+    return lines
+
+
+registry.add_collector(collect_pool_metrics)
+registry.add_collector(collect_cache_metrics)
+
+
+def render_metrics() -> str:
+    """
+    Render all registered metrics
+
+    Returns:
+        Metrics in the Prometheus text exposition format (version 0.0.4)
+    """
+    return registry.render()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request count, latency, in-flight requests,
+    response size and database time per route template
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code: Optional[int] = None
+        response_size = 0
+        start = time.perf_counter()
+
+        async def send_with_metrics(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc(method)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            REQUESTS_IN_PROGRESS.dec(method)
+            elapsed = time.perf_counter() - start
+            route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+
+            REQUEST_COUNT.inc(method, route, str(status_code or 500))
+            REQUEST_LATENCY.observe(elapsed, method, route)
+            RESPONSE_SIZE.observe(response_size, method, route)
+
+            stats = get_request_stats()
+            if stats is not None:
+                REQUEST_DB_TIME.observe(stats.db_time, method, route)
+                REQUEST_QUERY_COUNT.observe(stats.query_count, method, route)
+                REQUEST_CONNECTION_HOLD.observe(stats.connection_hold, method, route)
@@ -0,0 +1,463 @@
+"""
+Schema Migrations
+Versioned, forward-only schema changes tracked in the schema_version table
+
+Usage (from the backend directory):
+    python -m app.migrations upgrade    # apply pending migrations
+    python -m app.migrations current    # show the database version
+    python -m app.migrations history    # list migrations and whether they are applied
+
+Startup only compares MAX(schema_version.version) with the newest migration,
+so boot time does not depend on the number of tables. Migration 1 is the
+baseline (create_all): on an existing database every table is already there
+and nothing happens; on a new one tables are created together with the
+indexes declared in the models, which later index migrations then skip.
+Migrations must therefore be idempotent (IF NOT EXISTS, checkfirst=True).
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Callable, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from app.database import Base, engine as default_engine
+
+# Load environment variables
+load_dotenv()
+
+# Apply pending migrations at startup (development); otherwise refuse to start
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", os.getenv("DEBUG", "True")).lower() == "true"
+
+# Arbitrary key for the PostgreSQL advisory lock serializing concurrent upgrades
+MIGRATION_LOCK_ID = 7_302_114
+
+logger = logging.getLogger("app.migrations")
+
+version_metadata = MetaData()
+
+schema_version = Table(
+    "schema_version",
+    version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration:
+    """A numbered schema change"""
+
+    def __init__(self, version: int, name: str, upgrade: Callable[[Connection], None], transactional: bool):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        # Non-transactional migrations run in autocommit mode (e.g. CREATE INDEX CONCURRENTLY)
+        self.transactional = transactional
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str, transactional: bool = True):
+    """
+    Register a migration function
+
+    Args:
+        version: Sequential version number (1, 2, 3, ...)
+        name: Short description
+        transactional: Run inside a transaction (False for online index builds)
+    """
+    def register(function: Callable[[Connection], None]):
+        MIGRATIONS.append(Migration(version, name, function, transactional))
+        MIGRATIONS.sort(key=lambda item: item.version)
+        return function
+    return register
+
+
+def create_index(
+    connection: Connection, name: str, table: str, columns: str, postgresql_using: str = None,
+    unique: bool = False, where: str = None,
+) -> None:
+    """
+    Create an index if it does not exist, without blocking writes on PostgreSQL
+
+    Args:
+        connection: Connection in autocommit mode
+        name: Index name
+        table: Table name
+        columns: Column list as SQL (e.g. "company_id, created_at")
+        postgresql_using: Index method on PostgreSQL (e.g. "gin")
+        unique: Create a unique index
+        where: Predicate of a partial index as SQL
+    """
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    predicate = f" WHERE {where}" if where else ""
+    if connection.dialect.name == "postgresql":
+        # A failed concurrent build leaves an invalid index behind; drop it so the retry rebuilds it
+        invalid = connection.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        using = f" USING {postgresql_using}" if postgresql_using else ""
+        connection.execute(text(
+            f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table}{using} ({columns}){predicate}"
+        ))
+    else:
+        connection.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({columns}){predicate}"))
+
+
+# ============================================================================
+# Migrations
+# ============================================================================
+
+@migration(1, "baseline schema")
+def baseline_schema(connection: Connection) -> None:
+    from app import models  # noqa: F401 - register all tables on Base.metadata
+
+    Base.metadata.create_all(bind=connection)
+
+
+# Composite indexes matching the list endpoints' filter + ORDER BY (also declared on the models)
+COMPOSITE_INDEXES = [
+    ("ix_companies_user_id_created_at", "companies", "user_id, created_at"),
+    ("ix_materials_company_id_created_at", "materials", "company_id, created_at"),
+    ("ix_materials_company_id_sku", "materials", "company_id, sku"),
+    ("ix_material_movements_material_id_created_at", "material_movements", "material_id, created_at"),
+    ("ix_purchases_company_id_purchase_date", "purchases", "company_id, purchase_date"),
+    ("ix_purchase_items_purchase_id_created_at", "purchase_items", "purchase_id, created_at"),
+]
+
+# Trigram indexes serving the ILIKE '%term%' searches (PostgreSQL only)
+SEARCH_INDEXES = [
+    ("ix_companies_name_trgm", "companies", "name gin_trgm_ops"),
+    ("ix_materials_name_trgm", "materials", "name gin_trgm_ops"),
+    ("ix_materials_sku_trgm", "materials", "sku gin_trgm_ops"),
+    ("ix_materials_barcode_trgm", "materials", "barcode gin_trgm_ops"),
+    ("ix_purchases_invoice_number_trgm", "purchases", "invoice_number gin_trgm_ops"),
+    ("ix_purchases_supplier_name_trgm", "purchases", "supplier_name gin_trgm_ops"),
+]
+
+
+@migration(2, "composite and search indexes", transactional=False)
+def composite_and_search_indexes(connection: Connection) -> None:
+    for name, table, columns in COMPOSITE_INDEXES:
+        create_index(connection, name, table, columns)
+
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for name, table, columns in SEARCH_INDEXES:
+            create_index(connection, name, table, columns, postgresql_using="gin")
+
+
+@migration(3, "idempotency keys")
+def idempotency_keys(connection: Connection) -> None:
+    from app.models import IdempotencyKey
+
+    IdempotencyKey.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(4, "jobs")
+def jobs(connection: Connection) -> None:
+    from app.models import Job
+
+    Job.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(5, "movement archive")
+def movement_archive(connection: Connection) -> None:
+    from app.models import MaterialArchiveBalance, MaterialMovementArchive
+
+    MaterialMovementArchive.__table__.create(bind=connection, checkfirst=True)
+    MaterialArchiveBalance.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(6, "inventory valuation")
+def inventory_valuation(connection: Connection) -> None:
+    from app.models import MaterialCostLayer, MaterialValuation
+
+    MaterialCostLayer.__table__.create(bind=connection, checkfirst=True)
+    MaterialValuation.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(7, "change log")
+def change_log(connection: Connection) -> None:
+    from app.models import ChangeLog
+
+    ChangeLog.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(8, "stocktakes")
+def stocktakes(connection: Connection) -> None:
+    from app.models import Stocktake, StocktakeCount
+
+    Stocktake.__table__.create(bind=connection, checkfirst=True)
+    StocktakeCount.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(9, "movement ids never reused")
+def movement_autoincrement(connection: Connection) -> None:
+    """
+    Rebuild material_movements with AUTOINCREMENT on SQLite
+
+    A plain rowid table hands out MAX(id) + 1, so once the newest movements are
+    archived their ids are issued again and collide with the archive. The
+    sequence is seeded past the highest archived id. PostgreSQL sequences
+    never reuse values, so nothing changes there.
+    """
+    from app.models import MaterialMovement
+
+    if connection.dialect.name != "sqlite":
+        return
+
+    table = MaterialMovement.__table__
+    existing = {column["name"] for column in inspect(connection).get_columns("material_movements")}
+    definition = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'material_movements'"
+    )).scalar()
+    if "AUTOINCREMENT" not in definition.upper():
+        indexes = connection.execute(text(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+            "AND tbl_name = 'material_movements' AND sql IS NOT NULL"
+        )).all()
+        for name, _ in indexes:
+            connection.execute(text(f"DROP INDEX {name}"))
+        connection.execute(text("ALTER TABLE material_movements RENAME TO material_movements_rowid"))
+        table.create(bind=connection)
+        # Columns added by later migrations keep their defaults
+        columns = ", ".join(column.name for column in table.columns if column.name in existing)
+        connection.execute(text(
+            f"INSERT INTO material_movements ({columns}) SELECT {columns} FROM material_movements_rowid"
+        ))
+        connection.execute(text("DROP TABLE material_movements_rowid"))
+        # Indexes added by earlier migrations but not declared on the model
+        for name, sql in indexes:
+            exists = connection.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"
+            ), {"name": name}).first()
+            if not exists:
+                connection.execute(text(sql))
+
+    highest = connection.execute(text(
+        "SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM material_movements "
+        "UNION ALL SELECT MAX(id) FROM material_movements_archive)"
+    )).scalar() or 0
+    connection.execute(text("DELETE FROM sqlite_sequence WHERE name = 'material_movements'"))
+    connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('material_movements', :seq)"),
+                       {"seq": highest})
+
+
+@migration(10, "valuation movement count")
+def valuation_movement_count(connection: Connection) -> None:
+    """
+    Count the movements each valuation has replayed
+
+    Existing valuations start at zero, so the next valuation replays every
+    material once and picks up movements an id watermark may have skipped.
+    """
+    columns = {column["name"] for column in inspect(connection).get_columns("material_valuations")}
+    if "movement_count" not in columns:
+        connection.execute(text(
+            "ALTER TABLE material_valuations ADD COLUMN movement_count INTEGER NOT NULL DEFAULT 0"
+        ))
+
+
+
+@migration(11, "change log commit order", transactional=False)
+def change_log_commit_order(connection: Connection) -> None:
+    """
+    Record the writing transaction of change_log entries
+
+    Existing entries keep txid 0 and sort before new ones in id order, so
+    tokens issued before the upgrade stay valid. On PostgreSQL new entries
+    record txid_current().
+    """
+    columns = {column["name"] for column in inspect(connection).get_columns("change_log")}
+    if "txid" not in columns:
+        connection.execute(text("ALTER TABLE change_log ADD COLUMN txid BIGINT NOT NULL DEFAULT 0"))
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("ALTER TABLE change_log ALTER COLUMN txid SET DEFAULT txid_current()"))
+    create_index(connection, "ix_change_log_user_id_txid_id", "change_log", "user_id, txid, id")
+    connection.execute(text("DROP INDEX IF EXISTS ix_change_log_user_id_id"))
+
+
+@migration(12, "valuation commit order")
+def valuation_commit_order(connection: Connection) -> None:
+    """
+    Replay movements in commit order instead of counting them
+
+    Movements record their writing transaction (txid_current() on PostgreSQL)
+    and valuations keep a (txid, id) watermark. The replayed-movement count of
+    migration 10 is dropped. Persisted valuations are discarded so every
+    material is replayed once under the new watermark.
+    """
+    is_postgresql = connection.dialect.name == "postgresql"
+    for table in ("material_movements", "material_movements_archive"):
+        columns = {column["name"] for column in inspect(connection).get_columns(table)}
+        if "txid" not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN txid BIGINT NOT NULL DEFAULT 0"))
+    if is_postgresql:
+        connection.execute(text("ALTER TABLE material_movements ALTER COLUMN txid SET DEFAULT txid_current()"))
+
+    columns = {column["name"] for column in inspect(connection).get_columns("material_valuations")}
+    if "last_txid" not in columns:
+        connection.execute(text("ALTER TABLE material_valuations ADD COLUMN last_txid BIGINT NOT NULL DEFAULT 0"))
+    if "movement_count" in columns:
+        connection.execute(text("ALTER TABLE material_valuations DROP COLUMN movement_count"))
+    connection.execute(text("DELETE FROM material_cost_layers"))
+    connection.execute(text("DELETE FROM material_valuations"))
+
+
+@migration(13, "change log tail", transactional=False)
+def change_log_tail(connection: Connection) -> None:
+    """Index change_log by (txid, id) for the live event tail of all users"""
+    create_index(connection, "ix_change_log_txid_id", "change_log", "txid, id")
+
+
+@migration(14, "job dedupe keys", transactional=False)
+def job_dedupe_keys(connection: Connection) -> None:
+    """Allow one queued or running job per dedupe key (e.g. one delete job per company)"""
+    columns = {column["name"] for column in inspect(connection).get_columns("jobs")}
+    if "dedupe_key" not in columns:
+        connection.execute(text("ALTER TABLE jobs ADD COLUMN dedupe_key VARCHAR(200)"))
+    create_index(
+        connection, "ux_jobs_dedupe_key_active", "jobs", "dedupe_key",
+        unique=True, where="status IN ('queued', 'running')",
+    )
+
+
+# ============================================================================
+# Runner
+# ============================================================================
+
+def latest_version() -> int:
+    """Newest migration version known to this code"""
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def get_current_version(engine: Engine = default_engine) -> int:
+    """
+    Read the database schema version with a single query
+
+    Args:
+        engine: Database engine
+
+    Returns:
+        Highest applied migration version (0 for an unversioned database)
+    """
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # schema_version does not exist yet
+        return 0
+
+
+def upgrade(engine: Engine = default_engine, target: Optional[int] = None) -> List[int]:
+    """
+    Apply pending migrations in order
+
+    Args:
+        engine: Database engine
+        target: Stop after this version (default: newest)
+
+    Returns:
+        Versions that were applied
+    """
+    target = latest_version() if target is None else target
+    applied = []
+    with engine.connect() as lock_connection:
+        if engine.dialect.name == "postgresql":
+            # Only one process migrates; the others wait and then find nothing to do
+            lock_connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            lock_connection.commit()
+        try:
+            version_metadata.create_all(bind=engine)
+            current = get_current_version(engine)
+            for item in MIGRATIONS:
+                if item.version <= current or item.version > target:
+                    continue
+                logger.info("Applying migration %s: %s", item.version, item.name)
+                if item.transactional:
+                    with engine.begin() as connection:
+                        item.upgrade(connection)
+                        _record(connection, item)
+                else:
+                    with engine.connect() as connection:
+                        item.upgrade(connection.execution_options(isolation_level="AUTOCOMMIT"))
+                    with engine.begin() as connection:
+                        _record(connection, item)
+                applied.append(item.version)
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock_connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                lock_connection.commit()
+    return applied
+
+
+def _record(connection: Connection, item: Migration) -> None:
+    """Mark a migration as applied"""
+    connection.execute(schema_version.insert().values(
+        version=item.version, name=item.name, applied_at=datetime.utcnow()
+    ))
+
+
+def ensure_schema(engine: Engine = default_engine, auto_migrate: bool = AUTO_MIGRATE) -> None:
+    """
+    Startup check: make sure the database is at the newest version
+
+    Args:
+        engine: Database engine
+        auto_migrate: Apply pending migrations instead of failing
+
+    Raises:
+        RuntimeError: If migrations are pending and auto_migrate is off
+    """
+    current = get_current_version(engine)
+    latest = latest_version()
+    if current == latest:
+        return
+    if current > latest:
+        logger.warning("Database schema version %s is newer than this code (%s)", current, latest)
+        return
+    if not auto_migrate:
+        raise RuntimeError(
+            f"Database schema is at version {current}, expected {latest}. "
+            "Run: python -m app.migrations upgrade"
+        )
+    applied = upgrade(engine)
+    print(f"✅ Applied database migrations: {', '.join(map(str, applied)) or 'none'}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Manage database schema migrations")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = subcommands.add_parser("upgrade", help="Apply pending migrations")
+    upgrade_parser.add_argument("--target", type=int, help="Stop after this version")
+    subcommands.add_parser("current", help="Show the database schema version")
+    subcommands.add_parser("history", help="List all migrations")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "upgrade":
+        applied = upgrade(target=args.target)
+        print(f"✅ Applied: {', '.join(map(str, applied))}" if applied else "✅ Already up to date")
+        print(f"   Database version: {get_current_version()}")
+    elif args.command == "current":
+        print(f"Database version: {get_current_version()} (latest: {latest_version()})")
+    elif args.command == "history":
+        current = get_current_version()
+        for item in MIGRATIONS:
+            state = "applied" if item.version <= current else "pending"
+            print(f"{item.version:>4}  {state:<8} {item.name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
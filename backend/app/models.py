@@ -3,7 +3,7 @@ Database Models
 SQLAlchemy ORM models for all database tables
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Numeric, Text
+from sqlalchemy import BigInteger, Column, text, Integer, String, Boolean, DateTime, ForeignKey, Numeric, Text, Index, JSON, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -21,7 +21,7 @@ class User(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     # Relationships
-    companies = relationship("Company", back_populates="user", cascade="all, delete-orphan")
+    companies = relationship("Company", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
     material_movements = relationship("MaterialMovement", back_populates="user")
     purchases = relationship("Purchase", back_populates="user")
 
@@ -29,6 +29,10 @@ class User(Base):
 class Company(Base):
     """Company model"""
     __tablename__ = "companies"
+    __table_args__ = (
+        # Composite indexes are rolled out to existing databases by app.migrations
+        Index("ix_companies_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False, index=True)
@@ -40,15 +44,19 @@ class Company(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
-    # Relationships
+    # Relationships (passive_deletes: ON DELETE CASCADE removes child rows without loading them)
     user = relationship("User", back_populates="companies")
-    materials = relationship("Material", back_populates="company", cascade="all, delete-orphan")
-    purchases = relationship("Purchase", back_populates="company", cascade="all, delete-orphan")
+    materials = relationship("Material", back_populates="company", cascade="all, delete-orphan", passive_deletes=True)
+    purchases = relationship("Purchase", back_populates="company", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Material(Base):
     """Material/Product model with inventory tracking"""
     __tablename__ = "materials"
+    __table_args__ = (
+        Index("ix_materials_company_id_created_at", "company_id", "created_at"),
+        Index("ix_materials_company_id_sku", "company_id", "sku"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -65,13 +73,18 @@ class Material(Base):
 
     # Relationships
     company = relationship("Company", back_populates="materials")
-    movements = relationship("MaterialMovement", back_populates="material", cascade="all, delete-orphan")
-    purchase_items = relationship("PurchaseItem", back_populates="material")
+    movements = relationship("MaterialMovement", back_populates="material", cascade="all, delete-orphan", passive_deletes=True)
+    purchase_items = relationship("PurchaseItem", back_populates="material", passive_deletes=True)
 
 
 class MaterialMovement(Base):
     """Stock movement history for materials"""
     __tablename__ = "material_movements"
+    __table_args__ = (
+        Index("ix_material_movements_material_id_created_at", "material_id", "created_at"),
+        # Archived movements keep their ids; SQLite must not hand them out again
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -80,15 +93,84 @@ class MaterialMovement(Base):
     notes = Column(Text, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Writing transaction (txid_current() on PostgreSQL, 0 on SQLite); valuations replay in (txid, id) order
+    txid = Column(BigInteger, nullable=False, server_default="0")
 
     # Relationships
     material = relationship("Material", back_populates="movements")
     user = relationship("User", back_populates="material_movements")
 
 
+class MaterialMovementArchive(Base):
+    """Stock movements older than the archive horizon, moved out of material_movements by app.archive"""
+    __tablename__ = "material_movements_archive"
+    __table_args__ = (
+        Index("ix_material_movements_archive_material_id_created_at", "material_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # Same id as in material_movements
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Numeric(10, 2), nullable=False)
+    reason = Column(String(100), nullable=False)
+    notes = Column(Text, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    txid = Column(BigInteger, nullable=False, server_default="0")
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class MaterialArchiveBalance(Base):
+    """Carry-forward of a material's archived movements"""
+    __tablename__ = "material_archive_balances"
+
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Numeric(12, 2), nullable=False, default=0)  # Sum of archived movement quantities
+    movement_count = Column(Integer, nullable=False, default=0)
+    # Every movement of the material created before this time is in the archive
+    archived_until = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class MaterialCostLayer(Base):
+    """Remaining quantity of one stock receipt at its unit cost (FIFO valuation, app.valuation)"""
+    __tablename__ = "material_cost_layers"
+    __table_args__ = (
+        # Layers are consumed oldest first
+        Index("ix_material_cost_layers_material_id_movement_id", "material_id", "movement_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), nullable=False)
+    movement_id = Column(Integer, nullable=False)  # Inbound movement that created the layer
+    received_at = Column(DateTime, nullable=False)
+    quantity = Column(Numeric(12, 2), nullable=False)  # Not yet consumed
+    unit_cost = Column(Numeric(14, 4), nullable=False)
+
+
+class MaterialValuation(Base):
+    """Valuation state of a material after replaying its movements up to (last_txid, last_movement_id)"""
+    __tablename__ = "material_valuations"
+
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), primary_key=True)
+    last_txid = Column(BigInteger, nullable=False, default=0)
+    last_movement_id = Column(Integer, nullable=False, default=0)
+    quantity = Column(Numeric(12, 2), nullable=False, default=0)
+    fifo_value = Column(Numeric(14, 2), nullable=False, default=0)
+    wac_unit_cost = Column(Numeric(14, 4), nullable=False, default=0)  # Weighted average cost
+    wac_value = Column(Numeric(14, 2), nullable=False, default=0)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    # Concurrent catch-ups of the same material fail with StaleDataError instead of double-counting
+    __mapper_args__ = {"version_id_col": version}
+
+
 class Purchase(Base):
     """Purchase/Order model"""
     __tablename__ = "purchases"
+    __table_args__ = (
+        Index("ix_purchases_company_id_purchase_date", "company_id", "purchase_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -106,12 +188,15 @@ class Purchase(Base):
     # Relationships
     company = relationship("Company", back_populates="purchases")
     user = relationship("User", back_populates="purchases")
-    items = relationship("PurchaseItem", back_populates="purchase", cascade="all, delete-orphan")
+    items = relationship("PurchaseItem", back_populates="purchase", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class PurchaseItem(Base):
     """Individual items in a purchase"""
     __tablename__ = "purchase_items"
+    __table_args__ = (
+        Index("ix_purchase_items_purchase_id_created_at", "purchase_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     purchase_id = Column(Integer, ForeignKey("purchases.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -125,3 +210,105 @@ class PurchaseItem(Base):
     # Relationships
     purchase = relationship("Purchase", back_populates="items")
     material = relationship("Material", back_populates="purchase_items")
+
+
+class IdempotencyKey(Base):
+    """Stored outcome of a request sent with an Idempotency-Key header"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)  # SHA-256 of method, path and body
+    status_code = Column(Integer, nullable=True)  # NULL while the first request is still running
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class Job(Base):
+    """Background job run by the in-process worker pool (app.jobs)"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Workers claim the oldest runnable job
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_user_id_created_at", "user_id", "created_at"),
+        # At most one queued or running job per dedupe key
+        Index(
+            "ux_jobs_dedupe_key_active", "dedupe_key", unique=True,
+            sqlite_where=text("status IN ('queued', 'running')"),
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
+    kind = Column(String(100), nullable=False)
+    params = Column(JSON, nullable=False, default=dict)
+    dedupe_key = Column(String(200), nullable=True)  # e.g. "delete_company:42"
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, succeeded, failed, cancelled
+    progress_current = Column(Integer, nullable=False, default=0)
+    progress_total = Column(Integer, nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=1)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker_id = Column(String(100), nullable=True)
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False)
+    heartbeat_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class ChangeLog(Base):
+    """One create, update or delete of a synced row, recorded by app.changelog for GET /sync and live events"""
+    __tablename__ = "change_log"
+    __table_args__ = (
+        # Sync reads a user's entries after a (txid, id) cursor
+        Index("ix_change_log_user_id_txid_id", "user_id", "txid", "id"),
+        # Live events follow the entries of all users
+        Index("ix_change_log_txid_id", "txid", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # Writing transaction (txid_current() on PostgreSQL, 0 on SQLite); (txid, id) is the sync cursor
+    txid = Column(BigInteger, nullable=False, server_default="0")
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    company_id = Column(Integer, nullable=True)  # No foreign key: tombstones outlive the company
+    entity = Column(String(30), nullable=False)  # companies, materials, movements, purchases, purchase_items
+    entity_id = Column(Integer, nullable=False)
+    operation = Column(String(10), nullable=False)  # upsert, delete
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class Stocktake(Base):
+    """Physical inventory count of a company, reconciled with current_stock when closed"""
+    __tablename__ = "stocktakes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    status = Column(String(20), nullable=False, default="open")  # open, closed
+    notes = Column(Text, nullable=True)
+    counted_items = Column(Integer, nullable=False, default=0)
+    adjusted_items = Column(Integer, nullable=True)  # Set when closed
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    closed_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class StocktakeCount(Base):
+    """Counted quantity of one material in a stocktake"""
+    __tablename__ = "stocktake_counts"
+
+    stocktake_id = Column(Integer, ForeignKey("stocktakes.id", ondelete="CASCADE"), primary_key=True)
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), primary_key=True, index=True)
+    counted_quantity = Column(Numeric(10, 2), nullable=False)
+    expected_quantity = Column(Numeric(10, 2), nullable=True)  # current_stock when the stocktake was closed
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
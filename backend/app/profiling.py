@@ -0,0 +1,287 @@
+"""
+Request Profiling
+Opt-in sampling profiler for single requests, exported as speedscope profiles
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+from app.auth import decode_token, is_admin_email
+
+# Load environment variables
+load_dotenv()
+
+# Profiling is a debug feature; it is only installed when explicitly enabled
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "False").lower() == "true"
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "1"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+
+# Request header that asks for a profile
+PROFILE_HEADER = b"x-profile"
+
+# Maximum stack depth recorded per sample
+MAX_STACK_DEPTH = 128
+
+_ROUTERS_PATH = os.path.join("app", "routers") + os.sep
+
+_active_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+
+
+class RequestProfile:
+    """Samples the stack of one thread and collects SQL timings by router call site"""
+
+    def __init__(self, name: str, thread_id: int, interval: float):
+        self.name = name
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames: List[dict] = []
+        self._frame_index: Dict[Tuple[str, str, int], int] = {}
+        self.samples: List[List[int]] = []
+        self.weights: List[float] = []
+        self.sql_samples: List[List[int]] = []
+        self.sql_weights: List[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _frame_id(self, name: str, file: str, line: int) -> int:
+        key = (name, file, line)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self.frames)
+            self.frames.append({"name": name, "file": file, "line": line})
+        return index
+
+    def _stack(self, frame) -> List[int]:
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append(self._frame_id(code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                self.samples.append(self._stack(frame))
+                self.weights.append((now - last) * 1000)
+            last = now
+
+    def start(self):
+        self._thread.start()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def record_sql(self, statement: str, elapsed: float, call_site: Optional[Tuple[str, str, int]]):
+        """Attribute a statement's duration to the router function that issued it"""
+        stack = []
+        if call_site is not None:
+            stack.append(self._frame_id(*call_site))
+        stack.append(self._frame_id("SQL " + " ".join(statement.split())[:200], "", 0))
+        self.sql_samples.append(stack)
+        self.sql_weights.append(elapsed * 1000)
+
+    def to_speedscope(self) -> dict:
+        """
+        Export the profile in the speedscope file format
+
+        Returns:
+            Dictionary with a wall-clock sampled profile and a SQL-by-call-site profile
+        """
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "coapp-request-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": f"{self.name} (wall clock)",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": sum(self.weights),
+                    "samples": self.samples,
+                    "weights": self.weights,
+                },
+                {
+                    "type": "sampled",
+                    "name": f"{self.name} (SQL by call site)",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": sum(self.sql_weights),
+                    "samples": self.sql_samples,
+                    "weights": self.sql_weights,
+                },
+            ],
+        }
+
+
+def _router_call_site() -> Optional[Tuple[str, str, int]]:
+    """Find the innermost frame in app/routers/*.py on the current stack"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if _ROUTERS_PATH in filename:
+            return (frame.f_code.co_name, filename, frame.f_lineno)
+        frame = frame.f_back
+    return None
+
+
+def install_profiler_hooks(engine: Engine) -> None:
+    """
+    Register cursor events that attribute SQL time to router call sites while profiling
+
+    Args:
+        engine: Engine to instrument
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _active_profile.get() is not None:
+            conn.info.setdefault("profile_start_time", []).append((time.perf_counter(), _router_call_site()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _active_profile.get()
+        if profile is not None and conn.info.get("profile_start_time"):
+            started, call_site = conn.info["profile_start_time"].pop()
+            profile.record_sql(statement, time.perf_counter() - started, call_site)
+
+
+def _is_admin_request(scope) -> bool:
+    """Check the bearer token of a request against ADMIN_EMAILS"""
+    from app.database import SessionLocal
+    from app.models import User
+
+    authorization = dict(scope.get("headers", [])).get(b"authorization", b"").decode()
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+
+    payload = decode_token(token)
+    if not payload or payload.get("sub") is None:
+        return False
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == int(payload["sub"])).first()
+        return user is not None and user.is_active and is_admin_email(user.email)
+    except (ValueError, TypeError):
+        return False
+    finally:
+        db.close()
+
+
+def save_profile(profile: RequestProfile) -> str:
+    """
+    Write a profile to PROFILE_DIR
+
+    Args:
+        profile: Finished request profile
+
+    Returns:
+        Profile ID (file name without directory)
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", profile.name).strip("-")
+    profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{slug}.speedscope.json"
+    with open(os.path.join(PROFILE_DIR, profile_id), "w") as f:
+        json.dump(profile.to_speedscope(), f)
+    return profile_id
+
+
+def get_profile_path(profile_id: str) -> Optional[str]:
+    """
+    Resolve a stored profile ID to a file path
+
+    Args:
+        profile_id: ID returned in the X-Profile-Id header
+
+    Returns:
+        Path to the profile file, or None if the ID is invalid or missing
+    """
+    if os.path.basename(profile_id) != profile_id or not profile_id.endswith(".speedscope.json"):
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware that profiles requests carrying "X-Profile: 1" from admin users
+
+    The profile is stored in PROFILE_DIR and its ID is returned in the X-Profile-Id
+    header; download it from /debug/profiles/{profile_id} and open it in speedscope.
+    Samples cover the whole event loop thread, so profile under low concurrency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or dict(scope.get("headers", [])).get(PROFILE_HEADER) != b"1":
+            await self.app(scope, receive, send)
+            return
+
+        # The user lookup is a blocking query; keep it off the event loop
+        if not await run_in_threadpool(_is_admin_request, scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(
+            f"{scope['method']} {scope['path']}",
+            threading.get_ident(),
+            PROFILER_INTERVAL_MS / 1000,
+        )
+        pending_start = None
+        saved = False
+
+        async def send_with_profile(message):
+            nonlocal pending_start, saved
+            # Hold back the response start until the profile is written so its ID can be sent
+            if message["type"] == "http.response.start":
+                pending_start = message
+                return
+            if message["type"] == "http.response.body" and pending_start is not None:
+                if not message.get("more_body", False):
+                    profile.stop()
+                    profile_id = save_profile(profile)
+                    saved = True
+                    headers = list(pending_start.get("headers", []))
+                    headers.append((b"x-profile-id", profile_id.encode()))
+                    await send({**pending_start, "headers": headers})
+                else:
+                    await send(pending_start)
+                pending_start = None
+            await send(message)
+
+        token = _active_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _active_profile.reset(token)
+            if not profile.stopped:
+                profile.stop()
+            if not saved:
+                # Streaming or failed responses: the profile is stored without a header
+                save_profile(profile)
@@ -0,0 +1,205 @@
+"""
+Reorder Engine
+Vectorized reorder points and order quantities from consumption history
+
+All materials of a company are evaluated at once: one query returns the
+consumption totals of every material as columns (summed per day, then per
+material, so only one row per consuming material leaves the database) and
+NumPy computes the statistics for the whole column at a time. No Python code
+runs per SKU apart from building the response rows.
+
+For every material:
+    daily_usage       mean consumption per day over the observed days
+    usage_std         standard deviation of daily consumption
+    days_of_cover     current_stock / daily_usage (null without consumption)
+    safety_stock      z(service_level) * usage_std * sqrt(lead_time_days)
+    reorder_point     daily_usage * lead_time_days + safety_stock
+    reorder_quantity  order-up-to level (reorder_point + daily_usage * review_days)
+                      minus current_stock, when current_stock <= reorder_point
+
+Consumption is every negative movement (sales, damage, negative adjustments),
+from the hot and archive tables alike.
+"""
+import os
+from datetime import datetime, timedelta
+from statistics import NormalDist
+from typing import List
+import numpy as np
+from sqlalchemy import Float, func, select, type_coerce, union_all
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.database import release_connection
+from app.models import Material, MaterialMovement, MaterialMovementArchive
+
+# Load environment variables
+load_dotenv()
+
+REORDER_LOOKBACK_DAYS = int(os.getenv("REORDER_LOOKBACK_DAYS", "90"))
+REORDER_LEAD_TIME_DAYS = float(os.getenv("REORDER_LEAD_TIME_DAYS", "7"))
+REORDER_REVIEW_DAYS = float(os.getenv("REORDER_REVIEW_DAYS", "14"))
+REORDER_SERVICE_LEVEL = float(os.getenv("REORDER_SERVICE_LEVEL", "0.95"))
+
+SUGGESTION_FIELDS = (
+    "material_id",
+    "sku",
+    "name",
+    "unit",
+    "current_stock",
+    "min_stock",
+    "daily_usage",
+    "usage_std",
+    "days_of_cover",
+    "safety_stock",
+    "reorder_point",
+    "reorder_quantity",
+    "needs_reorder",
+)
+
+
+def consumption_totals(db: Session, company_id: int, since: datetime):
+    """
+    Total and sum of squared daily consumption per material, as columns
+
+    Movements are summed per material and day first, then per material, so
+    one row per consuming material leaves the database.
+
+    Args:
+        db: Database session
+        company_id: Company ID
+        since: Start of the lookback window
+
+    Returns:
+        (material_ids, totals, squared_totals) NumPy arrays
+    """
+    company_materials = select(Material.id).where(Material.company_id == company_id)
+    movements = union_all(*(
+        select(
+            model.material_id.label("material_id"),
+            func.date(model.created_at).label("day"),
+            model.quantity.label("quantity"),
+        ).where(
+            model.material_id.in_(company_materials),
+            model.created_at >= since,
+            model.quantity < 0,
+        )
+        for model in (MaterialMovement, MaterialMovementArchive)
+    )).subquery()
+    daily = select(
+        movements.c.material_id,
+        type_coerce(-func.sum(movements.c.quantity), Float).label("quantity"),
+    ).group_by(movements.c.material_id, movements.c.day).subquery()
+
+    rows = db.connection().execute(
+        select(
+            daily.c.material_id,
+            func.sum(daily.c.quantity),
+            func.sum(daily.c.quantity * daily.c.quantity),
+        ).group_by(daily.c.material_id)
+    ).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+
+    material_ids, totals, squared_totals = zip(*rows)
+    return (
+        np.fromiter(material_ids, dtype=np.int64, count=len(rows)),
+        np.fromiter(totals, dtype=np.float64, count=len(rows)),
+        np.fromiter(squared_totals, dtype=np.float64, count=len(rows)),
+    )
+
+
+def reorder_suggestions(
+    db: Session,
+    company_id: int,
+    lookback_days: int = REORDER_LOOKBACK_DAYS,
+    lead_time_days: float = REORDER_LEAD_TIME_DAYS,
+    review_days: float = REORDER_REVIEW_DAYS,
+    service_level: float = REORDER_SERVICE_LEVEL,
+    only_needed: bool = False,
+) -> List[dict]:
+    """
+    Compute reorder suggestions for every material of a company
+
+    Args:
+        db: Database session
+        company_id: Company ID
+        lookback_days: Days of history to learn consumption from
+        lead_time_days: Days between ordering and receiving stock
+        review_days: Days of consumption an order should cover beyond the reorder point
+        service_level: Probability of not running out during the lead time (0.5-0.999)
+        only_needed: Only return materials at or below their reorder point
+
+    Returns:
+        Suggestions ordered by days of cover (most urgent first)
+    """
+    now = datetime.utcnow()
+    since = now - timedelta(days=lookback_days)
+
+    materials = db.connection().execute(
+        select(
+            Material.id,
+            Material.sku,
+            Material.name,
+            Material.unit,
+            type_coerce(Material.current_stock, Float),
+            type_coerce(Material.min_stock, Float),
+            Material.created_at,
+        ).where(Material.company_id == company_id).order_by(Material.id)
+    ).all()
+    if not materials:
+        return []
+    ids, skus, names, units, stock, min_stock, created = zip(*materials)
+    count = len(ids)
+    ids = np.fromiter(ids, dtype=np.int64, count=count)
+    skus, names, units = (np.array(column, dtype=object) for column in (skus, names, units))
+    stock = np.fromiter(stock, dtype=np.float64, count=count)
+    min_stock = np.fromiter(min_stock, dtype=np.float64, count=count)
+
+    # Materials younger than the window are measured over their own lifetime
+    age_days = np.fromiter(((now - value).total_seconds() for value in created), dtype=np.float64, count=count) / 86400
+    observed_days = np.clip(np.ceil(age_days), 1, lookback_days)
+
+    consuming_ids, totals, squared_totals = consumption_totals(db, company_id, since)
+    # The arithmetic below needs no database connection
+    release_connection(db)
+    index = np.searchsorted(ids, consuming_ids)
+    total = np.bincount(index, weights=totals, minlength=count)
+    total_squares = np.bincount(index, weights=squared_totals, minlength=count)
+
+    # Days without movements count as zero consumption
+    daily_usage = total / observed_days
+    variance = np.maximum(total_squares / observed_days - daily_usage ** 2, 0.0)
+    variance = np.where(observed_days > 1, variance * observed_days / np.maximum(observed_days - 1, 1), 0.0)
+    usage_std = np.sqrt(variance)
+
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = z * usage_std * np.sqrt(lead_time_days)
+    reorder_point = daily_usage * lead_time_days + safety_stock
+    needs_reorder = (daily_usage > 0) & (stock <= reorder_point)
+    order_up_to = reorder_point + daily_usage * review_days
+    reorder_quantity = np.where(needs_reorder, np.ceil(np.maximum(order_up_to - stock, 0.0)), 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(daily_usage > 0, stock / daily_usage, np.inf)
+
+    # Most urgent first; materials without consumption (infinite cover) last
+    order = np.argsort(days_of_cover, kind="stable")
+    if only_needed:
+        order = order[needs_reorder[order]]
+    # NaN is encoded as null by orjson
+    days_of_cover = np.where(np.isinf(days_of_cover), np.nan, days_of_cover)
+
+    columns = (
+        ids[order].tolist(),
+        skus[order].tolist(),
+        names[order].tolist(),
+        units[order].tolist(),
+        stock[order].tolist(),
+        min_stock[order].tolist(),
+        np.round(daily_usage[order], 3).tolist(),
+        np.round(usage_std[order], 3).tolist(),
+        np.round(days_of_cover[order], 1).tolist(),
+        np.round(safety_stock[order], 2).tolist(),
+        np.round(reorder_point[order], 2).tolist(),
+        reorder_quantity[order].tolist(),
+        needs_reorder[order].tolist(),
+    )
+    return [dict(zip(SUGGESTION_FIELDS, row)) for row in zip(*columns)]
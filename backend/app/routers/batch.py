@@ -0,0 +1,199 @@
+"""
+Batch Router
+Run several API operations in one HTTP request
+"""
+import logging
+import os
+from typing import List, Tuple
+from urllib.parse import urlsplit
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy.orm import Session
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from dotenv import load_dotenv
+from app.cache import response_cache
+from app.database import SessionLocal, engine, get_db, release_connection
+from app.dependencies import get_current_user
+from app.models import User
+from app.schemas import BatchOperation, BatchRequest, BatchResponse
+from app.serialization import ORJSONResponse, dumps
+
+# Load environment variables
+load_dotenv()
+
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "50"))
+
+# Result reported for operations skipped after a failure in transaction mode
+NOT_EXECUTED = (status.HTTP_424_FAILED_DEPENDENCY, dumps({"detail": "Not executed: the batch was rolled back"}))
+
+logger = logging.getLogger("app.batch")
+
+router = APIRouter(prefix="/batch", tags=["Batch"])
+
+# Routes that cannot run as an operation: nested batches, scans (stored by the group commit in its
+# own transaction, so a batch transaction could not roll them back) and the never-ending event stream
+UNBATCHED_PREFIXES = (router.prefix, "/scans", "/events")
+
+
+def is_unbatched(path: str) -> bool:
+    """Whether an operation path belongs to a route that cannot run inside a batch"""
+    path = urlsplit(path).path.rstrip("/")
+    return any(path == prefix or path.startswith(prefix + "/") for prefix in UNBATCHED_PREFIXES)
+
+
+async def call_route(request: Request, operation: BatchOperation, state: dict) -> Tuple[int, bytes]:
+    """
+    Dispatch one operation to the application's routes in-process
+
+    The sub-request skips the middleware stack and shares `state` (database
+    session and authenticated user) with the batch.
+
+    Args:
+        request: The batch request
+        operation: Operation to run
+        state: request.state contents for the sub-request
+
+    Returns:
+        Status code and JSON-encoded response body
+    """
+    url = urlsplit(operation.path)
+    body = b"" if operation.body is None else dumps(operation.body)
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    authorization = request.headers.get("authorization")
+    if authorization:
+        headers.append((b"authorization", authorization.encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": "1.1",
+        "method": operation.method,
+        "scheme": request.url.scheme,
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "root_path": request.scope.get("root_path", ""),
+        "headers": headers,
+        "client": request.scope.get("client"),
+        "server": request.scope.get("server"),
+        "app": request.app,
+        "state": state,
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        return {"type": "http.disconnect"}
+
+    response_status = status.HTTP_500_INTERNAL_SERVER_ERROR
+    content_type = b""
+    chunks: List[bytes] = []
+
+    async def send(message):
+        nonlocal response_status, content_type
+        if message["type"] == "http.response.start":
+            response_status = message["status"]
+            content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    try:
+        await request.app.router(scope, receive, send)
+    except StarletteHTTPException as exc:
+        return exc.status_code, dumps({"detail": exc.detail})
+    except RequestValidationError as exc:
+        return status.HTTP_422_UNPROCESSABLE_ENTITY, dumps({"detail": jsonable_encoder(exc.errors())})
+    except Exception:
+        logger.exception("Batch operation %s %s failed", operation.method, operation.path)
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, dumps({"detail": "Internal Server Error"})
+
+    content = b"".join(chunks)
+    if not content:
+        return response_status, b"null"
+    if b"json" not in content_type:
+        return response_status, dumps(content.decode(errors="replace"))
+    return response_status, content
+
+
+def batch_response(committed: bool, results: List[Tuple[int, bytes]]) -> ORJSONResponse:
+    """Assemble the batch response from already encoded sub-response bodies"""
+    responses = b",".join(b'{"status":%d,"body":%s}' % (code, content) for code, content in results)
+    return ORJSONResponse(b'{"committed":%s,"responses":[%s]}' % (b"true" if committed else b"false", responses))
+
+
+@router.post("", response_model=BatchResponse)
+async def run_batch(
+    batch: BatchRequest,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Run several API operations in one request
+
+    - **requests**: Operations, each with method, path (e.g. `/materials/5/stock/adjust`) and optional JSON body
+    - **transaction**: Run all operations in one database transaction (default: false)
+
+    Operations run in order with a single authentication check and one database
+    session. Without a transaction every operation commits on its own and later
+    operations still run after a failure. With a transaction the first failure
+    rolls everything back and the remaining operations are reported as 424.
+
+    Returns committed flag and one status/body pair per operation
+    """
+    if len(batch.requests) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {BATCH_MAX_OPERATIONS} operations"
+        )
+    for operation in batch.requests:
+        if is_unbatched(operation.path):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{urlsplit(operation.path).path} cannot run inside a batch"
+            )
+
+    results: List[Tuple[int, bytes]] = []
+
+    if not batch.transaction:
+        state = {"db": db, "current_user": current_user}
+        for operation in batch.requests:
+            result = await call_route(request, operation, state)
+            if result[0] >= 400:
+                # Discard whatever the failed operation left in the session
+                db.rollback()
+            results.append(result)
+        return batch_response(True, results)
+
+    # One connection-level transaction; commits issued by the handlers do not end it
+    release_connection(db)
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        session = SessionLocal(bind=connection, join_transaction_mode="rollback_only")
+        # Attach the user to the batch session so profile changes are part of the transaction
+        state = {"db": session, "current_user": session.merge(current_user, load=False)}
+        failed = False
+        try:
+            with response_cache.deferred() as invalidations:
+                for operation in batch.requests:
+                    if failed:
+                        results.append(NOT_EXECUTED)
+                        continue
+                    result = await call_route(request, operation, state)
+                    results.append(result)
+                    failed = result[0] >= 400
+            if failed:
+                transaction.rollback()
+            else:
+                transaction.commit()
+                for company_id, user_id in set(invalidations):
+                    response_cache.invalidate(company_id, user_id)
+        except BaseException:
+            transaction.rollback()
+            raise
+        finally:
+            session.close()
+
+    return batch_response(not failed, results)
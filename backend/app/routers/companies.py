@@ -2,20 +2,123 @@
 Companies Router
 CRUD operations for companies
 """
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from decimal import Decimal
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import User, Company
-from app.schemas import CompanyCreate, CompanyUpdate, CompanyResponse, MessageResponse
+from app.database import get_db, release_connection
+from app.models import User, Company, Material, Purchase
+from app.schemas import (
+    CompanyCreate,
+    CompanyUpdate,
+    CompanyResponse,
+    CompanyStatsResponse,
+    JobResponse,
+    MessageResponse,
+    ReorderSuggestion,
+    ValuationResponse,
+)
 from app.dependencies import get_current_user
+from app.serialization import ORJSONResponse, dumps, parse_fields, rows_to_dicts, schema_columns
+from app.cache import response_cache
+from app.deletion import DELETE_INLINE_MAX_ROWS, company_row_count
+from app.jobs import active_job, enqueue
+from app.reorder import (
+    REORDER_LEAD_TIME_DAYS,
+    REORDER_LOOKBACK_DAYS,
+    REORDER_REVIEW_DAYS,
+    REORDER_SERVICE_LEVEL,
+    reorder_suggestions,
+)
+from app.valuation import company_valuation, reset_valuations, update_valuations
+from app.conditional import (
+    conditional_list_response,
+    etag_matches,
+    make_etag,
+    not_modified_response,
+    set_conditional_headers,
+)
 
 router = APIRouter(prefix="/companies", tags=["Companies"])
 
 
-@router.get("/", response_model=List[CompanyResponse])
+def verify_company_ownership(company_id: int, user_id: int, db: Session) -> None:
+    """Helper function to verify company ownership without loading the row"""
+    company = db.query(Company.id).filter(
+        Company.id == company_id,
+        Company.user_id == user_id
+    ).first()
+    
+    if not company:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Company not found"
+        )
+
+
+def add_company_stats(db: Session, query, user_id: int):
+    """
+    Helper function to add per-company aggregates to a company query
+
+    Materials and purchases are grouped per company in derived tables and
+    outer-joined, so the whole list is one statement without row fan-out.
+    Adds material_count, stock_value, low_stock_count, open_purchase_count and
+    three timestamps (company, latest material, latest purchase) as trailing columns.
+    """
+    owned_companies = db.query(Company.id).filter(Company.user_id == user_id)
+    material_stats = db.query(
+        Material.company_id.label("company_id"),
+        func.count().label("material_count"),
+        func.sum(Material.current_stock * func.coalesce(Material.unit_price, 0)).label("stock_value"),
+        func.sum(case((Material.current_stock <= Material.min_stock, 1), else_=0)).label("low_stock_count"),
+        func.max(Material.updated_at).label("last_material_at"),
+    ).filter(Material.company_id.in_(owned_companies)).group_by(Material.company_id).subquery()
+    purchase_stats = db.query(
+        Purchase.company_id.label("company_id"),
+        func.sum(case((Purchase.status == "pending", 1), else_=0)).label("open_purchase_count"),
+        func.max(Purchase.updated_at).label("last_purchase_at"),
+    ).filter(Purchase.company_id.in_(owned_companies)).group_by(Purchase.company_id).subquery()
+
+    return query.outerjoin(
+        material_stats, material_stats.c.company_id == Company.id
+    ).outerjoin(
+        purchase_stats, purchase_stats.c.company_id == Company.id
+    ).add_columns(
+        func.coalesce(material_stats.c.material_count, 0),
+        func.coalesce(material_stats.c.stock_value, 0),
+        func.coalesce(material_stats.c.low_stock_count, 0),
+        func.coalesce(purchase_stats.c.open_purchase_count, 0),
+        Company.updated_at,
+        material_stats.c.last_material_at,
+        purchase_stats.c.last_purchase_at,
+    )
+
+
+def company_stats_dicts(rows, fields) -> List[dict]:
+    """Helper function to turn rows of add_company_stats() queries into CompanyStatsResponse dictionaries"""
+    count = len(fields)
+    companies = rows_to_dicts(rows, fields)
+    for company, row in zip(companies, rows):
+        material_count, stock_value, low_stock_count, open_purchase_count = row[count:count + 4]
+        company.update(
+            material_count=material_count,
+            stock_value=Decimal(stock_value).quantize(Decimal("0.01")),
+            low_stock_count=low_stock_count,
+            open_purchase_count=open_purchase_count,
+            last_activity_at=max(moment for moment in row[count + 4:] if moment is not None),
+        )
+    return companies
+
+
+@router.get("/", response_model=List[Union[CompanyResponse, CompanyStatsResponse]])
 async def get_companies(
+    request: Request,
     search: Optional[str] = Query(None, description="Search by company name"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (e.g. id,name)"),
+    with_stats: bool = Query(False, description="Add material count, stock value, low-stock count, open purchases and last activity"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -23,22 +126,46 @@ async def get_companies(
     Get all companies for the current user
     
     - **search**: Optional search query to filter by company name
+    - **fields**: Only return these fields, e.g. `id,name` for a dropdown (optional, id is always included)
+    - **with_stats**: Add `material_count`, `stock_value`, `low_stock_count`, `open_purchase_count`
+      and `last_activity_at` to every company, computed in the same query (default: false)
     
-    Returns list of companies owned by the current user
+    Returns list of companies owned by the current user (supports If-None-Match / 304 without with_stats)
     """
-    query = db.query(Company).filter(Company.user_id == current_user.id)
+    fields = parse_fields(CompanyResponse, fields)
+    
+    # Serve from cache when nothing changed since the last identical request
+    cache_entry = response_cache.entry("companies", current_user.id, None, request.url.query)
+    cached = cache_entry.response(request)
+    if cached is not None:
+        return cached
+    
+    query = db.query(*schema_columns(Company, CompanyResponse, fields)).filter(Company.user_id == current_user.id)
     
     # Apply search filter if provided
     if search:
         query = query.filter(Company.name.ilike(f"%{search}%"))
     
-    companies = query.order_by(Company.created_at.desc()).all()
-    return [CompanyResponse.model_validate(c) for c in companies]
+    if with_stats:
+        # Stats change without touching companies.updated_at, so no ETag; the cache still applies
+        rows = add_company_stats(db, query, current_user.id).order_by(Company.created_at.desc()).all()
+        release_connection(db)
+        return cache_entry.store(ORJSONResponse(dumps(company_stats_dicts(rows, fields))))
+    
+    return cache_entry.store(conditional_list_response(
+        request,
+        current_user.id,
+        query.order_by(Company.created_at.desc()),
+        fields,
+        Company.updated_at,
+    ))
 
 
 @router.get("/{company_id}", response_model=CompanyResponse)
 async def get_company(
     company_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -47,8 +174,19 @@ async def get_company(
     
     - **company_id**: Company ID
     
-    Returns company data
+    Returns company data (supports If-None-Match / 304)
     """
+    # Answer revalidation from the timestamp alone, without loading the row
+    if request.headers.get("if-none-match"):
+        updated_at = db.query(Company.updated_at).filter(
+            Company.id == company_id,
+            Company.user_id == current_user.id
+        ).scalar()
+        if updated_at is not None:
+            etag = make_etag(request, current_user.id, 1, updated_at)
+            if etag_matches(request, etag):
+                return not_modified_response(etag, updated_at)
+    
     company = db.query(Company).filter(
         Company.id == company_id,
         Company.user_id == current_user.id
@@ -60,9 +198,103 @@ async def get_company(
             detail="Company not found"
         )
     
+    set_conditional_headers(response, make_etag(request, current_user.id, 1, company.updated_at), company.updated_at)
     return CompanyResponse.model_validate(company)
 
 
+@router.get("/{company_id}/reorder-suggestions", response_model=List[ReorderSuggestion])
+async def get_reorder_suggestions(
+    company_id: int,
+    request: Request,
+    lookback_days: int = Query(REORDER_LOOKBACK_DAYS, ge=7, le=730, description="Days of history to learn consumption from"),
+    lead_time_days: float = Query(REORDER_LEAD_TIME_DAYS, ge=0, le=365, description="Days between ordering and receiving stock"),
+    review_days: float = Query(REORDER_REVIEW_DAYS, ge=0, le=365, description="Days of consumption an order should cover"),
+    service_level: float = Query(REORDER_SERVICE_LEVEL, ge=0.5, le=0.999, description="Probability of not running out"),
+    only_needed: bool = Query(False, description="Only materials at or below their reorder point"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get suggested reorder points and quantities for every material of a company
+    
+    - **company_id**: Company ID
+    - **lookback_days**: Days of movement history to use (default: 90)
+    - **lead_time_days**: Supplier lead time in days (default: 7)
+    - **review_days**: Days between orders; an order covers this much consumption (default: 14)
+    - **service_level**: Target probability of not running out during the lead time (default: 0.95)
+    - **only_needed**: Only return materials that should be reordered now
+    
+    Returns suggestions ordered by days of cover, most urgent first.
+    Cached until the company's stock changes.
+    """
+    verify_company_ownership(company_id, current_user.id, db)
+    
+    cache_entry = response_cache.entry("reorder", current_user.id, company_id, request.url.query)
+    cached = cache_entry.response(request)
+    if cached is not None:
+        return cached
+    
+    suggestions = reorder_suggestions(
+        db,
+        company_id,
+        lookback_days=lookback_days,
+        lead_time_days=lead_time_days,
+        review_days=review_days,
+        service_level=service_level,
+        only_needed=only_needed,
+    )
+    return cache_entry.store(ORJSONResponse(dumps(suggestions)))
+
+
+@router.get("/{company_id}/valuation", response_model=ValuationResponse)
+async def get_valuation(
+    company_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the inventory value of a company with FIFO and weighted average cost
+    
+    - **company_id**: Company ID
+    
+    Read from the stored valuation state, which a background task brings up to
+    date every VALUATION_UPDATE_SECONDS; the request itself writes nothing.
+    Receipts are costed at the latest completed purchase price of the material.
+    Returns totals and per-material quantity, FIFO value, average unit cost and average value
+    """
+    verify_company_ownership(company_id, current_user.id, db)
+    
+    cache_entry = response_cache.entry("valuation", current_user.id, company_id, request.url.query)
+    cached = cache_entry.response(request)
+    if cached is not None:
+        return cached
+    
+    return cache_entry.store(ORJSONResponse(dumps(company_valuation(db, company_id))))
+
+
+@router.post("/{company_id}/valuation/rebuild", response_model=ValuationResponse)
+async def rebuild_valuation(
+    company_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Recompute a company's valuation from its full movement history
+    
+    - **company_id**: Company ID
+    
+    Use after correcting purchase prices: costs of already valued receipts are otherwise kept.
+    Returns the rebuilt valuation, including movements the background catch-up has not reached yet
+    """
+    verify_company_ownership(company_id, current_user.id, db)
+    
+    reset_valuations(db, company_id)
+    update_valuations(db, company_id)
+    response_cache.invalidate(company_id, current_user.id)
+    return ORJSONResponse(dumps(company_valuation(db, company_id)))
+
+
 @router.post("/", response_model=CompanyResponse, status_code=status.HTTP_201_CREATED)
 async def create_company(
     company_data: CompanyCreate,
@@ -90,6 +322,7 @@ async def create_company(
     db.commit()
     db.refresh(new_company)
     
+    response_cache.invalidate(new_company.id, current_user.id)
     return CompanyResponse.model_validate(new_company)
 
 
@@ -132,10 +365,11 @@ async def update_company(
     db.commit()
     db.refresh(company)
     
+    response_cache.invalidate(company.id, current_user.id)
     return CompanyResponse.model_validate(company)
 
 
-@router.delete("/{company_id}", response_model=MessageResponse)
+@router.delete("/{company_id}", response_model=MessageResponse, responses={202: {"model": JobResponse}})
 async def delete_company(
     company_id: int,
     current_user: User = Depends(get_current_user),
@@ -147,6 +381,9 @@ async def delete_company(
     - **company_id**: Company ID
     
     Note: This will also delete all related materials, purchases, etc.
+    Companies with more than DELETE_INLINE_MAX_ROWS related rows are deleted
+    by a background job: the response is 202 Accepted with the job (follow it at /jobs/{id}).
+    Repeating the request while that job is queued or running returns the same job.
     Returns success message
     """
     # Find company
@@ -161,8 +398,29 @@ async def delete_company(
             detail="Company not found"
         )
     
-    # Delete company (cascade will handle related records)
+    # Large tenants are deleted in chunks by a background job, one at a time
+    dedupe_key = f"delete_company:{company_id}"
+    job = active_job(db, dedupe_key)
+    if job is None:
+        total_rows = company_row_count(db, company_id)
+        if total_rows > DELETE_INLINE_MAX_ROWS:
+            job = enqueue(
+                db,
+                "delete_company",
+                {"company_id": company_id, "user_id": current_user.id, "total_rows": total_rows},
+                user_id=current_user.id,
+                dedupe_key=dedupe_key,
+            )
+    if job is not None:
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=jsonable_encoder(JobResponse.model_validate(job)),
+            headers={"Location": f"/jobs/{job.id}"},
+        )
+    
+    # Delete company (ON DELETE CASCADE removes related records in the same statement)
     db.delete(company)
     db.commit()
     
+    response_cache.invalidate(company_id, current_user.id)
     return MessageResponse(message="Company deleted successfully")
@@ -0,0 +1,33 @@
+"""
+Debug Router
+Administrator-only access to request profiles
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+from app.models import User
+from app.dependencies import get_current_admin_user
+from app.profiling import get_profile_path
+
+router = APIRouter(prefix="/debug", tags=["Debug"])
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Download a stored request profile
+    
+    - **profile_id**: ID returned in the X-Profile-Id response header
+    
+    Returns a speedscope JSON file (open it at https://www.speedscope.app)
+    """
+    path = get_profile_path(profile_id)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    
+    return FileResponse(path, media_type="application/json", filename=profile_id)
@@ -0,0 +1,96 @@
+"""
+Events Router
+Server-Sent Events stream of a company's committed changes
+"""
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from app.database import get_db, release_connection
+from app.models import User, Company
+from app.dependencies import get_stream_user
+from app.events import EVENTS_HEARTBEAT_SECONDS, Subscription, event_broker
+from app.serialization import dumps
+
+router = APIRouter(prefix="/events", tags=["Events"])
+
+# Reconnect delay suggested to EventSource clients (milliseconds)
+RETRY_MILLISECONDS = 3000
+
+
+def verify_company_ownership(company_id: int, user_id: int, db: Session) -> None:
+    """Helper function to verify company ownership without loading the row"""
+    company = db.query(Company.id).filter(
+        Company.id == company_id,
+        Company.user_id == user_id
+    ).first()
+
+    if not company:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Company not found"
+        )
+
+
+def format_event(item: dict) -> bytes:
+    """Helper function to encode a queued event as an SSE message"""
+    lines = b""
+    if "id" in item:
+        lines += b"id: %d\n" % item["id"]
+    return lines + b"event: %s\ndata: %s\n\n" % (item["type"].encode(), dumps(item["data"]))
+
+
+async def stream(request: Request, subscription: Subscription):
+    """Helper function yielding a subscription's events until the client disconnects"""
+    try:
+        yield b"retry: %d\n\n" % RETRY_MILLISECONDS
+        while not await request.is_disconnected():
+            try:
+                item = await asyncio.wait_for(subscription.queue.get(), EVENTS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield b": keepalive\n\n"
+                continue
+            yield format_event(item)
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+@router.get("/{company_id}")
+async def company_events(
+    company_id: int,
+    request: Request,
+    current_user: User = Depends(get_stream_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream changes of a company as Server-Sent Events
+
+    - **company_id**: Company ID
+    - **access_token**: JWT token, for EventSource clients that cannot send an Authorization header (optional)
+
+    Every committed create, update or delete of the company, its materials,
+    movements, purchases and purchase items is sent as a `change` event with
+    entity, id, operation and the changed fields. A client that falls more than
+    EVENTS_BUFFER_SIZE events behind receives one `resync` event instead of the
+    backlog and should reload (or call GET /sync). Idle streams get a
+    keep-alive comment every EVENTS_HEARTBEAT_SECONDS.
+
+    Returns a text/event-stream response (503 when too many streams are open)
+    """
+    verify_company_ownership(company_id, current_user.id, db)
+    # The stream may stay open for hours; it must not hold a pooled connection
+    release_connection(db)
+
+    subscription = event_broker.subscribe(company_id)
+    if subscription is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open event streams, try again later"
+        )
+
+    return StreamingResponse(
+        stream(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,117 @@
+"""
+Jobs Router
+Status, progress, cancellation and retry of background jobs
+"""
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import User, Job
+from app.schemas import JobResponse
+from app.dependencies import get_current_user
+from app.jobs import FINISHED_STATUSES, QUEUED, RUNNING, SUCCEEDED, cancel_job, retry_job
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def verify_job_ownership(job_id: int, user_id: int, db: Session) -> Job:
+    """Helper function to verify job ownership"""
+    job = db.query(Job).filter(
+        Job.id == job_id,
+        Job.user_id == user_id
+    ).first()
+
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+
+    return job
+
+
+@router.get("/", response_model=List[JobResponse])
+async def get_jobs(
+    status_filter: Optional[str] = Query(None, alias="status", description="Filter by status"),
+    limit: int = Query(50, ge=1, le=500, description="Maximum number of jobs"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the current user's jobs, newest first
+
+    - **status**: queued, running, succeeded, failed or cancelled (optional)
+    - **limit**: Maximum number of jobs (default: 50)
+
+    Returns list of jobs
+    """
+    query = db.query(Job).filter(Job.user_id == current_user.id)
+    if status_filter:
+        query = query.filter(Job.status == status_filter)
+
+    return query.order_by(Job.created_at.desc()).limit(limit).all()
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get a job's status and progress
+
+    - **job_id**: Job ID (returned with 202 Accepted by the endpoint that started it)
+
+    Returns job data with progress_current / progress_total and, when finished, result or error
+    """
+    return verify_job_ownership(job_id, current_user.id, db)
+
+
+@router.post("/{job_id}/cancel", response_model=JobResponse)
+async def cancel(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel a job
+
+    - **job_id**: Job ID
+
+    Queued jobs are cancelled at once; running jobs stop at their next progress check.
+    Returns job data
+    """
+    job = verify_job_ownership(job_id, current_user.id, db)
+
+    if job.status not in (QUEUED, RUNNING):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is already {job.status}"
+        )
+
+    return cancel_job(db, job)
+
+
+@router.post("/{job_id}/retry", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def retry(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Run a failed or cancelled job again
+
+    - **job_id**: Job ID
+
+    Returns the queued job
+    """
+    job = verify_job_ownership(job_id, current_user.id, db)
+
+    if job.status not in FINISHED_STATUSES or job.status == SUCCEEDED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Only failed or cancelled jobs can be retried (job is {job.status})"
+        )
+
+    return retry_job(db, job)
@@ -3,11 +3,12 @@ Materials Router
 CRUD operations for materials with stock management
 """
 from typing import List, Optional
+from datetime import datetime
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import User, Company, Material, MaterialMovement
+from app.models import User, Company, Material, MaterialMovement, MaterialMovementArchive, MaterialArchiveBalance
 from app.schemas import (
     MaterialCreate,
     MaterialUpdate,
@@ -17,6 +18,16 @@ from app.schemas import (
     MessageResponse,
 )
 from app.dependencies import get_current_user
+from app.idempotency import IdempotencyClaim, idempotency_claim
+from app.serialization import parse_fields, schema_columns, schema_fields
+from app.cache import response_cache
+from app.conditional import (
+    conditional_list_response,
+    etag_matches,
+    make_etag,
+    not_modified_response,
+    set_conditional_headers,
+)
 
 router = APIRouter(prefix="/materials", tags=["Materials"])
 
@@ -37,10 +48,22 @@ def verify_company_ownership(company_id: int, user_id: int, db: Session) -> Comp
     return company
 
 
+def movement_range_query(db: Session, model, material_id: int, since: Optional[datetime], until: Optional[datetime]):
+    """Helper building a movement history query on the hot or archive table"""
+    query = db.query(*schema_columns(model, MaterialMovementResponse)).filter(model.material_id == material_id)
+    if since is not None:
+        query = query.filter(model.created_at >= since)
+    if until is not None:
+        query = query.filter(model.created_at < until)
+    return query
+
+
 @router.get("/", response_model=List[MaterialResponse])
 async def get_materials(
+    request: Request,
     company_id: Optional[int] = Query(None, description="Filter by company ID"),
     search: Optional[str] = Query(None, description="Search by name, SKU, or barcode"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (e.g. id,name,sku)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -49,11 +72,15 @@ async def get_materials(
     
     - **company_id**: Filter by company ID (optional)
     - **search**: Search by material name, SKU, or barcode (optional)
+    - **fields**: Only return these fields, e.g. `id,name,sku` for a dropdown (optional, id is always included)
     
-    Returns list of materials
+    Returns list of materials (supports If-None-Match / 304)
     """
-    # Base query: only materials from user's companies
-    query = db.query(Material).join(Company).filter(Company.user_id == current_user.id)
+    # Base query: only materials from user's companies (only the requested columns are selected)
+    fields = parse_fields(MaterialResponse, fields)
+    query = db.query(*schema_columns(Material, MaterialResponse, fields)).join(Company).filter(
+        Company.user_id == current_user.id
+    )
     
     # Apply company filter if provided
     if company_id:
@@ -61,6 +88,12 @@ async def get_materials(
         verify_company_ownership(company_id, current_user.id, db)
         query = query.filter(Material.company_id == company_id)
     
+    # Serve from cache when nothing changed since the last identical request
+    cache_entry = response_cache.entry("materials", current_user.id, company_id, request.url.query)
+    cached = cache_entry.response(request)
+    if cached is not None:
+        return cached
+    
     # Apply search filter if provided
     if search:
         search_filter = f"%{search}%"
@@ -70,12 +103,14 @@ async def get_materials(
             (Material.barcode.ilike(search_filter))
         )
     
-    materials = query.order_by(Material.created_at.desc()).all()
-    return [MaterialResponse.model_validate(m) for m in materials]
+    return cache_entry.store(conditional_list_response(
+        request, current_user.id, query.order_by(Material.created_at.desc()), fields, Material.updated_at
+    ))
 
 
 @router.get("/company/{company_id}/low-stock", response_model=List[MaterialResponse])
 async def get_low_stock_materials(
+    request: Request,
     company_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -90,18 +125,27 @@ async def get_low_stock_materials(
     # Verify company ownership
     verify_company_ownership(company_id, current_user.id, db)
     
+    cache_entry = response_cache.entry("low-stock", current_user.id, company_id, request.url.query)
+    cached = cache_entry.response(request)
+    if cached is not None:
+        return cached
+    
     # Query for low stock materials
-    materials = db.query(Material).filter(
+    query = db.query(*schema_columns(Material, MaterialResponse)).filter(
         Material.company_id == company_id,
         Material.current_stock <= Material.min_stock
-    ).order_by(Material.current_stock.asc()).all()
+    ).order_by(Material.current_stock.asc())
     
-    return [MaterialResponse.model_validate(m) for m in materials]
+    return cache_entry.store(conditional_list_response(
+        request, current_user.id, query, schema_fields(MaterialResponse), Material.updated_at
+    ))
 
 
 @router.get("/{material_id}", response_model=MaterialResponse)
 async def get_material(
     material_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -110,8 +154,19 @@ async def get_material(
     
     - **material_id**: Material ID
     
-    Returns material data
+    Returns material data (supports If-None-Match / 304)
     """
+    # Answer revalidation from the timestamp alone, without loading the row
+    if request.headers.get("if-none-match"):
+        updated_at = db.query(Material.updated_at).join(Company).filter(
+            Material.id == material_id,
+            Company.user_id == current_user.id
+        ).scalar()
+        if updated_at is not None:
+            etag = make_etag(request, current_user.id, 1, updated_at)
+            if etag_matches(request, etag):
+                return not_modified_response(etag, updated_at)
+    
     material = db.query(Material).join(Company).filter(
         Material.id == material_id,
         Company.user_id == current_user.id
@@ -123,6 +178,7 @@ async def get_material(
             detail="Material not found"
         )
     
+    set_conditional_headers(response, make_etag(request, current_user.id, 1, material.updated_at), material.updated_at)
     return MaterialResponse.model_validate(material)
 
 
@@ -180,6 +236,7 @@ async def create_material(
         db.add(movement)
         db.commit()
     
+    response_cache.invalidate(new_material.company_id, current_user.id)
     return MaterialResponse.model_validate(new_material)
 
 
@@ -232,6 +289,7 @@ async def update_material(
     db.commit()
     db.refresh(material)
     
+    response_cache.invalidate(material.company_id, current_user.id)
     return MaterialResponse.model_validate(material)
 
 
@@ -239,6 +297,7 @@ async def update_material(
 async def adjust_stock(
     material_id: int,
     adjustment: StockAdjustmentRequest,
+    idempotency: IdempotencyClaim = Depends(idempotency_claim),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -249,9 +308,13 @@ async def adjust_stock(
     - **quantity**: Quantity to adjust (positive for additions, negative for subtractions)
     - **reason**: Reason for adjustment (e.g., "purchase", "sale", "damage", "adjustment")
     - **notes**: Additional notes (optional)
+    - **Idempotency-Key** header: Retries with the same key return the first response without adjusting again (optional)
     
     Returns updated material data with new stock level
     """
+    if idempotency.replay is not None:
+        return idempotency.replay
+    
     # Find material
     material = db.query(Material).join(Company).filter(
         Material.id == material_id,
@@ -287,15 +350,24 @@ async def adjust_stock(
     )
     
     db.add(movement)
-    db.commit()
+    db.flush()
     db.refresh(material)
+    result = MaterialResponse.model_validate(material)
     
-    return MaterialResponse.model_validate(material)
+    # Stored in the same transaction as the adjustment
+    idempotency.save(db, result)
+    db.commit()
+    
+    response_cache.invalidate(result.company_id, current_user.id)
+    return result
 
 
 @router.get("/{material_id}/movements", response_model=List[MaterialMovementResponse])
 async def get_material_movements(
     material_id: int,
+    request: Request,
+    since: Optional[datetime] = Query(None, description="Only movements created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only movements created before this time"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -303,11 +375,16 @@ async def get_material_movements(
     Get stock movement history for a material
     
     - **material_id**: Material ID
+    - **since**: Only movements created at or after this time (optional)
+    - **until**: Only movements created before this time (optional)
     
+    Archived movements are included when the range reaches back past the archive horizon.
     Returns list of stock movements ordered by date (newest first)
     """
-    # Verify material ownership
-    material = db.query(Material).join(Company).filter(
+    # Verify material ownership (and find out how far back the hot table goes)
+    material = db.query(Material.company_id, MaterialArchiveBalance.archived_until).join(Company).outerjoin(
+        MaterialArchiveBalance, MaterialArchiveBalance.material_id == Material.id
+    ).filter(
         Material.id == material_id,
         Company.user_id == current_user.id
     ).first()
@@ -317,13 +394,24 @@ async def get_material_movements(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Material not found"
         )
+    company_id, archived_until = material
     
-    # Get movements
-    movements = db.query(MaterialMovement).filter(
-        MaterialMovement.material_id == material_id
-    ).order_by(MaterialMovement.created_at.desc()).all()
+    cache_entry = response_cache.entry(f"movements:{material_id}", current_user.id, company_id, request.url.query)
+    cached = cache_entry.response(request)
+    if cached is not None:
+        return cached
     
-    return [MaterialMovementResponse.model_validate(m) for m in movements]
+    # Get movements
+    query = movement_range_query(db, MaterialMovement, material_id, since, until)
+    if archived_until is not None and (since is None or since < archived_until):
+        # The range starts before the archive horizon
+        query = query.union_all(movement_range_query(db, MaterialMovementArchive, material_id, since, until))
+    query = query.order_by(MaterialMovement.created_at.desc())
+    
+    # Movements are append-only, so count plus newest created_at identifies the version
+    return cache_entry.store(conditional_list_response(
+        request, current_user.id, query, schema_fields(MaterialMovementResponse), MaterialMovement.created_at
+    ))
 
 
 @router.delete("/{material_id}", response_model=MessageResponse)
@@ -352,8 +440,10 @@ async def delete_material(
             detail="Material not found"
         )
     
-    # Delete material (cascade will handle related records)
+    # Delete material (ON DELETE CASCADE removes its movements in the same statement)
+    company_id = material.company_id
     db.delete(material)
     db.commit()
     
+    response_cache.invalidate(company_id, current_user.id)
     return MessageResponse(message="Material deleted successfully")
@@ -4,7 +4,7 @@ CRUD operations for purchases and purchase items
 """
 from typing import List, Optional
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User, Company, Purchase, PurchaseItem, Material
@@ -18,6 +18,16 @@ from app.schemas import (
     MessageResponse,
 )
 from app.dependencies import get_current_user
+from app.idempotency import IdempotencyClaim, idempotency_claim
+from app.serialization import list_response, parse_fields, schema_columns, schema_fields
+from app.cache import response_cache
+from app.conditional import (
+    conditional_list_response,
+    etag_matches,
+    make_etag,
+    not_modified_response,
+    set_conditional_headers,
+)
 
 router = APIRouter(prefix="/purchases", tags=["Purchases"])
 
@@ -56,8 +66,10 @@ def verify_purchase_ownership(purchase_id: int, user_id: int, db: Session) -> Pu
 
 @router.get("/", response_model=List[PurchaseResponse])
 async def get_purchases(
+    request: Request,
     company_id: Optional[int] = Query(None, description="Filter by company ID"),
     search: Optional[str] = Query(None, description="Search by invoice number or supplier"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (e.g. id,invoice_number,status)"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -66,11 +78,15 @@ async def get_purchases(
     
     - **company_id**: Filter by company ID (optional)
     - **search**: Search by invoice number or supplier name (optional)
+    - **fields**: Only return these fields, e.g. `id,invoice_number,status` (optional, id is always included)
     
-    Returns list of purchases
+    Returns list of purchases (supports If-None-Match / 304)
     """
-    # Base query: only purchases from user's companies
-    query = db.query(Purchase).join(Company).filter(Company.user_id == current_user.id)
+    # Base query: only purchases from user's companies (only the requested columns are selected)
+    fields = parse_fields(PurchaseResponse, fields)
+    query = db.query(*schema_columns(Purchase, PurchaseResponse, fields)).join(Company).filter(
+        Company.user_id == current_user.id
+    )
     
     # Apply company filter if provided
     if company_id:
@@ -78,6 +94,12 @@ async def get_purchases(
         verify_company_ownership(company_id, current_user.id, db)
         query = query.filter(Purchase.company_id == company_id)
     
+    # Serve from cache when nothing changed since the last identical request
+    cache_entry = response_cache.entry("purchases", current_user.id, company_id, request.url.query)
+    cached = cache_entry.response(request)
+    if cached is not None:
+        return cached
+    
     # Apply search filter if provided
     if search:
         search_filter = f"%{search}%"
@@ -86,13 +108,16 @@ async def get_purchases(
             (Purchase.supplier_name.ilike(search_filter))
         )
     
-    purchases = query.order_by(Purchase.purchase_date.desc()).all()
-    return [PurchaseResponse.model_validate(p) for p in purchases]
+    return cache_entry.store(conditional_list_response(
+        request, current_user.id, query.order_by(Purchase.purchase_date.desc()), fields, Purchase.updated_at
+    ))
 
 
 @router.get("/{purchase_id}", response_model=PurchaseResponse)
 async def get_purchase(
     purchase_id: int,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -101,15 +126,28 @@ async def get_purchase(
     
     - **purchase_id**: Purchase ID
     
-    Returns purchase data
+    Returns purchase data (supports If-None-Match / 304)
     """
+    # Answer revalidation from the timestamp alone, without loading the row
+    if request.headers.get("if-none-match"):
+        updated_at = db.query(Purchase.updated_at).join(Company).filter(
+            Purchase.id == purchase_id,
+            Company.user_id == current_user.id
+        ).scalar()
+        if updated_at is not None:
+            etag = make_etag(request, current_user.id, 1, updated_at)
+            if etag_matches(request, etag):
+                return not_modified_response(etag, updated_at)
+    
     purchase = verify_purchase_ownership(purchase_id, current_user.id, db)
+    set_conditional_headers(response, make_etag(request, current_user.id, 1, purchase.updated_at), purchase.updated_at)
     return PurchaseResponse.model_validate(purchase)
 
 
 @router.post("/", response_model=PurchaseResponse, status_code=status.HTTP_201_CREATED)
 async def create_purchase(
     purchase_data: PurchaseCreate,
+    idempotency: IdempotencyClaim = Depends(idempotency_claim),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -124,9 +162,13 @@ async def create_purchase(
     - **status**: Status: pending, completed, or cancelled (default: pending)
     - **total_amount**: Total purchase amount (default: 0)
     - **notes**: Additional notes (optional)
+    - **Idempotency-Key** header: Retries with the same key return the first response without creating a duplicate (optional)
     
     Returns created purchase data
     """
+    if idempotency.replay is not None:
+        return idempotency.replay
+    
     # Verify company ownership
     verify_company_ownership(purchase_data.company_id, current_user.id, db)
     
@@ -137,10 +179,16 @@ async def create_purchase(
     )
     
     db.add(new_purchase)
-    db.commit()
+    db.flush()
     db.refresh(new_purchase)
+    result = PurchaseResponse.model_validate(new_purchase)
+    
+    # Stored in the same transaction as the purchase
+    idempotency.save(db, result, status.HTTP_201_CREATED)
+    db.commit()
     
-    return PurchaseResponse.model_validate(new_purchase)
+    response_cache.invalidate(result.company_id, current_user.id)
+    return result
 
 
 @router.put("/{purchase_id}", response_model=PurchaseResponse)
@@ -170,6 +218,7 @@ async def update_purchase(
     db.commit()
     db.refresh(purchase)
     
+    response_cache.invalidate(purchase.company_id, current_user.id)
     return PurchaseResponse.model_validate(purchase)
 
 
@@ -191,9 +240,11 @@ async def delete_purchase(
     purchase = verify_purchase_ownership(purchase_id, current_user.id, db)
     
     # Delete purchase (cascade will handle related records)
+    company_id = purchase.company_id
     db.delete(purchase)
     db.commit()
     
+    response_cache.invalidate(company_id, current_user.id)
     return MessageResponse(message="Purchase deleted successfully")
 
 
@@ -204,6 +255,7 @@ async def delete_purchase(
 @router.get("/{purchase_id}/items", response_model=List[PurchaseItemResponse])
 async def get_purchase_items(
     purchase_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -217,12 +269,17 @@ async def get_purchase_items(
     # Verify purchase ownership
     purchase = verify_purchase_ownership(purchase_id, current_user.id, db)
     
+    cache_entry = response_cache.entry(f"items:{purchase_id}", current_user.id, purchase.company_id, request.url.query)
+    cached = cache_entry.response(request)
+    if cached is not None:
+        return cached
+    
     # Get items
-    items = db.query(PurchaseItem).filter(
+    query = db.query(*schema_columns(PurchaseItem, PurchaseItemResponse)).filter(
         PurchaseItem.purchase_id == purchase_id
-    ).order_by(PurchaseItem.created_at.asc()).all()
+    ).order_by(PurchaseItem.created_at.asc())
     
-    return [PurchaseItemResponse.model_validate(item) for item in items]
+    return cache_entry.store(list_response(query, schema_fields(PurchaseItemResponse)))
 
 
 @router.post("/{purchase_id}/items", response_model=PurchaseItemResponse, status_code=status.HTTP_201_CREATED)
@@ -278,6 +335,7 @@ async def add_purchase_item(
     db.commit()
     db.refresh(new_item)
     
+    response_cache.invalidate(purchase.company_id, current_user.id)
     return PurchaseItemResponse.model_validate(new_item)
 
 
@@ -345,6 +403,7 @@ async def update_purchase_item(
     db.commit()
     db.refresh(item)
     
+    response_cache.invalidate(purchase.company_id, current_user.id)
     return PurchaseItemResponse.model_validate(item)
 
 
@@ -386,4 +445,5 @@ async def delete_purchase_item(
     db.delete(item)
     db.commit()
     
+    response_cache.invalidate(purchase.company_id, current_user.id)
     return MessageResponse(message="Purchase item deleted successfully")
@@ -0,0 +1,74 @@
+"""
+Scans Router
+Batched barcode scan ingestion for warehouse scanners
+"""
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from app.database import get_db, release_connection
+from app.models import User, Company
+from app.schemas import ScanBatchRequest, ScanBatchResponse
+from app.dependencies import get_current_user
+from app.scans import SCAN_MAX_BATCH, ScanBatch, barcode_index, scan_committer
+
+router = APIRouter(prefix="/scans", tags=["Scans"])
+
+
+def verify_company_ownership(company_id: int, user_id: int, db: Session) -> None:
+    """Helper function to verify company ownership without loading the row"""
+    company = db.query(Company.id).filter(
+        Company.id == company_id,
+        Company.user_id == user_id
+    ).first()
+
+    if not company:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Company not found or access denied"
+        )
+
+
+@router.post("/", response_model=ScanBatchResponse)
+async def ingest_scans(
+    scan_batch: ScanBatchRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Post a batch of barcode scans
+
+    - **company_id**: Company ID (required)
+    - **reason**: Movement reason for these scans (default: scan)
+    - **scans**: Items with `barcode` (or SKU) and `quantity` (default 1, negative for picks)
+
+    Scans of the same material are netted with every other scan received within
+    SCAN_COMMIT_INTERVAL_MS and stored as one movement per material. The response
+    is sent after that commit. Materials this batch would take below zero, after
+    the batches received before it, are skipped and listed under `rejected`.
+    Returns number of stored scans, unknown barcodes, rejected materials and new stock levels
+    """
+    if len(scan_batch.scans) > SCAN_MAX_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may contain at most {SCAN_MAX_BATCH} scans"
+        )
+
+    verify_company_ownership(scan_batch.company_id, current_user.id, db)
+    material_ids = barcode_index.resolve(db, scan_batch.company_id, (scan.barcode for scan in scan_batch.scans))
+    # The group commit uses its own session; do not hold this one's connection while waiting
+    release_connection(db)
+
+    batch = ScanBatch(scan_batch.company_id, current_user.id, scan_batch.reason)
+    unknown: List[str] = []
+    for scan in scan_batch.scans:
+        material_id = material_ids.get(scan.barcode)
+        if material_id is None:
+            unknown.append(scan.barcode)
+        else:
+            batch.add(material_id, scan.quantity)
+
+    if not batch.totals:
+        return ScanBatchResponse(accepted=0, unknown=unknown, rejected=[], materials=[])
+
+    result = await scan_committer.submit(batch)
+    return ScanBatchResponse(unknown=unknown, **result)
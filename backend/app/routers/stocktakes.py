@@ -0,0 +1,245 @@
+"""
+Stocktakes Router
+Physical inventory counts: open a stocktake, upload counts in bulk, close to post the differences
+"""
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from app.database import get_db, release_connection
+from app.models import User, Company, Stocktake
+from app.schemas import (
+    StocktakeCreate,
+    StocktakeResponse,
+    StocktakeCountUpload,
+    StocktakeCountResult,
+    StocktakeVariance,
+    MessageResponse,
+)
+from app.dependencies import get_current_user
+from app.serialization import ORJSONResponse, dumps
+from app.cache import response_cache
+from app.stocktakes import STOCKTAKE_MAX_COUNTS, close_stocktake, record_counts, stocktake_variances
+
+router = APIRouter(prefix="/stocktakes", tags=["Stocktakes"])
+
+
+def verify_company_ownership(company_id: int, user_id: int, db: Session) -> None:
+    """Helper function to verify company ownership without loading the row"""
+    company = db.query(Company.id).filter(
+        Company.id == company_id,
+        Company.user_id == user_id
+    ).first()
+
+    if not company:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Company not found or access denied"
+        )
+
+
+def verify_stocktake_ownership(stocktake_id: int, user_id: int, db: Session) -> Stocktake:
+    """Helper function to verify stocktake ownership"""
+    stocktake = db.query(Stocktake).join(Company, Stocktake.company_id == Company.id).filter(
+        Stocktake.id == stocktake_id,
+        Company.user_id == user_id
+    ).first()
+
+    if not stocktake:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Stocktake not found or access denied"
+        )
+
+    return stocktake
+
+
+def require_open(stocktake: Stocktake) -> None:
+    """Helper function to reject changes to a closed stocktake"""
+    if stocktake.status != "open":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Stocktake is already closed"
+        )
+
+
+@router.get("/", response_model=List[StocktakeResponse])
+async def get_stocktakes(
+    company_id: Optional[int] = Query(None, description="Filter by company ID"),
+    status_filter: Optional[str] = Query(None, alias="status", pattern="^(open|closed)$", description="Filter by status"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get stocktakes of the user's companies, newest first
+
+    - **company_id**: Filter by company ID (optional)
+    - **status**: Filter by status: open or closed (optional)
+
+    Returns list of stocktakes
+    """
+    query = db.query(Stocktake).join(Company, Stocktake.company_id == Company.id).filter(
+        Company.user_id == current_user.id
+    )
+
+    if company_id:
+        verify_company_ownership(company_id, current_user.id, db)
+        query = query.filter(Stocktake.company_id == company_id)
+
+    if status_filter:
+        query = query.filter(Stocktake.status == status_filter)
+
+    return query.order_by(Stocktake.created_at.desc()).all()
+
+
+@router.get("/{stocktake_id}", response_model=StocktakeResponse)
+async def get_stocktake(
+    stocktake_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get a single stocktake by ID
+
+    - **stocktake_id**: Stocktake ID
+
+    Returns stocktake data with the number of counted and adjusted materials
+    """
+    return verify_stocktake_ownership(stocktake_id, current_user.id, db)
+
+
+@router.post("/", response_model=StocktakeResponse, status_code=status.HTTP_201_CREATED)
+async def create_stocktake(
+    stocktake_data: StocktakeCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Open a stocktake
+
+    - **company_id**: Company ID (required)
+    - **notes**: Additional notes (optional)
+
+    Returns created stocktake data
+    """
+    verify_company_ownership(stocktake_data.company_id, current_user.id, db)
+
+    new_stocktake = Stocktake(
+        **stocktake_data.model_dump(),
+        user_id=current_user.id
+    )
+
+    db.add(new_stocktake)
+    db.commit()
+    db.refresh(new_stocktake)
+
+    return new_stocktake
+
+
+@router.post("/{stocktake_id}/counts", response_model=StocktakeCountResult)
+async def upload_counts(
+    stocktake_id: int,
+    upload: StocktakeCountUpload,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload counted quantities in bulk
+
+    - **stocktake_id**: Stocktake ID
+    - **counts**: Items with `material_id` or `sku` and the counted `quantity`
+    - **mode**: `set` replaces earlier counts of the same materials (default), `add` adds to them,
+      e.g. when sending scans as they happen
+
+    Upload in as many requests as convenient; counts are only applied to stock when the stocktake is closed.
+    Returns number of accepted materials, identifiers matching no material of the company and the total counted
+    """
+    if len(upload.counts) > STOCKTAKE_MAX_COUNTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"An upload may contain at most {STOCKTAKE_MAX_COUNTS} counts"
+        )
+
+    stocktake = verify_stocktake_ownership(stocktake_id, current_user.id, db)
+    require_open(stocktake)
+
+    accepted, unknown = record_counts(
+        db, stocktake, ((item.material_id, item.sku, item.quantity) for item in upload.counts), upload.mode == "add"
+    )
+
+    return StocktakeCountResult(accepted=accepted, unknown=unknown, counted_items=stocktake.counted_items)
+
+
+@router.get("/{stocktake_id}/variances", response_model=List[StocktakeVariance])
+async def get_variances(
+    stocktake_id: int,
+    only_differences: bool = Query(True, description="Only materials whose count differs from the stock"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Compare counted with expected quantities
+
+    - **stocktake_id**: Stocktake ID
+    - **only_differences**: Only return materials whose count differs (default: true)
+
+    Open stocktakes are compared with the current stock, closed ones with the stock at closing.
+    Returns one entry per counted material, ordered by SKU
+    """
+    stocktake = verify_stocktake_ownership(stocktake_id, current_user.id, db)
+    variances = stocktake_variances(db, stocktake, only_differences)
+    release_connection(db)
+    return ORJSONResponse(dumps(variances))
+
+
+@router.post("/{stocktake_id}/close", response_model=StocktakeResponse)
+async def close(
+    stocktake_id: int,
+    zero_uncounted: bool = Query(False, description="Set materials without a count to zero"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Close a stocktake and post the differences as stock movements
+
+    - **stocktake_id**: Stocktake ID
+    - **zero_uncounted**: Treat materials without a count as counted zero (default: false)
+
+    Every material whose count differs from its current stock gets one movement with reason
+    `stocktake`, all in a single transaction. Open event streams receive the changes, or one `resync` event when they exceed EVENTS_BUFFER_SIZE.
+    Returns closed stocktake data with the number of adjusted materials
+    """
+    stocktake = verify_stocktake_ownership(stocktake_id, current_user.id, db)
+    require_open(stocktake)
+
+    if close_stocktake(db, stocktake, current_user.id, zero_uncounted) is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Stocktake is already closed"
+        )
+
+    response_cache.invalidate(stocktake.company_id, current_user.id)
+    db.refresh(stocktake)
+    return stocktake
+
+
+@router.delete("/{stocktake_id}", response_model=MessageResponse)
+async def delete_stocktake(
+    stocktake_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Discard an open stocktake and its counts
+
+    - **stocktake_id**: Stocktake ID
+
+    Closed stocktakes are kept as the record of their adjustments.
+    Returns success message
+    """
+    stocktake = verify_stocktake_ownership(stocktake_id, current_user.id, db)
+    require_open(stocktake)
+
+    db.delete(stocktake)
+    db.commit()
+
+    return MessageResponse(message="Stocktake deleted successfully")
@@ -0,0 +1,179 @@
+"""
+Sync Router
+Delta sync for clients keeping a local copy of their data
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+from app.database import get_db, release_connection
+from app.models import User, Company, Material, MaterialMovement, Purchase, PurchaseItem
+from app.schemas import (
+    CompanyResponse,
+    MaterialResponse,
+    MaterialMovementResponse,
+    PurchaseResponse,
+    PurchaseItemResponse,
+    SyncResponse,
+)
+from app.dependencies import get_current_user
+from app.serialization import ORJSONResponse, dumps, rows_to_dicts, schema_columns, schema_fields
+from app.changelog import DELETE, SYNC_RETENTION_DAYS, changes_since, latest_cursor
+
+router = APIRouter(prefix="/sync", tags=["Sync"])
+
+# Entity name -> (model, response schema)
+SYNCED = {
+    "companies": (Company, CompanyResponse),
+    "materials": (Material, MaterialResponse),
+    "movements": (MaterialMovement, MaterialMovementResponse),
+    "purchases": (Purchase, PurchaseResponse),
+    "purchase_items": (PurchaseItem, PurchaseItemResponse),
+}
+
+
+def make_token(cursor: Tuple[int, int], position: Optional[Tuple[int, int]] = None) -> str:
+    """Helper function to build an opaque sync token (cursor, issue time and full sync position)"""
+    token = f"{cursor[0]}.{cursor[1]}.{int(time.time())}"
+    if position is not None:
+        token += f".{position[0]}.{position[1]}"
+    return token
+
+
+def parse_token(token: str) -> Tuple[Tuple[int, int], Optional[Tuple[int, int]]]:
+    """Helper function to read a sync token, rejecting malformed and expired tokens"""
+    try:
+        parts = [int(part) for part in token.split(".")]
+    except ValueError:
+        parts = []
+    if len(parts) == 2:
+        # Token from before transaction ids were recorded; its entries all have txid 0
+        parts.insert(0, 0)
+    if len(parts) not in (3, 5) or (len(parts) == 5 and not 0 <= parts[3] < len(SYNCED)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid sync token"
+        )
+    txid, cursor, issued_at = parts[:3]
+
+    if datetime.utcfromtimestamp(issued_at) < datetime.utcnow() - timedelta(days=SYNC_RETENTION_DAYS):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Sync token expired, sync again without a token"
+        )
+
+    return (txid, cursor), (tuple(parts[3:]) if len(parts) == 5 else None)
+
+
+def owned_rows(db: Session, entity: str, user_id: int, ids: Optional[List[int]] = None,
+               after: int = 0, limit: Optional[int] = None) -> List[Tuple]:
+    """Helper function to select rows of an entity owned by the user (only some IDs, or a page after an ID)"""
+    model, schema = SYNCED[entity]
+    query = db.query(*schema_columns(model, schema))
+    owned_companies = db.query(Company.id).filter(Company.user_id == user_id)
+
+    if model is Company:
+        query = query.filter(Company.user_id == user_id)
+    elif model is MaterialMovement:
+        query = query.filter(MaterialMovement.material_id.in_(
+            db.query(Material.id).filter(Material.company_id.in_(owned_companies))
+        ))
+    elif model is PurchaseItem:
+        query = query.filter(PurchaseItem.purchase_id.in_(
+            db.query(Purchase.id).filter(Purchase.company_id.in_(owned_companies))
+        ))
+    else:
+        query = query.filter(model.company_id.in_(owned_companies))
+
+    if ids is not None:
+        query = query.filter(model.id.in_(ids))
+    if after:
+        query = query.filter(model.id > after)
+
+    return query.order_by(model.id).limit(limit).all()
+
+
+def full_sync_page(db: Session, user_id: int, position: Tuple[int, int],
+                   limit: int) -> Tuple[Dict[str, List[Tuple]], Optional[Tuple[int, int]]]:
+    """
+    Helper function to read the next page of a full sync
+
+    Entities are read in SYNCED order, each by ID. position is (entity index, last ID sent).
+    Returns the rows per entity and the position to continue from, or None when done
+    """
+    entities = list(SYNCED)
+    rows: Dict[str, List[Tuple]] = {entity: [] for entity in entities}
+    index, after = position
+    remaining = limit
+    while index < len(entities):
+        entity = entities[index]
+        page = owned_rows(db, entity, user_id, after=after, limit=remaining + 1)
+        if len(page) > remaining:
+            rows[entity] = page[:remaining]
+            return rows, (index, page[remaining - 1][schema_fields(SYNCED[entity][1]).index("id")])
+        rows[entity] = page
+        remaining -= len(page)
+        index, after = index + 1, 0
+        if remaining == 0 and index < len(entities):
+            return rows, (index, 0)
+    return rows, None
+
+
+@router.get("/", response_model=SyncResponse)
+async def sync(
+    since: Optional[str] = Query(None, description="Token from the previous sync; omit for a full sync"),
+    limit: int = Query(1000, ge=1, le=5000, description="Maximum number of changes per response"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get companies, materials, movements, purchases and purchase items changed since a token
+
+    - **since**: Token returned by the previous call (optional; without it every row is returned)
+    - **limit**: Maximum number of changes (or rows of a full sync) per response (default: 1000)
+
+    Without a token the full data set is returned in pages of `limit` rows.
+    Created and updated rows are returned in full, deleted ones as IDs under `deleted`.
+    A deleted company also removes its materials, movements, purchases and items,
+    a deleted material its movements and a deleted purchase its items.
+    Call again with the returned token while `has_more` is true.
+    Returns changed rows, deleted IDs and the next token (410 when the token expired)
+    """
+    deleted: Dict[str, List[int]] = {entity: [] for entity in SYNCED}
+
+    cursor, position = parse_token(since) if since is not None else (None, None)
+
+    if since is None or position is not None:
+        # Full sync: the cursor is taken first, so changes made while paging are sent again afterwards
+        if cursor is None:
+            cursor, position = latest_cursor(db, current_user.id), (0, 0)
+        rows, position = full_sync_page(db, current_user.id, position, limit)
+        has_more = position is not None
+    else:
+        entries, has_more = changes_since(db, current_user.id, cursor, limit)
+        if entries:
+            cursor = (entries[-1][0], entries[-1][1])
+
+        # The last operation on a row wins
+        latest: Dict[Tuple[str, int], str] = {}
+        for _, _, entity, entity_id, operation in entries:
+            latest[(entity, entity_id)] = operation
+        changed: Dict[str, List[int]] = {entity: [] for entity in SYNCED}
+        for (entity, entity_id), operation in latest.items():
+            (deleted if operation == DELETE else changed)[entity].append(entity_id)
+
+        # Rows deleted by a later, not yet served entry are simply missing here
+        rows = {
+            entity: owned_rows(db, entity, current_user.id, ids) if ids else []
+            for entity, ids in changed.items()
+        }
+
+    release_connection(db)
+    content = {
+        "token": make_token(cursor, position),
+        "has_more": has_more,
+        **{entity: rows_to_dicts(rows[entity], schema_fields(SYNCED[entity][1])) for entity in SYNCED},
+        "deleted": {entity: sorted(ids) for entity, ids in deleted.items()},
+    }
+    return ORJSONResponse(dumps(content))
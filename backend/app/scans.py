@@ -0,0 +1,267 @@
+"""
+Scan Ingestion
+Barcode scans resolved in memory and applied to stock in periodic group commits
+
+Scanners post batches of (barcode, quantity). Barcodes are resolved against
+an in-memory index per company: one query builds it, and it is dropped when a
+material's barcode or SKU changes or after SCAN_INDEX_TTL_SECONDS. Resolved
+scans wait for the next group commit, which runs every
+SCAN_COMMIT_INTERVAL_MS. It checks the batches against the stock in arrival
+order, nets the accepted scans per material, user and reason, and writes one
+movement per group and one stock update per material in a single transaction. A request is answered once the
+commit that contains its scans is done, so an accepted scan is a stored scan.
+
+The writes go through the ORM, so the change log, live events and
+valuations see them like any other stock adjustment. The index and the
+commit queue are per process; each worker commits its own scans.
+"""
+import asyncio
+import logging
+import os
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.cache import response_cache
+from app.database import SessionLocal
+from app.models import Material, MaterialMovement
+
+# Load environment variables
+load_dotenv()
+
+# Interval of the group commit; scans wait at most this long before being stored
+SCAN_COMMIT_INTERVAL_MS = int(os.getenv("SCAN_COMMIT_INTERVAL_MS", "100"))
+# Scans accepted per request
+SCAN_MAX_BATCH = int(os.getenv("SCAN_MAX_BATCH", "10000"))
+# Lifetime of a company's barcode index (changes made by other worker processes show up after this)
+SCAN_INDEX_TTL_SECONDS = float(os.getenv("SCAN_INDEX_TTL_SECONDS", "60"))
+
+# Minimum age of an index before an unknown barcode triggers a rebuild
+INDEX_REFRESH_SECONDS = 1.0
+
+ZERO = Decimal("0")
+
+logger = logging.getLogger("app.scans")
+
+
+class BarcodeIndex:
+    """Barcode (or SKU) -> material ID per company, built with one query on first use"""
+
+    def __init__(self, ttl: float = SCAN_INDEX_TTL_SECONDS):
+        self.ttl = ttl
+        self.companies: Dict[int, Tuple[float, Dict[str, int]]] = {}
+        self.builds = 0
+
+    def build(self, db: Session, company_id: int) -> Dict[str, int]:
+        codes: Dict[str, int] = {}
+        rows = db.query(Material.id, Material.sku, Material.barcode).filter(Material.company_id == company_id).all()
+        for material_id, sku, _ in rows:
+            codes[sku] = material_id
+        # A barcode wins over an equal SKU of another material
+        for material_id, _, barcode in rows:
+            if barcode:
+                codes[barcode] = material_id
+        self.companies[company_id] = (time.monotonic(), codes)
+        self.builds += 1
+        return codes
+
+    def resolve(self, db: Session, company_id: int, codes: Iterable[str]) -> Dict[str, int]:
+        """
+        Look up barcodes of a company
+
+        Args:
+            db: Database session (only used to build the index)
+            company_id: Company ID
+            codes: Scanned barcodes or SKUs
+
+        Returns:
+            Material ID per known code
+        """
+        codes = set(codes)
+        entry = self.companies.get(company_id)
+        now = time.monotonic()
+        if entry is None or now - entry[0] > self.ttl:
+            index = self.build(db, company_id)
+        else:
+            index = entry[1]
+            # Materials created by another process: rebuild once, not on every unknown scan
+            if not codes.issubset(index) and now - entry[0] > INDEX_REFRESH_SECONDS:
+                index = self.build(db, company_id)
+        return {code: index[code] for code in codes if code in index}
+
+    def invalidate(self, company_id: int) -> None:
+        self.companies.pop(company_id, None)
+
+
+# Global index
+barcode_index = BarcodeIndex()
+
+
+@event.listens_for(Session, "after_flush")
+def invalidate_barcodes(session: Session, flush_context) -> None:
+    """Drop the index of companies whose barcodes or SKUs were written (a rollback only costs a rebuild)"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Material):
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not (
+            state.attrs.barcode.history.has_changes() or state.attrs.sku.history.has_changes()
+        ):
+            continue
+        barcode_index.invalidate(obj.company_id)
+
+
+class ScanBatch:
+    """Resolved scans of one request, waiting for the group commit"""
+
+    def __init__(self, company_id: int, user_id: int, reason: str):
+        self.company_id = company_id
+        self.user_id = user_id
+        self.reason = reason
+        # material_id -> [net quantity, number of scans]
+        self.totals: Dict[int, List] = {}
+        self.future: Optional[asyncio.Future] = None
+
+    def add(self, material_id: int, quantity: Decimal) -> None:
+        total = self.totals.setdefault(material_id, [ZERO, 0])
+        total[0] += quantity
+        total[1] += 1
+
+
+class ScanCommitter:
+    """Collects scan batches and stores them together every SCAN_COMMIT_INTERVAL_MS"""
+
+    def __init__(self, interval_ms: int = SCAN_COMMIT_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.pending: List[ScanBatch] = []
+        self.commits = 0
+        self.scans = 0
+
+    async def submit(self, batch: ScanBatch) -> dict:
+        """
+        Queue a batch and wait for the commit that stores it
+
+        Args:
+            batch: Resolved scans
+
+        Returns:
+            Outcome for this batch: accepted scan count, rejected materials, new stock levels
+        """
+        batch.future = asyncio.get_running_loop().create_future()
+        self.pending.append(batch)
+        return await batch.future
+
+    async def flush(self) -> None:
+        """Store every queued batch in one transaction and answer the waiting requests"""
+        if not self.pending:
+            return
+        batches, self.pending = self.pending, []
+        try:
+            results = await run_in_threadpool(commit_scans, batches)
+        except Exception as exc:
+            logger.exception("Scan commit failed")
+            for batch in batches:
+                if not batch.future.done():
+                    batch.future.set_exception(exc)
+            return
+        self.commits += 1
+        for batch, result in zip(batches, results):
+            self.scans += result["accepted"]
+            # The scans are stored even if the client went away meanwhile
+            if not batch.future.done():
+                batch.future.set_result(result)
+
+    async def run(self) -> None:
+        """Background task running the group commit; stores what is queued when cancelled"""
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            await self.flush()
+            raise
+
+
+# Global committer
+scan_committer = ScanCommitter()
+
+
+def commit_scans(batches: List[ScanBatch]) -> List[dict]:
+    """
+    Apply queued scan batches in one transaction
+
+    Batches are checked in arrival order against a running stock per
+    material. A batch whose scans would take a material below zero has that
+    material rejected; the other batches are not affected. The accepted
+    quantities are netted into one movement per material, user and reason.
+
+    Args:
+        batches: Batches to store
+
+    Returns:
+        One result per batch, in order
+    """
+    material_ids = {material_id for batch in batches for material_id in batch.totals}
+
+    db = SessionLocal()
+    try:
+        materials = {
+            material.id: material
+            for material in db.query(Material).filter(Material.id.in_(material_ids)).with_for_update()
+        }
+        stock = {material_id: material.current_stock for material_id, material in materials.items()}
+        # Rejected materials per batch, and accepted (net quantity, scans) per (material, user, reason)
+        rejections: List[Dict[int, str]] = []
+        groups: Dict[Tuple[int, int, str], List] = {}
+        for batch in batches:
+            rejected: Dict[int, str] = {}
+            for material_id, (quantity, count) in batch.totals.items():
+                if material_id not in stock:
+                    rejected[material_id] = "Material not found"
+                    continue
+                if stock[material_id] + quantity < 0:
+                    rejected[material_id] = f"Insufficient stock. Current: {stock[material_id]}, Requested: {abs(quantity)}"
+                    continue
+                stock[material_id] += quantity
+                group = groups.setdefault((material_id, batch.user_id, batch.reason), [ZERO, 0])
+                group[0] += quantity
+                group[1] += count
+            rejections.append(rejected)
+
+        for material_id, material in materials.items():
+            if stock[material_id] != material.current_stock:
+                material.current_stock = stock[material_id]
+
+        for (material_id, user_id, reason), (quantity, count) in groups.items():
+            if not quantity:
+                continue
+            db.add(MaterialMovement(
+                material_id=material_id,
+                quantity=quantity,
+                reason=reason,
+                notes=f"{count} scans" if count > 1 else None,
+                user_id=user_id,
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+    for company_id, user_id in {(batch.company_id, batch.user_id) for batch in batches}:
+        response_cache.invalidate(company_id, user_id)
+
+    results = []
+    for batch, rejected in zip(batches, rejections):
+        results.append({
+            "accepted": sum(count for material_id, (_, count) in batch.totals.items() if material_id not in rejected),
+            "rejected": [
+                {"material_id": material_id, "detail": detail} for material_id, detail in rejected.items()
+            ],
+            "materials": [
+                {"material_id": material_id, "current_stock": stock[material_id]}
+                for material_id in batch.totals if material_id not in rejected
+            ],
+        })
+    return results
@@ -3,9 +3,9 @@ Pydantic Schemas
 Request and response models for API validation
 """
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from decimal import Decimal
-from pydantic import BaseModel, EmailStr, Field, field_validator
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
 
 
 # ============================================================================
@@ -86,6 +86,14 @@ class CompanyResponse(CompanyBase):
         from_attributes = True
 
 
+class CompanyStatsResponse(CompanyResponse):
+    material_count: int
+    stock_value: Decimal
+    low_stock_count: int
+    open_purchase_count: int
+    last_activity_at: datetime
+
+
 # ============================================================================
 # Material Schemas
 # ============================================================================
@@ -149,6 +157,142 @@ class MaterialMovementResponse(BaseModel):
         from_attributes = True
 
 
+# ============================================================================
+# Reorder Schemas
+# ============================================================================
+
+class ReorderSuggestion(BaseModel):
+    material_id: int
+    sku: str
+    name: str
+    unit: str
+    current_stock: float
+    min_stock: float
+    daily_usage: float
+    usage_std: float
+    days_of_cover: Optional[float] = None
+    safety_stock: float
+    reorder_point: float
+    reorder_quantity: float
+    needs_reorder: bool
+
+
+# ============================================================================
+# Valuation Schemas
+# ============================================================================
+
+class MaterialValuationResponse(BaseModel):
+    material_id: int
+    sku: str
+    name: str
+    quantity: Decimal
+    fifo_value: Decimal
+    wac_unit_cost: Decimal
+    wac_value: Decimal
+
+
+class ValuationResponse(BaseModel):
+    company_id: int
+    valued_at: datetime
+    fifo_value: Decimal
+    wac_value: Decimal
+    materials: List[MaterialValuationResponse]
+
+
+# ============================================================================
+# Stocktake Schemas
+# ============================================================================
+
+class StocktakeCreate(BaseModel):
+    company_id: int
+    notes: Optional[str] = None
+
+
+class StocktakeResponse(BaseModel):
+    id: int
+    company_id: int
+    user_id: Optional[int]
+    status: str
+    notes: Optional[str]
+    counted_items: int
+    adjusted_items: Optional[int] = None
+    created_at: datetime
+    closed_at: Optional[datetime] = None
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class StocktakeCountItem(BaseModel):
+    material_id: Optional[int] = None
+    sku: Optional[str] = Field(None, min_length=1, max_length=100)
+    quantity: Decimal = Field(..., ge=0)
+
+    @model_validator(mode="after")
+    def require_material(self) -> "StocktakeCountItem":
+        if self.material_id is None and self.sku is None:
+            raise ValueError("material_id or sku is required")
+        return self
+
+
+class StocktakeCountUpload(BaseModel):
+    counts: List[StocktakeCountItem] = Field(..., min_length=1)
+    mode: str = Field(
+        default="set",
+        pattern="^(set|add)$",
+        description="set: replace earlier counts of the same materials; add: add to them (scans)",
+    )
+
+
+class StocktakeCountResult(BaseModel):
+    accepted: int
+    unknown: List[str]
+    counted_items: int
+
+
+class StocktakeVariance(BaseModel):
+    material_id: int
+    sku: str
+    name: str
+    unit: str
+    counted_quantity: Decimal
+    expected_quantity: Decimal
+    difference: Decimal
+
+
+# ============================================================================
+# Scan Schemas
+# ============================================================================
+
+class ScanItem(BaseModel):
+    barcode: str = Field(..., min_length=1, max_length=100, description="Barcode, or SKU for materials without one")
+    quantity: Decimal = Field(default=1, description="Positive for receipts, negative for picks")
+
+
+class ScanBatchRequest(BaseModel):
+    company_id: int
+    reason: str = Field(default="scan", min_length=1, max_length=100)
+    scans: List[ScanItem] = Field(..., min_length=1)
+
+
+class ScanRejection(BaseModel):
+    material_id: int
+    detail: str
+
+
+class ScanStock(BaseModel):
+    material_id: int
+    current_stock: Decimal
+
+
+class ScanBatchResponse(BaseModel):
+    accepted: int
+    unknown: List[str]
+    rejected: List[ScanRejection]
+    materials: List[ScanStock]
+
+
 # ============================================================================
 # Purchase Schemas
 # ============================================================================
@@ -221,6 +365,81 @@ class PurchaseItemResponse(PurchaseItemBase):
         from_attributes = True
 
 
+# ============================================================================
+# Batch Schemas
+# ============================================================================
+
+class BatchOperation(BaseModel):
+    method: str = Field(..., description="GET, POST, PUT, PATCH or DELETE")
+    path: str = Field(..., min_length=1, max_length=2048, description="API path with optional query string")
+    body: Optional[Any] = None
+
+    @field_validator("method")
+    @classmethod
+    def validate_method(cls, value: str) -> str:
+        value = value.upper()
+        if value not in ("GET", "POST", "PUT", "PATCH", "DELETE"):
+            raise ValueError("method must be GET, POST, PUT, PATCH or DELETE")
+        return value
+
+
+class BatchRequest(BaseModel):
+    requests: List[BatchOperation] = Field(..., min_length=1)
+    transaction: bool = Field(
+        default=False,
+        description="Run all operations in one transaction; the first failure rolls back all of them",
+    )
+
+
+class BatchOperationResult(BaseModel):
+    status: int
+    body: Optional[Any] = None
+
+
+class BatchResponse(BaseModel):
+    committed: bool
+    responses: List[BatchOperationResult]
+
+
+# ============================================================================
+# Job Schemas
+# ============================================================================
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress_current: int
+    progress_total: Optional[int] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# ============================================================================
+# Sync Schemas
+# ============================================================================
+
+class SyncResponse(BaseModel):
+    token: str
+    has_more: bool
+    companies: List[CompanyResponse]
+    materials: List[MaterialResponse]
+    movements: List[MaterialMovementResponse]
+    purchases: List[PurchaseResponse]
+    purchase_items: List[PurchaseItemResponse]
+    deleted: Dict[str, List[int]]
+
+
 # ============================================================================
 # Generic Response Schemas
 # ============================================================================
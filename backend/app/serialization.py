@@ -0,0 +1,135 @@
+"""
+Fast Serialization
+Column projection and orjson encoding for large list responses
+"""
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Tuple, Type
+import orjson
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from pydantic import BaseModel
+from app.database import release_connection
+
+
+def _default(value: Any) -> Any:
+    """Encode types orjson does not handle natively (same output as Pydantic's JSON mode)"""
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize content to JSON bytes with orjson
+
+    Args:
+        content: Lists, dicts and scalars (Decimal and datetime included)
+
+    Returns:
+        UTF-8 encoded JSON
+    """
+    return orjson.dumps(content, default=_default)
+
+
+class ORJSONResponse(Response):
+    """JSON response rendered with orjson; pre-encoded bytes are sent unchanged"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def schema_fields(schema: Type[BaseModel]) -> Tuple[str, ...]:
+    """
+    Field names of a response schema, in declaration order
+
+    Args:
+        schema: Pydantic response model
+
+    Returns:
+        Tuple of field names
+    """
+    return tuple(schema.model_fields)
+
+
+def parse_fields(schema: Type[BaseModel], requested: Optional[str]) -> Tuple[str, ...]:
+    """
+    Resolve a sparse fieldset from a comma-separated fields= query parameter
+
+    Args:
+        schema: Pydantic response model listing the allowed fields
+        requested: Comma-separated field names, or None for all fields
+
+    Returns:
+        Requested field names in schema order ("id" is always included)
+
+    Raises:
+        HTTPException: If an unknown field is requested
+    """
+    allowed = schema_fields(schema)
+    if not requested:
+        return allowed
+    names = {name.strip() for name in requested.split(",") if name.strip()}
+    unknown = sorted(names - set(allowed))
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown field(s): {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+    names.add("id")
+    return tuple(name for name in allowed if name in names)
+
+
+def schema_columns(model, schema: Type[BaseModel], fields: Sequence[str] = None) -> List:
+    """
+    ORM columns matching the fields of a response schema
+
+    Args:
+        model: SQLAlchemy model class
+        schema: Pydantic response model whose fields are model columns
+        fields: Optional subset of field names (defaults to all schema fields)
+
+    Returns:
+        List of column attributes to pass to db.query()
+    """
+    return [getattr(model, name) for name in (fields or schema_fields(schema))]
+
+
+def rows_to_dicts(rows: Sequence[Sequence[Any]], fields: Sequence[str]) -> List[dict]:
+    """
+    Turn column tuples into dictionaries keyed by field name
+
+    Args:
+        rows: Result rows in the same order as fields
+        fields: Field names
+
+    Returns:
+        List of dictionaries
+    """
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def list_response(query, fields: Sequence[str], status_code: int = 200) -> ORJSONResponse:
+    """
+    Execute a column-projected query and encode the rows directly
+
+    Rows come straight from SQL as tuples, so no ORM entities or Pydantic
+    models are built and FastAPI's response_model validation is skipped.
+    The connection goes back to the pool before the rows are encoded.
+
+    Args:
+        query: Query selecting exactly the columns named in fields
+        fields: Output field names, in column order
+        status_code: HTTP status code
+
+    Returns:
+        ORJSONResponse with the encoded list
+    """
+    rows = query.all()
+    release_connection(query.session)
+    return ORJSONResponse(dumps(rows_to_dicts(rows, fields)), status_code=status_code)
@@ -0,0 +1,152 @@
+"""
+Production Server
+Multi-worker launcher: gunicorn with uvicorn workers, or plain uvicorn where gunicorn is unavailable
+
+Usage (from the backend directory):
+    python -m app.server                 # one worker per CPU core
+    python -m app.server --workers 8
+
+The master process checks the schema version once, imports the application
+(so workers fork with it already loaded) and then supervises the workers:
+
+- workers are recycled after MAX_REQUESTS requests (plus jitter) to cap memory growth
+- SIGTERM stops accepting connections and lets in-flight requests finish for up
+  to GRACEFUL_TIMEOUT seconds
+- SIGHUP replaces all workers gracefully (e.g. after a deploy)
+"""
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8001))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY") or 0) or os.cpu_count() or 1
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "10000"))
+MAX_REQUESTS_JITTER = int(os.getenv("MAX_REQUESTS_JITTER", "1000"))
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+WORKER_TIMEOUT = int(os.getenv("WORKER_TIMEOUT", "60"))
+KEEPALIVE = int(os.getenv("KEEPALIVE", "5"))
+
+
+def prepare_environment(workers: int) -> None:
+    """
+    Configure the process environment before the application is imported
+
+    Args:
+        workers: Number of worker processes
+    """
+    # The schema is checked once here; workers skip it in their lifespan
+    os.environ["DB_INIT_ON_STARTUP"] = "False"
+    # An in-process cache would miss invalidations made by other workers
+    if workers > 1 and os.getenv("CACHE_BACKEND", "memory").lower() == "memory":
+        if os.getenv("CACHE_BACKEND"):
+            print("⚠️  CACHE_BACKEND=memory is per process; using the shared sqlite cache for several workers")
+        os.environ["CACHE_BACKEND"] = "sqlite"
+
+
+def prepare_database() -> None:
+    """Check (or migrate) the database schema and release the master's connections before forking"""
+    from app.database import engine
+    from app.migrations import ensure_schema
+
+    ensure_schema(engine)
+    engine.dispose()
+
+
+def run_gunicorn(args) -> None:
+    """Serve with gunicorn and uvicorn workers (POSIX only)"""
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    def post_fork(server, worker):
+        # Never share pooled connections inherited from the master
+        from app.database import engine
+
+        engine.dispose(close=False)
+
+    from app.main import app
+
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": MAX_REQUESTS_JITTER if args.max_requests else 0,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "timeout": WORKER_TIMEOUT,
+        "keepalive": KEEPALIVE,
+        "loglevel": os.getenv("LOG_LEVEL", "INFO").lower(),
+        "post_fork": post_fork,
+    }
+    print(f"✅ Starting {args.workers} workers on http://{args.host}:{args.port}")
+    Application(app, options).run()
+
+
+def run_uvicorn(args) -> None:
+    """Serve with uvicorn's own process manager (Windows or no gunicorn)"""
+    import uvicorn
+
+    if args.max_requests:
+        # uvicorn's supervisor does not replace workers that exit, so a request limit would stop the server
+        print("⚠️  Worker recycling (--max-requests) needs gunicorn; workers run without a request limit")
+    print(f"✅ Starting {args.workers} workers on http://{args.host}:{args.port}")
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        limit_max_requests=None,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_keep_alive=KEEPALIVE,
+        log_level=os.getenv("LOG_LEVEL", "INFO").lower(),
+    )
+
+
+def gunicorn_available() -> bool:
+    """Check whether gunicorn can be used on this platform"""
+    if sys.platform == "win32":
+        return False
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the CoApp API with several worker processes")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY, help="Worker processes (default: CPU cores)")
+    parser.add_argument("--max-requests", type=int, default=MAX_REQUESTS, help="Recycle a worker after this many requests (0 disables)")
+    args = parser.parse_args(argv)
+
+    prepare_environment(args.workers)
+    prepare_database()
+
+    if gunicorn_available():
+        run_gunicorn(args)
+    else:
+        # Workers are spawned and import the application themselves
+        run_uvicorn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Stocktakes
+Bulk upload of physical inventory counts and set-based reconciliation with current_stock
+
+Counts are stored per stocktake and material. Uploads are upserts, so a count
+can arrive in several parts, be corrected ("set") or accumulate scan by scan
+("add"). Closing runs a fixed number of statements in one transaction,
+whatever the number of SKUs: expected quantities are snapshotted from
+current_stock in one join, one "stocktake" movement is inserted per material
+whose count differs, current_stock is corrected and the change log entries
+for delta sync are written. These bulk statements bypass the ORM, so the
+change log (and through it live events) is fed here instead of by the flush
+listeners.
+"""
+import os
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, exists, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from app.changelog import UPSERT
+from app.models import ChangeLog, Company, Material, MaterialMovement, Stocktake, StocktakeCount
+
+# Load environment variables
+load_dotenv()
+
+# Counts accepted per upload request
+STOCKTAKE_MAX_COUNTS = int(os.getenv("STOCKTAKE_MAX_COUNTS", "100000"))
+
+# Reason of the movements posted when a stocktake is closed
+STOCKTAKE_REASON = "stocktake"
+
+ZERO = Decimal("0")
+
+counts = StocktakeCount.__table__
+materials = Material.__table__
+
+
+def resolve_counts(db: Session, company_id: int, items: Iterable[Tuple[Optional[int], Optional[str], Decimal]],
+                   add: bool) -> Tuple[Dict[int, Decimal], List[str]]:
+    """
+    Map uploaded counts to material IDs of the company
+
+    Args:
+        db: Database session
+        company_id: Company ID
+        items: (material_id, sku, quantity) triples; material_id wins when both are given
+        add: Sum repeated materials (scans) instead of keeping the last count
+
+    Returns:
+        (quantity per material ID, identifiers that match no material of the company)
+    """
+    # One query for the whole company instead of one lookup per line
+    skus = dict(db.query(Material.sku, Material.id).filter(Material.company_id == company_id))
+    material_ids = set(skus.values())
+
+    quantities: Dict[int, Decimal] = {}
+    unknown: List[str] = []
+    for material_id, sku, quantity in items:
+        if material_id is None:
+            material_id = skus.get(sku)
+            if material_id is None:
+                unknown.append(sku)
+                continue
+        elif material_id not in material_ids:
+            unknown.append(str(material_id))
+            continue
+        if add:
+            quantities[material_id] = quantities.get(material_id, ZERO) + quantity
+        else:
+            quantities[material_id] = quantity
+    return quantities, unknown
+
+
+def upsert_counts(db: Session, stocktake_id: int, quantities: Dict[int, Decimal], add: bool) -> None:
+    """
+    Insert or update counts of a stocktake with one INSERT ... ON CONFLICT statement
+
+    Args:
+        db: Database session
+        stocktake_id: Stocktake ID
+        quantities: Quantity per material ID
+        add: Add to existing counts instead of replacing them
+    """
+    if not quantities:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(counts)
+    counted = statement.excluded.counted_quantity
+    if add:
+        counted = counts.c.counted_quantity + counted
+    statement = statement.on_conflict_do_update(
+        index_elements=[counts.c.stocktake_id, counts.c.material_id],
+        set_={"counted_quantity": counted, "updated_at": statement.excluded.updated_at},
+    )
+    now = datetime.utcnow()
+    db.execute(statement, [
+        {"stocktake_id": stocktake_id, "material_id": material_id, "counted_quantity": quantity, "updated_at": now}
+        for material_id, quantity in quantities.items()
+    ])
+
+
+def record_counts(db: Session, stocktake: Stocktake, items: Iterable[Tuple[Optional[int], Optional[str], Decimal]],
+                  add: bool) -> Tuple[int, List[str]]:
+    """
+    Store uploaded counts of an open stocktake and commit
+
+    Args:
+        db: Database session
+        stocktake: Open stocktake
+        items: (material_id, sku, quantity) triples
+        add: Add to existing counts (scans) instead of replacing them
+
+    Returns:
+        (number of materials counted by this upload, unknown identifiers)
+    """
+    quantities, unknown = resolve_counts(db, stocktake.company_id, items, add)
+    upsert_counts(db, stocktake.id, quantities, add)
+    stocktake.counted_items = db.query(func.count()).select_from(StocktakeCount).filter(
+        StocktakeCount.stocktake_id == stocktake.id
+    ).scalar()
+    db.commit()
+    return len(quantities), unknown
+
+
+def close_stocktake(db: Session, stocktake: Stocktake, user_id: int, zero_uncounted: bool = False) -> Optional[int]:
+    """
+    Post the differences between counts and current_stock in one transaction
+
+    Args:
+        db: Database session
+        stocktake: Stocktake to close
+        user_id: User closing the stocktake (recorded on the movements)
+        zero_uncounted: Treat materials without a count as counted zero
+
+    Returns:
+        Number of adjusted materials, or None if the stocktake was not open anymore
+    """
+    now = datetime.utcnow()
+    stocktake_id = stocktake.id
+    company_id = stocktake.company_id
+    note = f"Stocktake #{stocktake_id}"
+
+    # Claim the stocktake first, so a concurrent close finds nothing to do
+    claimed = db.execute(update(Stocktake).where(
+        Stocktake.id == stocktake_id,
+        Stocktake.status == "open",
+    ).values(status="closed", closed_at=now, updated_at=now).execution_options(synchronize_session=False))
+    if claimed.rowcount == 0:
+        db.rollback()
+        return None
+
+    in_stocktake = counts.c.stocktake_id == stocktake_id
+    if zero_uncounted:
+        db.execute(insert(counts).from_select(
+            ["stocktake_id", "material_id", "counted_quantity", "updated_at"],
+            select(literal(stocktake_id), materials.c.id, literal(ZERO), literal(now)).where(
+                materials.c.company_id == company_id,
+                ~exists().where(in_stocktake, counts.c.material_id == materials.c.id),
+            ),
+        ))
+
+    # Snapshot of the book quantities the counts are compared with
+    db.execute(update(counts).where(in_stocktake).values(
+        expected_quantity=select(materials.c.current_stock).where(
+            materials.c.id == counts.c.material_id
+        ).scalar_subquery(),
+    ))
+
+    differs = and_(in_stocktake, counts.c.counted_quantity != counts.c.expected_quantity)
+    last_movement_id = db.query(func.max(MaterialMovement.id)).scalar() or 0
+    adjusted = db.execute(insert(MaterialMovement.__table__).from_select(
+        ["material_id", "quantity", "reason", "notes", "user_id", "created_at"],
+        select(
+            counts.c.material_id,
+            counts.c.counted_quantity - counts.c.expected_quantity,
+            literal(STOCKTAKE_REASON),
+            literal(note),
+            literal(user_id),
+            literal(now),
+        ).where(differs),
+    )).rowcount
+
+    # Apply the difference rather than assigning the count, so stock still equals the sum of
+    # movements if another adjustment committed after the snapshot. updated_at matches the
+    # movements' created_at.
+    db.execute(update(materials).where(
+        materials.c.id.in_(select(counts.c.material_id).where(differs))
+    ).values(
+        current_stock=materials.c.current_stock + select(
+            counts.c.counted_quantity - counts.c.expected_quantity
+        ).where(in_stocktake, counts.c.material_id == materials.c.id).scalar_subquery(),
+        updated_at=now,
+    ))
+
+    owner_id = db.query(Company.user_id).filter(Company.id == company_id).scalar()
+    change_log = ChangeLog.__table__
+    columns = ["user_id", "company_id", "entity", "entity_id", "operation", "created_at"]
+    db.execute(insert(change_log).from_select(columns, select(
+        literal(owner_id), literal(company_id), literal("materials"), counts.c.material_id, literal(UPSERT), literal(now)
+    ).where(differs)))
+    db.execute(insert(change_log).from_select(columns, select(
+        literal(owner_id), literal(company_id), literal("movements"), MaterialMovement.id, literal(UPSERT), literal(now)
+    ).where(
+        MaterialMovement.id > last_movement_id,
+        MaterialMovement.reason == STOCKTAKE_REASON,
+        MaterialMovement.notes == note,
+    )))
+
+    db.execute(update(Stocktake).where(Stocktake.id == stocktake_id).values(
+        adjusted_items=adjusted,
+        counted_items=select(func.count()).where(in_stocktake).scalar_subquery(),
+    ).execution_options(synchronize_session=False))
+    db.commit()
+    return adjusted
+
+
+def stocktake_variances(db: Session, stocktake: Stocktake, only_differences: bool = True) -> List[dict]:
+    """
+    Counted against expected quantity per material
+
+    Open stocktakes compare with the current stock, closed ones with the snapshot taken when closing.
+
+    Args:
+        db: Database session
+        stocktake: Stocktake
+        only_differences: Skip materials whose count matches
+
+    Returns:
+        One entry per counted material, ordered by SKU
+    """
+    expected = func.coalesce(StocktakeCount.expected_quantity, Material.current_stock)
+    query = db.query(
+        Material.id, Material.sku, Material.name, Material.unit, StocktakeCount.counted_quantity, expected
+    ).join(
+        StocktakeCount, StocktakeCount.material_id == Material.id
+    ).filter(StocktakeCount.stocktake_id == stocktake.id)
+    if only_differences:
+        query = query.filter(StocktakeCount.counted_quantity != expected)
+
+    return [
+        {
+            "material_id": material_id,
+            "sku": sku,
+            "name": name,
+            "unit": unit,
+            "counted_quantity": Decimal(counted),
+            "expected_quantity": Decimal(book),
+            "difference": Decimal(counted) - Decimal(book),
+        }
+        for material_id, sku, name, unit, counted, book in query.order_by(Material.sku)
+    ]
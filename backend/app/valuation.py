@@ -0,0 +1,409 @@
+"""
+Inventory Valuation
+FIFO and weighted-average cost valuation from purchase costs and stock movements
+
+Movements carry the quantities (so the valued quantity matches current_stock)
+and completed purchase items carry the costs. An inbound movement is costed
+at the unit price of the material's latest completed purchase on or before
+the movement; without one, at the current average cost, then at the
+material's unit_price, then at zero. Outbound movements consume FIFO layers
+oldest first and leave the average cost unchanged.
+
+The state after each replay is persisted: material_valuations holds the
+watermark, quantity, FIFO value and average cost of every material,
+material_cost_layers holds the open FIFO layers. A catch-up only replays
+movements past the watermark, VALUATION_CHUNK_SIZE materials per
+transaction, so month-end reports never walk the full history again.
+
+Ids are not handed out in commit order, so the watermark is (txid, id) like
+the sync cursor (see app.changelog): movements are replayed in that order
+and only once their transaction is older than every transaction still in
+progress, so none can commit behind the watermark later.
+
+Reading a valuation does not replay anything. run_updater catches up every
+company every VALUATION_UPDATE_SECONDS; POST .../valuation/rebuild replays a
+company from scratch at once.
+
+Costs are fixed when an inbound movement is first valued. After correcting
+purchase prices retroactively, rebuild the company's valuation.
+"""
+import asyncio
+import bisect
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, func, insert, or_, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from dotenv import load_dotenv
+from app.cache import response_cache
+from app.changelog import commit_horizon
+from app.database import SessionLocal
+from app.models import (
+    Company,
+    Material,
+    MaterialCostLayer,
+    MaterialMovement,
+    MaterialMovementArchive,
+    MaterialValuation,
+    Purchase,
+    PurchaseItem,
+)
+
+# Load environment variables
+load_dotenv()
+
+# Materials replayed per transaction
+VALUATION_CHUNK_SIZE = int(os.getenv("VALUATION_CHUNK_SIZE", "1000"))
+# Interval of the background catch-up
+VALUATION_UPDATE_SECONDS = float(os.getenv("VALUATION_UPDATE_SECONDS", "60"))
+
+# Attempts per chunk when a concurrent valuation of the same materials wins the race
+VALUATION_CHUNK_ATTEMPTS = 3
+
+ZERO = Decimal("0")
+CENT = Decimal("0.01")
+UNIT_COST = Decimal("0.0001")
+
+logger = logging.getLogger("app.valuation")
+
+
+class PurchaseCosts:
+    """Unit prices of a material's completed purchases, ordered by purchase date"""
+
+    def __init__(self):
+        self.dates: List[datetime] = []
+        self.prices: List[Decimal] = []
+
+    def cost_at(self, moment: datetime) -> Optional[Decimal]:
+        """Unit price of the latest purchase on or before moment, or None"""
+        index = bisect.bisect_right(self.dates, moment)
+        return self.prices[index - 1] if index else None
+
+
+def purchase_costs(db: Session, material_ids: List[int]) -> Dict[int, PurchaseCosts]:
+    """
+    Load the completed purchase prices of some materials
+
+    Args:
+        db: Database session
+        material_ids: Material IDs
+
+    Returns:
+        PurchaseCosts per material ID (materials without purchases are missing)
+    """
+    rows = db.query(PurchaseItem.material_id, Purchase.purchase_date, PurchaseItem.unit_price).join(
+        Purchase, PurchaseItem.purchase_id == Purchase.id
+    ).filter(
+        PurchaseItem.material_id.in_(material_ids),
+        Purchase.status == "completed",
+    ).order_by(PurchaseItem.material_id, Purchase.purchase_date, PurchaseItem.id)
+
+    costs: Dict[int, PurchaseCosts] = {}
+    for material_id, purchase_date, unit_price in rows:
+        material_costs = costs.setdefault(material_id, PurchaseCosts())
+        material_costs.dates.append(purchase_date)
+        material_costs.prices.append(unit_price)
+    return costs
+
+
+def pending_movements(db: Session, material_ids: List[int]):
+    """
+    Settled movements past each material's valuation watermark, hot and archived alike
+
+    Args:
+        db: Database session
+        material_ids: Material IDs
+
+    Returns:
+        Rows of (material_id, txid, movement_id, created_at, quantity) ordered by material, txid and movement ID
+    """
+    last_txid = func.coalesce(MaterialValuation.last_txid, 0)
+    last_id = func.coalesce(MaterialValuation.last_movement_id, 0)
+    horizon = commit_horizon(db)
+    movements = union_all(*(
+        select(model.id, model.txid, model.material_id, model.created_at, model.quantity).outerjoin(
+            MaterialValuation, MaterialValuation.material_id == model.material_id
+        ).where(
+            model.material_id.in_(material_ids),
+            or_(model.txid > last_txid, and_(model.txid == last_txid, model.id > last_id)),
+            *((model.txid < horizon,) if horizon is not None else ()),
+        )
+        for model in (MaterialMovement, MaterialMovementArchive)
+    )).subquery()
+    return db.execute(
+        select(movements.c.material_id, movements.c.txid, movements.c.id, movements.c.created_at, movements.c.quantity)
+        .order_by(movements.c.material_id, movements.c.txid, movements.c.id)
+    ).all()
+
+
+def replay(valuation: MaterialValuation, records: List[MaterialCostLayer], movements,
+           costs: Optional[PurchaseCosts], list_price: Optional[Decimal], db: Session) -> List[dict]:
+    """
+    Apply new movements of one material to its valuation and FIFO layers
+
+    The replay runs on plain lists; the ORM only sees the final state, so
+    receipts consumed within the same replay are never written.
+
+    Args:
+        valuation: Persisted state (updated in place)
+        records: Persisted open layers, oldest first
+        movements: (material_id, txid, movement_id, created_at, quantity) rows in (txid, movement ID) order
+        costs: Purchase prices of the material
+        list_price: Material.unit_price, the last resort for costing receipts
+        db: Database session (layer updates and deletes go through it)
+
+    Returns:
+        New open layers, as rows to insert
+    """
+    quantity = valuation.quantity
+    average = valuation.wac_unit_cost
+    last_txid = valuation.last_txid
+    last_movement_id = valuation.last_movement_id
+    # [remaining quantity, unit cost, movement_id, received_at, persisted layer or None]
+    layers = deque([record.quantity, record.unit_cost, record.movement_id, record.received_at, record]
+                   for record in records)
+
+    for _, txid, movement_id, created_at, change in movements:
+        if change > 0:
+            unit_cost = costs.cost_at(created_at) if costs is not None else None
+            if unit_cost is None:
+                unit_cost = average if quantity > 0 else (list_price or ZERO)
+            layers.append([change, unit_cost, movement_id, created_at, None])
+            average = ((quantity * average + change * unit_cost) / (quantity + change)).quantize(UNIT_COST)
+            quantity += change
+        elif change < 0:
+            outflow = -change
+            while outflow > 0 and layers:
+                layer = layers[0]
+                taken = min(layer[0], outflow)
+                layer[0] -= taken
+                outflow -= taken
+                if layer[0] <= 0:
+                    layers.popleft()
+                    if layer[4] is not None:
+                        db.delete(layer[4])
+            quantity = max(quantity + change, ZERO)
+            if quantity == 0:
+                average = ZERO
+        last_txid, last_movement_id = txid, movement_id
+
+    fifo_value = ZERO
+    new_layers = []
+    for remaining, unit_cost, layer_movement_id, received_at, record in layers:
+        fifo_value += remaining * unit_cost
+        if record is None:
+            new_layers.append({
+                "material_id": valuation.material_id,
+                "movement_id": layer_movement_id,
+                "received_at": received_at,
+                "quantity": remaining,
+                "unit_cost": unit_cost,
+            })
+        elif record.quantity != remaining:
+            record.quantity = remaining
+
+    valuation.last_txid = last_txid
+    valuation.last_movement_id = last_movement_id
+    valuation.quantity = quantity
+    valuation.wac_unit_cost = average
+    valuation.wac_value = (quantity * average).quantize(CENT)
+    valuation.fifo_value = fifo_value.quantize(CENT)
+    return new_layers
+
+
+def value_chunk(db: Session, materials: List[Tuple[int, Optional[Decimal]]]) -> int:
+    """
+    Replay pending movements of some materials and commit
+
+    Args:
+        db: Database session
+        materials: (material_id, unit_price) pairs
+
+    Returns:
+        Number of movements replayed
+    """
+    material_ids = [material_id for material_id, _ in materials]
+    movements = pending_movements(db, material_ids)
+    if not movements:
+        return 0
+
+    moved_ids = {row[0] for row in movements}
+    valuations = {
+        valuation.material_id: valuation
+        for valuation in db.query(MaterialValuation).filter(MaterialValuation.material_id.in_(moved_ids))
+    }
+    layers: Dict[int, List[MaterialCostLayer]] = {}
+    for layer in db.query(MaterialCostLayer).filter(
+        MaterialCostLayer.material_id.in_(moved_ids)
+    ).order_by(MaterialCostLayer.material_id, MaterialCostLayer.id):
+        layers.setdefault(layer.material_id, []).append(layer)
+    costs = purchase_costs(db, list(moved_ids))
+    list_prices = dict(materials)
+
+    # First valuations and new layers are inserted in bulk; existing valuations are version-checked updates
+    new_valuations = []
+    new_layers = []
+    for material_id, rows in groupby(movements, key=lambda row: row[0]):
+        valuation = valuations.get(material_id)
+        if valuation is None:
+            valuation = MaterialValuation(
+                material_id=material_id, last_txid=0, last_movement_id=0, quantity=ZERO, wac_unit_cost=ZERO
+            )
+            new_valuations.append(valuation)
+        new_layers.extend(replay(valuation, layers.get(material_id, []), rows, costs.get(material_id),
+                                 list_prices.get(material_id), db))
+
+    if new_valuations:
+        db.execute(insert(MaterialValuation), [
+            {
+                "material_id": valuation.material_id,
+                "last_txid": valuation.last_txid,
+                "last_movement_id": valuation.last_movement_id,
+                "quantity": valuation.quantity,
+                "fifo_value": valuation.fifo_value,
+                "wac_unit_cost": valuation.wac_unit_cost,
+                "wac_value": valuation.wac_value,
+                "version": 1,
+            }
+            for valuation in new_valuations
+        ])
+    if new_layers:
+        db.execute(insert(MaterialCostLayer), new_layers)
+    db.commit()
+    return len(movements)
+
+
+def update_valuations(db: Session, company_id: int, chunk_size: int = VALUATION_CHUNK_SIZE) -> int:
+    """
+    Bring the valuation state of every material of a company up to date
+
+    Args:
+        db: Database session
+        company_id: Company ID
+        chunk_size: Materials per transaction
+
+    Returns:
+        Number of movements replayed
+    """
+    materials = db.query(Material.id, Material.unit_price).filter(
+        Material.company_id == company_id
+    ).order_by(Material.id).all()
+
+    replayed = 0
+    for start in range(0, len(materials), chunk_size):
+        chunk = [tuple(row) for row in materials[start:start + chunk_size]]
+        for attempt in range(VALUATION_CHUNK_ATTEMPTS):
+            try:
+                replayed += value_chunk(db, chunk)
+                break
+            except (IntegrityError, StaleDataError):
+                # Another request valued these materials at the same time; start again from its state
+                db.rollback()
+                if attempt == VALUATION_CHUNK_ATTEMPTS - 1:
+                    raise
+    return replayed
+
+
+def reset_valuations(db: Session, company_id: int) -> None:
+    """
+    Drop the persisted valuation state of a company so the next valuation replays all history
+
+    Args:
+        db: Database session
+        company_id: Company ID
+    """
+    material_ids = select(Material.id).where(Material.company_id == company_id)
+    db.execute(delete(MaterialCostLayer).where(
+        MaterialCostLayer.material_id.in_(material_ids)
+    ).execution_options(synchronize_session=False))
+    db.execute(delete(MaterialValuation).where(
+        MaterialValuation.material_id.in_(material_ids)
+    ).execution_options(synchronize_session=False))
+    db.commit()
+
+
+def update_all_valuations() -> int:
+    """
+    Catch up the valuation state of every company
+
+    Cached valuations of companies with replayed movements are invalidated.
+
+    Returns:
+        Number of movements replayed
+    """
+    db = SessionLocal()
+    try:
+        replayed = 0
+        for company_id, user_id in db.query(Company.id, Company.user_id).order_by(Company.id).all():
+            count = update_valuations(db, company_id)
+            if count:
+                response_cache.invalidate(company_id, user_id)
+                replayed += count
+        return replayed
+    finally:
+        db.close()
+
+
+async def run_updater() -> None:
+    """Background task catching up valuations every VALUATION_UPDATE_SECONDS"""
+    while True:
+        try:
+            replayed = await run_in_threadpool(update_all_valuations)
+            if replayed:
+                logger.info("Valued %s new movements", replayed)
+        except Exception:
+            logger.exception("Valuation update failed")
+        await asyncio.sleep(VALUATION_UPDATE_SECONDS)
+
+
+def company_valuation(db: Session, company_id: int) -> dict:
+    """
+    Report a company's inventory value with FIFO and weighted average cost from the persisted state
+
+    Read-only: movements not yet replayed by the catch-up are not included.
+
+    Args:
+        db: Database session
+        company_id: Company ID
+
+    Returns:
+        Totals and one entry per material
+    """
+    rows = db.query(
+        Material.id,
+        Material.sku,
+        Material.name,
+        func.coalesce(MaterialValuation.quantity, 0),
+        func.coalesce(MaterialValuation.fifo_value, 0),
+        func.coalesce(MaterialValuation.wac_unit_cost, 0),
+        func.coalesce(MaterialValuation.wac_value, 0),
+    ).outerjoin(
+        MaterialValuation, MaterialValuation.material_id == Material.id
+    ).filter(Material.company_id == company_id).order_by(Material.id).all()
+
+    materials = [
+        {
+            "material_id": material_id,
+            "sku": sku,
+            "name": name,
+            "quantity": Decimal(quantity),
+            "fifo_value": Decimal(fifo_value),
+            "wac_unit_cost": Decimal(wac_unit_cost),
+            "wac_value": Decimal(wac_value),
+        }
+        for material_id, sku, name, quantity, fifo_value, wac_unit_cost, wac_value in rows
+    ]
+    return {
+        "company_id": company_id,
+        "valued_at": datetime.utcnow(),
+        "fifo_value": sum((material["fifo_value"] for material in materials), ZERO),
+        "wac_value": sum((material["wac_value"] for material in materials), ZERO),
+        "materials": materials,
+    }
@@ -0,0 +1,225 @@
+"""
+Synthetic Data Generator
+Bulk-loads N users x M companies x K materials (with movements and purchases) for benchmarking
+
+Usage (from the backend directory):
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.generate_data --users 10 --companies 5 --materials 2000
+
+Every generated user can log in as bench-user-<n>@example.com with password "bench123".
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterator, List
+from sqlalchemy import func, select, text
+from app.database import engine, Base
+from app.migrations import upgrade
+from app.models import User, Company, Material, MaterialMovement, Purchase, PurchaseItem
+from app.auth import get_password_hash
+
+BENCH_PASSWORD = "bench123"
+UNITS = ["pcs", "kg", "m", "l", "box", "roll"]
+REASONS = ["sale", "adjustment", "damage", "return", "purchase"]
+SUPPLIERS = ["Tech Distributors LLC", "Component Wholesale Co.", "Global Parts Ltd.", "Prime Supply Inc."]
+WORDS = ["Arduino", "Sensor", "Cable", "Resistor", "Capacitor", "Relay", "Module", "Board", "Strip", "Adapter"]
+
+
+def bench_email(user_index: int) -> str:
+    """Email of the n-th generated user"""
+    return f"bench-user-{user_index}@example.com"
+
+
+class IdAllocator:
+    """Hands out primary keys above the current maximum so child rows can reference parents"""
+
+    def __init__(self, connection, model):
+        self.next_id = (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+    def take(self) -> int:
+        value = self.next_id
+        self.next_id += 1
+        return value
+
+
+class BulkWriter:
+    """Buffers rows per table and flushes them with executemany inserts"""
+
+    def __init__(self, connection, batch_size: int):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.buffers: Dict[str, List[dict]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, model, row: dict) -> None:
+        buffer = self.buffers.setdefault(model.__tablename__, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Insert all buffered rows, parents before children to satisfy foreign keys"""
+        for table in Base.metadata.sorted_tables:
+            rows = self.buffers.get(table.name)
+            if rows:
+                self.connection.execute(table.insert(), rows)
+                self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+                self.buffers[table.name] = []
+
+
+def random_timestamps(rng: random.Random, count: int, days: int) -> Iterator[datetime]:
+    """Yield `count` ascending timestamps spread over the last `days` days"""
+    now = datetime.utcnow()
+    offsets = sorted(rng.uniform(0, days * 86400) for _ in range(count))
+    for offset in reversed(offsets):
+        yield now - timedelta(seconds=offset)
+
+
+def generate(args) -> Dict[str, int]:
+    """
+    Generate the synthetic dataset
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Number of rows inserted per table
+    """
+    rng = random.Random(args.seed)
+    totals: Dict[str, int] = {}
+    password_hash = get_password_hash(BENCH_PASSWORD)  # bcrypt is slow; hash once
+    upgrade(engine)
+
+    with engine.begin() as connection:
+        first_user = connection.execute(
+            select(func.count()).select_from(User).where(User.email.like("bench-user-%"))
+        ).scalar()
+        ids = {model: IdAllocator(connection, model) for model in (User, Company, Material, MaterialMovement, Purchase, PurchaseItem)}
+
+    for user_index in range(first_user, first_user + args.users):
+        # One transaction per user keeps the WAL and memory bounded
+        with engine.begin() as connection:
+            writer = BulkWriter(connection, args.batch_size)
+            now = datetime.utcnow()
+            user_id = ids[User].take()
+            writer.add(User, {
+                "id": user_id, "email": bench_email(user_index), "full_name": f"Bench User {user_index}",
+                "password_hash": password_hash, "is_active": True, "created_at": now, "updated_at": now,
+            })
+
+            for company_index in range(args.companies):
+                company_id = ids[Company].take()
+                writer.add(Company, {
+                    "id": company_id, "name": f"Bench Company {user_index}-{company_index}",
+                    "address": f"{company_index} Benchmark Street", "phone": "+1-555-0000",
+                    "email": f"company{company_id}@example.com", "tax_id": f"EIN-{company_id:08d}",
+                    "user_id": user_id, "created_at": now, "updated_at": now,
+                })
+
+                material_ids = []
+                for material_index in range(args.materials):
+                    material_id = ids[Material].take()
+                    material_ids.append(material_id)
+                    stock = Decimal(0)
+                    movements = []
+                    movement_times = random_timestamps(rng, args.movements, args.history_days)
+                    for movement_index, created_at in enumerate(movement_times):
+                        if movement_index == 0:
+                            quantity = Decimal(rng.randint(20, 500))
+                            reason = "initial_stock"
+                        else:
+                            quantity = Decimal(rng.randint(-15, 25))
+                            if stock + quantity < 0:
+                                quantity = -stock
+                            reason = "purchase" if quantity > 0 else rng.choice(REASONS[:4])
+                        stock += quantity
+                        movements.append({
+                            "id": ids[MaterialMovement].take(), "material_id": material_id,
+                            "quantity": quantity, "reason": reason, "notes": None,
+                            "user_id": user_id, "created_at": created_at,
+                        })
+
+                    name = f"{rng.choice(WORDS)} {rng.choice(WORDS)} {material_index}"
+                    writer.add(Material, {
+                        "id": material_id, "company_id": company_id, "name": name,
+                        "sku": f"SKU-{company_id}-{material_index:06d}",
+                        "barcode": f"{company_id:06d}{material_index:07d}",
+                        "description": f"{name} - synthetic benchmark material with a longer description text",
+                        "unit": rng.choice(UNITS), "current_stock": stock,
+                        "min_stock": Decimal(rng.randint(0, 60)),
+                        "unit_price": Decimal(rng.randint(50, 50000)) / 100,
+                        "created_at": now, "updated_at": now,
+                    })
+                    for movement in movements:
+                        writer.add(MaterialMovement, movement)
+
+                for purchase_index in range(args.purchases):
+                    purchase_id = ids[Purchase].take()
+                    purchase_date = now - timedelta(days=rng.uniform(0, args.history_days))
+                    items = []
+                    for _ in range(args.items):
+                        quantity = Decimal(rng.randint(1, 100))
+                        unit_price = Decimal(rng.randint(50, 50000)) / 100
+                        material_id = rng.choice(material_ids) if material_ids else None
+                        items.append({
+                            "id": ids[PurchaseItem].take(), "purchase_id": purchase_id,
+                            "material_id": material_id, "item_name": f"Item for material {material_id}",
+                            "quantity": quantity, "unit_price": unit_price,
+                            "total_price": quantity * unit_price, "created_at": purchase_date,
+                        })
+                    writer.add(Purchase, {
+                        "id": purchase_id, "company_id": company_id,
+                        "invoice_number": f"INV-{company_id}-{purchase_index:06d}",
+                        "supplier_name": rng.choice(SUPPLIERS), "supplier_contact": "orders@example.com",
+                        "purchase_date": purchase_date,
+                        "status": rng.choice(["pending", "completed", "completed", "cancelled"]),
+                        "total_amount": sum(item["total_price"] for item in items),
+                        "notes": "Synthetic benchmark purchase",
+                        "user_id": user_id, "created_at": purchase_date, "updated_at": purchase_date,
+                    })
+                    for item in items:
+                        writer.add(PurchaseItem, item)
+
+            writer.flush()
+            for table, count in writer.counts.items():
+                totals[table] = totals.get(table, 0) + count
+        print(f"  user {user_index + 1 - first_user}/{args.users} done", file=sys.stderr)
+
+    if engine.dialect.name == "postgresql":
+        # Explicit IDs bypass the sequences; move them past the generated rows
+        with engine.begin() as connection:
+            for model in ids:
+                table = model.__tablename__
+                connection.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+                ))
+
+    return totals
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark data")
+    parser.add_argument("--users", type=int, default=2, help="Users to create")
+    parser.add_argument("--companies", type=int, default=3, help="Companies per user")
+    parser.add_argument("--materials", type=int, default=1000, help="Materials per company")
+    parser.add_argument("--movements", type=int, default=5, help="Stock movements per material")
+    parser.add_argument("--purchases", type=int, default=200, help="Purchases per company")
+    parser.add_argument("--items", type=int, default=5, help="Items per purchase")
+    parser.add_argument("--history-days", type=int, default=365, help="Days of history to spread timestamps over")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per executemany batch")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    started = time.perf_counter()
+    result = generate(arguments)
+    elapsed = time.perf_counter() - started
+    rows = sum(result.values())
+    print(f"✅ Inserted {rows:,} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    for table_name, count in sorted(result.items()):
+        print(f"   • {table_name}: {count:,}")
+    print(f"🔐 Login as {bench_email(0)} / {BENCH_PASSWORD}")
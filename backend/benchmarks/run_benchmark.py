@@ -0,0 +1,352 @@
+"""
+API Benchmark
+Drives the FastAPI app through a realistic request mix and reports latency percentiles
+
+Usage (from the backend directory, after benchmarks.generate_data):
+    # In-process: the app is called through an ASGI transport, no server needed
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.run_benchmark --requests 2000
+
+    # Load mode: several processes hammer a running server
+    python -m benchmarks.run_benchmark --base-url http://localhost:8001 --processes 8 --requests 20000
+
+    # Compressed responses over a simulated 2 Mbit/s branch office link
+    python -m benchmarks.run_benchmark --accept-encoding br --link-kbps 2000
+
+    # Record or compare against a baseline
+    python -m benchmarks.run_benchmark --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmark --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+import httpx
+
+BENCH_EMAIL = "bench-user-0@example.com"
+BENCH_PASSWORD = "bench123"
+
+# Scenario name -> relative weight in the request mix
+DEFAULT_MIX = {
+    "list_materials": 40,
+    "search_materials": 25,
+    "list_purchases": 10,
+    "adjust_stock": 15,
+    "create_purchase": 10,
+}
+
+SEARCH_TERMS = ["Sensor", "Cable", "Relay", "SKU-1-0001", "Board 12", "Adapter"]
+
+
+class Context:
+    """Identifiers discovered once during setup and shared by all scenarios"""
+
+    def __init__(self, headers: Dict[str, str], company_ids: List[int], material_ids: Dict[int, List[int]]):
+        self.headers = headers
+        self.company_ids = company_ids
+        self.material_ids = material_ids
+
+
+async def setup(client: httpx.AsyncClient, email: str, password: str) -> Context:
+    """Log in and collect company and material IDs for the benchmark user"""
+    response = await client.post("/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = await client.get("/companies/", headers=headers)
+    response.raise_for_status()
+    company_ids = [company["id"] for company in response.json()]
+    if not company_ids:
+        raise SystemExit(f"❌ {email} has no companies; run benchmarks.generate_data first")
+
+    material_ids = {}
+    for company_id in company_ids:
+        response = await client.get("/materials/", params={"company_id": company_id}, headers=headers)
+        response.raise_for_status()
+        material_ids[company_id] = [material["id"] for material in response.json()]
+
+    return Context(headers, company_ids, material_ids)
+
+
+def build_request(scenario: str, ctx: Context, rng: random.Random) -> dict:
+    """Build the HTTP request for one scenario execution"""
+    company_id = rng.choice(ctx.company_ids)
+
+    if scenario == "list_materials":
+        return {"method": "GET", "url": "/materials/", "params": {"company_id": company_id}}
+    if scenario == "search_materials":
+        return {"method": "GET", "url": "/materials/", "params": {"search": rng.choice(SEARCH_TERMS)}}
+    if scenario == "list_purchases":
+        return {"method": "GET", "url": "/purchases/", "params": {"company_id": company_id}}
+    if scenario == "adjust_stock":
+        material_id = rng.choice(ctx.material_ids[company_id])
+        return {
+            "method": "POST",
+            "url": f"/materials/{material_id}/stock/adjust",
+            "json": {"quantity": str(rng.randint(1, 10)), "reason": "benchmark", "notes": None},
+        }
+    if scenario == "create_purchase":
+        return {
+            "method": "POST",
+            "url": "/purchases/",
+            "json": {
+                "company_id": company_id,
+                "invoice_number": f"BENCH-{rng.randint(0, 10**9)}",
+                "supplier_name": "Benchmark Supplier",
+                "purchase_date": "2024-06-01T00:00:00",
+                "status": "pending",
+                "total_amount": "0",
+            },
+        }
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def run_requests(client: httpx.AsyncClient, ctx: Context, count: int, concurrency: int, mix: Dict[str, int], seed: int,
+                       link_kbps: Optional[float] = None) -> Dict[str, list]:
+    """
+    Execute `count` requests with `concurrency` concurrent tasks
+
+    When link_kbps is set, the time to transfer the bytes on the wire over a link
+    of that speed is added to each latency (in-process runs have no network).
+
+    Returns:
+        Scenario name -> list of (latency seconds, query count, status code, response bytes, wire bytes)
+    """
+    rng = random.Random(seed)
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+    plan = rng.choices(scenarios, weights=weights, k=count)
+    results: Dict[str, list] = {name: [] for name in scenarios}
+    queue: asyncio.Queue = asyncio.Queue()
+    for scenario in plan:
+        queue.put_nowait(scenario)
+
+    async def worker():
+        while True:
+            try:
+                scenario = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            request = build_request(scenario, ctx, rng)
+            started = time.perf_counter()
+            response = await client.request(headers=ctx.headers, **request)
+            elapsed = time.perf_counter() - started
+            wire_bytes = response.num_bytes_downloaded
+            if link_kbps:
+                elapsed += wire_bytes * 8 / (link_kbps * 1000)
+            query_count = int(response.headers.get("x-query-count", -1))
+            results[scenario].append((elapsed, query_count, response.status_code, len(response.content), wire_bytes))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(results: Dict[str, list], wall_time: float) -> dict:
+    """Reduce raw samples to per-scenario statistics"""
+    summary = {}
+    total = 0
+    for scenario, samples in results.items():
+        if not samples:
+            continue
+        total += len(samples)
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        queries = [sample[1] for sample in samples if sample[1] >= 0]
+        summary[scenario] = {
+            "requests": len(samples),
+            "errors": sum(1 for sample in samples if sample[2] >= 400),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+            "mean_response_bytes": round(sum(sample[3] for sample in samples) / len(samples)),
+            "mean_wire_bytes": round(sum(sample[4] for sample in samples) / len(samples)),
+        }
+    summary["_total"] = {
+        "requests": total,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(total / wall_time, 1) if wall_time else None,
+    }
+    return summary
+
+
+async def run_in_process(args) -> dict:
+    """Benchmark the app in-process through httpx's ASGI transport"""
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Accept-Encoding": args.accept_encoding}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", headers=headers) as client:
+            ctx = await setup(client, args.email, args.password)
+            # Warm-up requests are not measured
+            await run_requests(client, ctx, args.warmup, args.concurrency, args.mix, args.seed + 1)
+            started = time.perf_counter()
+            results = await run_requests(
+                client, ctx, args.requests, args.concurrency, args.mix, args.seed, args.link_kbps
+            )
+            return summarize(results, time.perf_counter() - started)
+
+
+def _load_worker(payload: dict) -> Dict[str, list]:
+    """Entry point of one load-generating process"""
+
+    async def main():
+        limits = httpx.Limits(max_connections=payload["concurrency"])
+        headers = {"Accept-Encoding": payload["accept_encoding"]}
+        async with httpx.AsyncClient(base_url=payload["base_url"], limits=limits, timeout=60, headers=headers) as client:
+            ctx = await setup(client, payload["email"], payload["password"])
+            return await run_requests(client, ctx, payload["requests"], payload["concurrency"], payload["mix"], payload["seed"])
+
+    return asyncio.run(main())
+
+
+def run_load(args) -> dict:
+    """Benchmark a running server from several processes"""
+    per_process = max(1, args.requests // args.processes)
+    payloads = [
+        {
+            "base_url": args.base_url, "email": args.email, "password": args.password,
+            "requests": per_process, "concurrency": args.concurrency, "mix": args.mix,
+            "accept_encoding": args.accept_encoding,
+            "seed": args.seed + index,
+        }
+        for index in range(args.processes)
+    ]
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        partials = pool.map(_load_worker, payloads)
+    wall_time = time.perf_counter() - started
+
+    merged: Dict[str, list] = {}
+    for partial in partials:
+        for scenario, samples in partial.items():
+            merged.setdefault(scenario, []).extend(samples)
+    return summarize(merged, wall_time)
+
+
+def print_report(summary: dict) -> None:
+    header = (
+        f"{'scenario':<18}{'reqs':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'queries':>9}{'bytes':>11}{'wire':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for scenario, stats in summary.items():
+        if scenario.startswith("_"):
+            continue
+        queries = stats["queries_per_request"]
+        print(
+            f"{scenario:<18}{stats['requests']:>7}{stats['errors']:>5}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+            f"{(f'{queries:.1f}' if queries is not None else '-'):>9}{stats['mean_response_bytes']:>11}"
+            f"{stats.get('mean_wire_bytes', stats['mean_response_bytes']):>11}"
+        )
+    total = summary["_total"]
+    print(f"\n{total['requests']} requests in {total['wall_time_s']}s ({total['throughput_rps']} req/s)")
+
+
+def compare(summary: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Compare a run against a baseline
+
+    Args:
+        summary: Current results
+        baseline: Results loaded from a baseline file
+        threshold: Allowed p95 slowdown ratio (e.g. 1.25 = 25% slower)
+
+    Returns:
+        List of regression descriptions (empty if none)
+    """
+    regressions = []
+    for scenario, stats in summary.items():
+        base = baseline.get(scenario)
+        if scenario.startswith("_") or base is None:
+            continue
+        if base["p95_ms"] and stats["p95_ms"] > base["p95_ms"] * threshold:
+            regressions.append(f"{scenario}: p95 {base['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
+        if base.get("queries_per_request") is not None and stats["queries_per_request"] is not None \
+                and stats["queries_per_request"] > base["queries_per_request"]:
+            regressions.append(
+                f"{scenario}: queries/request {base['queries_per_request']} -> {stats['queries_per_request']}"
+            )
+    return regressions
+
+
+def parse_mix(value: Optional[str]) -> Dict[str, int]:
+    """Parse "list_materials=40,adjust_stock=10" into a weight mapping"""
+    if not value:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CoApp API")
+    parser.add_argument("--base-url", help="Benchmark a running server (load mode) instead of the in-process app")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(), help="Load mode processes")
+    parser.add_argument("--requests", type=int, default=1000, help="Measured requests (total)")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured warm-up requests (in-process mode)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests per process")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX), help="Scenario weights, e.g. list_materials=40,adjust_stock=10")
+    parser.add_argument("--email", default=BENCH_EMAIL)
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--accept-encoding", default="identity", help='Accept-Encoding sent with every request, e.g. "gzip" or "br"')
+    parser.add_argument("--link-kbps", type=float, help="Add the transfer time over a link of this speed (in-process mode)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--save-baseline", help="Write results as the new baseline file")
+    parser.add_argument("--compare", help="Baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Allowed p95 slowdown ratio before flagging a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    summary = run_load(args) if args.base_url else asyncio.run(run_in_process(args))
+    summary["_meta"] = {
+        "mode": "load" if args.base_url else "in-process",
+        "processes": args.processes if args.base_url else 1,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "accept_encoding": args.accept_encoding,
+        "link_kbps": args.link_kbps,
+    }
+    print_report(summary)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(summary, f, indent=2, sort_keys=True)
+            print(f"📝 Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(summary, json.load(f), args.threshold)
+        if regressions:
+            print("\n❌ Regressions against baseline:")
+            for regression in regressions:
+                print(f"   • {regression}")
+            return 1
+        print("\n✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
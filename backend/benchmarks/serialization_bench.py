@@ -0,0 +1,87 @@
+"""
+Serialization Micro-benchmark
+Compares list response encoding paths over 10k and 100k materials
+
+Usage (from the backend directory):
+    python -m benchmarks.serialization_bench --rows 10000 100000
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Callable, List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from app.schemas import MaterialResponse
+from app.serialization import dumps, rows_to_dicts, schema_fields
+
+
+def make_rows(count: int) -> List[tuple]:
+    """Column tuples as returned by a projected query, in MaterialResponse field order"""
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    return [
+        (
+            f"Material {i}", f"SKU-{i:07d}", f"{i:013d}", f"Description of material {i} " * 3, "pcs",
+            Decimal("10.00"), Decimal(i % 10000) / 100, i, 1 + i % 5, Decimal(i % 500),
+            now - timedelta(minutes=i), now,
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_path(entities) -> bytes:
+    """model_validate per row, then FastAPI-style response_model validation and jsonable_encoder"""
+    models = [MaterialResponse.model_validate(entity) for entity in entities]
+    # FastAPI dumps the returned models, re-validates them against response_model and encodes
+    content = [model.model_dump() for model in models]
+    validated = TypeAdapter(List[MaterialResponse]).validate_python(content)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+_ADAPTER = TypeAdapter(List[MaterialResponse])
+
+
+def type_adapter_path(entities) -> bytes:
+    """Validate once with a cached TypeAdapter and let pydantic-core write JSON"""
+    return _ADAPTER.dump_json(_ADAPTER.validate_python(entities, from_attributes=True))
+
+
+def projection_path(rows) -> bytes:
+    """Column tuples straight to orjson (the path used by list endpoints)"""
+    return dumps(rows_to_dicts(rows, schema_fields(MaterialResponse)))
+
+
+def measure(function: Callable, argument, repeat: int) -> float:
+    """Best wall time of `repeat` runs in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark list serialization paths")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    fields = schema_fields(MaterialResponse)
+    print(f"{'rows':>8}{'legacy ms':>12}{'adapter ms':>12}{'orjson ms':>12}{'speedup':>9}{'bytes':>12}")
+    for count in args.rows:
+        rows = make_rows(count)
+        entities = [SimpleNamespace(**dict(zip(fields, row))) for row in rows]
+        legacy = measure(legacy_path, entities, args.repeat)
+        adapter = measure(type_adapter_path, entities, args.repeat)
+        projected = measure(projection_path, rows, args.repeat)
+        print(
+            f"{count:>8}{legacy:>12.1f}{adapter:>12.1f}{projected:>12.1f}"
+            f"{legacy / projected:>8.1f}x{len(projection_path(rows)):>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
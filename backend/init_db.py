@@ -5,7 +5,8 @@ Creates database tables and populates with demo data
 import sys
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from app.database import engine, SessionLocal, Base
+from app.database import engine, SessionLocal
+from app.migrations import upgrade
 from app.models import User, Company, Material, MaterialMovement, Purchase, PurchaseItem
 from app.auth import get_password_hash
 
@@ -15,9 +16,9 @@ def init_db():
     """
     print("🚀 Initializing CoApp 2.0 Database...")
     
-    # Create all tables
-    print("📦 Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    # Create tables and indexes through the schema migrations
+    print("📦 Applying database migrations...")
+    upgrade(engine)
     print("✅ Tables created successfully")
     
     # Create database session
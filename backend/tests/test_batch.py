@@ -0,0 +1,89 @@
+"""
+Batch endpoint tests
+Run from backend/: python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+
+# Isolated database, configured before the app is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.setdefault("SECRET_KEY", "test-secret-key-with-enough-length")
+os.environ["CACHE_BACKEND"] = "memory"
+os.environ["DEBUG"] = "False"
+os.environ["AUTO_MIGRATE"] = "True"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+class TransactionalBatchCacheTest(unittest.TestCase):
+    """Reads inside a transactional batch must not use the shared response cache"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+        cls.client.__enter__()
+        token = cls.client.post("/auth/register", json={
+            "email": "batch@example.com", "full_name": "Batch", "password": "secret1",
+        }).json()["access_token"]
+        cls.headers = {"Authorization": f"Bearer {token}"}
+        cls.company_id = cls.client.post("/companies/", json={"name": "Batch Co"}, headers=cls.headers).json()["id"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def create_material(self, sku: str) -> int:
+        return self.client.post("/materials/", json={
+            "company_id": self.company_id, "name": sku, "sku": sku, "current_stock": 10,
+        }, headers=self.headers).json()["id"]
+
+    def list_stock(self, material_id: int) -> str:
+        materials = self.client.get("/materials/", params={"company_id": self.company_id}, headers=self.headers).json()
+        return next(material["current_stock"] for material in materials if material["id"] == material_id)
+
+    def run_batch(self, *operations) -> dict:
+        return self.client.post("/batch", json={"transaction": True, "requests": list(operations)},
+                                headers=self.headers).json()
+
+    def adjust(self, material_id: int, quantity: int) -> dict:
+        return {"method": "POST", "path": f"/materials/{material_id}/stock/adjust",
+                "body": {"quantity": quantity, "reason": "test"}}
+
+    def test_rolled_back_read_is_not_cached(self):
+        material_id = self.create_material("ROLLBACK")
+        result = self.run_batch(
+            self.adjust(material_id, 5),
+            {"method": "GET", "path": f"/materials/?company_id={self.company_id}"},
+            self.adjust(material_id, -1000),
+        )
+        self.assertFalse(result["committed"])
+        self.assertEqual(self.list_stock(material_id), "10.00")
+
+    def test_read_sees_own_writes_with_warm_cache(self):
+        material_id = self.create_material("COMMIT")
+        self.assertEqual(self.list_stock(material_id), "10.00")
+        self.assertEqual(self.list_stock(material_id), "10.00")  # Served from the cache
+
+        result = self.run_batch(
+            self.adjust(material_id, 5),
+            {"method": "GET", "path": f"/materials/?company_id={self.company_id}"},
+        )
+        self.assertTrue(result["committed"])
+        in_batch = next(material for material in result["responses"][1]["body"] if material["id"] == material_id)
+        self.assertEqual(in_batch["current_stock"], "15.00")
+        self.assertEqual(self.list_stock(material_id), "15.00")
+
+    def test_scans_are_rejected(self):
+        material_id = self.create_material("SCANNED")
+        response = self.client.post("/batch", json={"transaction": True, "requests": [
+            self.adjust(material_id, 5),
+            {"method": "POST", "path": "/scans/", "body": {"company_id": self.company_id, "scans": [{"barcode": "SCANNED"}]}},
+        ]}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.list_stock(material_id), "10.00")
+
+
+if __name__ == "__main__":
+    unittest.main()
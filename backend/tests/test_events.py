@@ -0,0 +1,78 @@
+"""
+Live events tests
+Run from backend/: python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+
+# Isolated database, configured before the app is imported
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-with-enough-length")
+os.environ["DEBUG"] = "False"
+os.environ["AUTO_MIGRATE"] = "True"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.events import ChangeLogTail  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+class ChangeLogTailTest(unittest.TestCase):
+    """Events are built from committed change log entries, whichever process wrote them"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+        cls.client.__enter__()
+        token = cls.client.post("/auth/register", json={
+            "email": "events@example.com", "full_name": "Events", "password": "secret1",
+        }).json()["access_token"]
+        cls.headers = {"Authorization": f"Bearer {token}"}
+        cls.company_id = cls.client.post("/companies/", json={"name": "Events Co"}, headers=cls.headers).json()["id"]
+        cls.material_id = cls.client.post("/materials/", json={
+            "company_id": cls.company_id, "name": "Bolt", "sku": "EVT-1", "current_stock": 10,
+        }, headers=cls.headers).json()["id"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def setUp(self):
+        self.tail = ChangeLogTail(buffer_size=3)
+        # The first poll only places the cursor
+        self.assertEqual(self.tail.poll({self.company_id}), ([], False))
+
+    def adjust(self, quantity: int) -> None:
+        self.client.post(f"/materials/{self.material_id}/stock/adjust",
+                         json={"quantity": quantity, "reason": "test"}, headers=self.headers)
+
+    def test_committed_changes(self):
+        self.adjust(-4)
+        events, more = self.tail.poll({self.company_id})
+        self.assertFalse(more)
+        changes = {data["entity"]: data for _, event_type, data in events if event_type == "change"}
+        self.assertEqual(len(events), 2)
+        self.assertEqual(changes["materials"]["current_stock"], 6)
+        self.assertEqual(changes["movements"]["quantity"], -4)
+        self.assertEqual(self.tail.poll({self.company_id}), ([], False))
+
+    def test_rolled_back_batch_sends_nothing(self):
+        self.client.post("/batch", json={"transaction": True, "requests": [
+            {"method": "POST", "path": f"/materials/{self.material_id}/stock/adjust",
+             "body": {"quantity": 1, "reason": "test"}},
+            {"method": "GET", "path": "/materials/999999"},
+        ]}, headers=self.headers)
+        self.assertEqual(self.tail.poll({self.company_id}), ([], False))
+
+    def test_unwatched_companies_and_resync(self):
+        self.adjust(1)
+        self.assertEqual(self.tail.poll(set()), ([], False))
+        for _ in range(2):
+            self.adjust(1)
+        events, _ = self.tail.poll({self.company_id})
+        self.assertEqual([(company_id, event_type) for company_id, event_type, _ in events],
+                         [(self.company_id, "resync")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Scan group commit tests
+Run from backend/: python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+
+# Isolated database, configured before the app is imported
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-with-enough-length")
+os.environ["DEBUG"] = "False"
+
+from app.database import SessionLocal, engine  # noqa: E402
+from app.migrations import upgrade  # noqa: E402
+from app.models import Company, Material, MaterialMovement, User  # noqa: E402
+from app.scans import ScanBatch, commit_scans  # noqa: E402
+
+
+class ScanCommitTest(unittest.TestCase):
+    """Batches of one group commit are checked against the stock in arrival order"""
+
+    @classmethod
+    def setUpClass(cls):
+        upgrade(engine)
+        db = SessionLocal()
+        user = User(email="scans@example.com", full_name="Scans", password_hash="x")
+        db.add(user)
+        db.flush()
+        company = Company(name="Scan Co", user_id=user.id)
+        db.add(company)
+        db.flush()
+        material = Material(company_id=company.id, name="Box", sku="BOX", current_stock=Decimal("10"))
+        db.add(material)
+        db.commit()
+        cls.user_id, cls.company_id, cls.material_id = user.id, company.id, material.id
+        db.close()
+
+    def batch(self, quantity: int) -> ScanBatch:
+        batch = ScanBatch(self.company_id, self.user_id, "scan")
+        batch.add(self.material_id, Decimal(quantity))
+        return batch
+
+    def test_oversized_pick_only_rejects_its_batch(self):
+        first, oversized, last = self.batch(-3), self.batch(-20), self.batch(-4)
+        results = commit_scans([first, oversized, last])
+
+        self.assertEqual([result["accepted"] for result in results], [1, 0, 1])
+        self.assertEqual(results[1]["rejected"][0]["material_id"], self.material_id)
+        self.assertEqual(results[2]["materials"], [{"material_id": self.material_id, "current_stock": Decimal("3")}])
+
+        db = SessionLocal()
+        self.assertEqual(db.get(Material, self.material_id).current_stock, Decimal("3"))
+        movements = db.query(MaterialMovement.quantity, MaterialMovement.notes).filter(
+            MaterialMovement.material_id == self.material_id
+        ).all()
+        self.assertEqual(movements, [(Decimal("-7"), "2 scans")])
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
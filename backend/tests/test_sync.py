@@ -0,0 +1,64 @@
+"""
+Delta sync tests
+Run from backend/: python -m unittest discover tests
+"""
+import os
+import tempfile
+import unittest
+
+# Isolated database, configured before the app is imported
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-with-enough-length")
+os.environ["DEBUG"] = "False"
+os.environ["AUTO_MIGRATE"] = "True"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+class FullSyncPagingTest(unittest.TestCase):
+    """A full sync is served in pages of `limit` rows and then continues as a delta sync"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+        cls.client.__enter__()
+        token = cls.client.post("/auth/register", json={
+            "email": "sync@example.com", "full_name": "Sync", "password": "secret1",
+        }).json()["access_token"]
+        cls.headers = {"Authorization": f"Bearer {token}"}
+        cls.company_id = cls.client.post("/companies/", json={"name": "Sync Co"}, headers=cls.headers).json()["id"]
+        cls.material_ids = [
+            cls.client.post("/materials/", json={
+                "company_id": cls.company_id, "name": f"Item {i}", "sku": f"SYNC-{i}", "current_stock": 1,
+            }, headers=cls.headers).json()["id"]
+            for i in range(5)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+
+    def sync(self, **params) -> dict:
+        return self.client.get("/sync/", params=params, headers=self.headers).json()
+
+    def test_full_sync_pages(self):
+        page = self.sync(limit=2)
+        materials, token = [], None
+        while True:
+            self.assertLessEqual(sum(len(page[entity]) for entity in ("companies", "materials", "movements")), 2)
+            materials += [material["id"] for material in page["materials"]]
+            token = page["token"]
+            if not page["has_more"]:
+                break
+            page = self.sync(since=token, limit=2)
+        self.assertEqual(materials, self.material_ids)
+
+        self.client.post(f"/materials/{self.material_ids[0]}/stock/adjust",
+                         json={"quantity": 1, "reason": "test"}, headers=self.headers)
+        delta = self.sync(since=token)
+        self.assertEqual([material["id"] for material in delta["materials"]], [self.material_ids[0]])
+
+
+if __name__ == "__main__":
+    unittest.main()